@@ -28,9 +28,9 @@ The modelpackage is extracted, configured, composed, and ran with testengine.
 Run runmodelpackage.py -h for help.
 """
 
-import sys, os, optparse, zipfile, urllib, re, shutil
+import sys, os, optparse, zipfile, urllib, re, shutil, socket
 
-from tema.packagereader.packagereader import Reader
+from tema.packagereader.packagereader import getReader
 import tema.data.datareader as datareader
 import tema.modelutils.generatetestconf as generatetestconf
 import tema.modelutils.composemodel as composemodel
@@ -265,7 +265,7 @@ def getActionppArgs(modelDir,targetDir,options):
     if options.actionpp_args:
         return options.actionpp_args
     mddFile = getMddFileWithPath(modelDir)
-    reader = Reader(mddFile)
+    reader = getReader(mddFile)
     targets = getTargetDevices(modelDir,options)
     actionpp_args = ""
     tdFiles = getTdFilesWithPath(targetDir,options)
@@ -302,7 +302,7 @@ def getRulesFileWithPath(targetDir):
 
 def getLstsFilesOfDevice(device,product,modelDir,options):
     mddFile = getMddFileWithPath(modelDir)
-    reader = Reader(mddFile)
+    reader = getReader(mddFile)
     concunits = reader.getValue('concurrentunits',[product]).split('\n')
     if device in options.applications:
         for selectedCu in options.applications[device]:
@@ -322,7 +322,7 @@ def getLstsFilesOfDevice(device,product,modelDir,options):
 
 def getAllTargetDevices(mddFile):
     """Returns a list of (devicename,productname) tuples."""
-    reader = Reader(mddFile)
+    reader = getReader(mddFile)
     products = reader.getValue('products').split('\n')
     targets = []
     for p in products:
@@ -580,6 +580,17 @@ def createNewTarget(modelDir,options):
     return targetDir
 
 def runTarget(targetDir,testengineArgs):
+    socketPath = os.environ.get("TEMA_ENGINE_SOCKET")
+    if socketPath and os.path.exists(socketPath):
+        # a running engine daemon has the modules and models loaded
+        from tema.testengine.enginedaemon import runEngine, \
+            daemon_unavailable
+        try:
+            return runEngine(socketPath,testengineArgs)
+        except socket.error, e:
+            if not daemon_unavailable(e):
+                raise
+            print "The engine daemon at %s is not running, running testengine locally." % (socketPath,)
     argv_org = sys.argv[:]
     sys.argv[1:] = testengineArgs
     try:
@@ -53,6 +53,14 @@ Use:
 
     adapter.errorFound()
 
+4.6 If adapter has a method getTargetAdapter, it is called with a
+    target name to get an adapter object that sends keywords only to
+    that target, or None if there is no such target. The returned
+    objects may be used concurrently with each other, but they are
+    not stopped separately.
+
+    target_adapter=adapter.getTargetAdapter(target_name)
+
 5. Stop.
 
    adapter.stop()
@@ -220,6 +220,19 @@ class Adapter(AdapterBase):
                 pass
             raise e
 
+    def getTargetAdapter(self, target_name):
+        """Returns an adapter that talks only with the client that
+        accepts the targetting keyword with target_name, or None."""
+        action = "kw_%s %s" % (self._params["targettingkeyword"], target_name)
+        if not self.sendInput(action):
+            return None
+        target_adapter = copy.copy(self)
+        target_adapter._connections = { self._connection_from_host :
+                                         self._connection }
+        self.log("Target %s is client %s"
+                 % (target_name, str(self._connection_from_host)))
+        return target_adapter
+
     def stop(self):
         exception = None
         clients = []
@@ -46,6 +46,15 @@ import shutil
 import codecs
 import optparse
 import sys, traceback
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
+
+try:
+    import multiprocessing
+except ImportError: # Python 2.5
+    multiprocessing = None
 
 import tema.lsts.lsts as lsts
 
@@ -54,6 +63,94 @@ import tema.ats4appmodel.lstsmodel as lstsmodel
 
 from tema.ats4appmodel.kendomodel import *
 
+
+#Change this when the generated files change, so that files generated
+#by an older version are not considered up to date
+GENERATOR_VERSION = 1
+
+
+class GeneratedFiles:
+    
+    """
+    Keeps track of the hashes of the inputs of generated files. The
+    hashes are stored in a file in the output directory, so that files
+    whose inputs have not changed need not be generated again.
+    
+    """
+    
+    FILENAME = ".ats4appmodel2lsts-hashes"
+    
+    def __init__(self, directory):
+        self.__directory = directory
+        self.__hashes = {}
+        try:
+            for line in open(directory + self.FILENAME):
+                key, filename = line.rstrip("\n").split(" ", 1)
+                self.__hashes[filename] = key
+        except (IOError, ValueError):
+            self.__hashes = {}
+    
+    def upToDate(self, filenames, key):
+        """
+        Returns True if all the files exist and have been generated from
+        inputs with the hash key
+        """
+        if key == None:
+            return False
+        for filename in filenames:
+            if self.__hashes.get(filename) != key or \
+                    not os.path.exists(self.__directory + filename):
+                return False
+        return True
+    
+    def record(self, filenames, key):
+        for filename in filenames:
+            self.__hashes[filename] = key
+    
+    def save(self):
+        file = open(self.__directory + self.FILENAME, "w")
+        for filename, key in sorted(self.__hashes.items()):
+            file.write(key + " " + filename + "\n")
+        file.close()
+
+
+#The function and the items of the tasks of the worker processes. They
+#are set before the processes are forked, so the items are not pickled.
+_tasks = None
+
+def _runTask(index):
+    function, items = _tasks
+    return function(items[index])
+
+def runTasks(function, items, workers = None):
+    """
+    Generates function(item) for the items in order. The calls are made
+    in worker processes, by default as many as there are CPUs. The
+    processes are forked, so the items and the function can be
+    anything, but the results must be picklable.
+    """
+    global _tasks
+    
+    if multiprocessing == None:
+        workers = 1
+    elif workers == None:
+        workers = multiprocessing.cpu_count()
+    
+    if workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield function(item)
+        return
+    
+    _tasks = (function, items)
+    pool = multiprocessing.Pool(min(workers, len(items)))
+    try:
+        for result in pool.imap(_runTask, range(len(items))):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+        _tasks = None
+
     
 class Kendo2Lsts:
     
@@ -65,18 +162,25 @@ class Kendo2Lsts:
     Uses lstsmodel module to convert kendo object hierachy to lsts model and 
     to write the model to files.
 
+    The hashes of the inputs of the generated files are stored in the
+    output directory, and files whose inputs have not changed are not
+    generated again. Application models are converted in parallel.
+
     """
 
     def __init__(self):
         
         self.__kendoXMLParser = None
         self.__sysModelFile = None
+        self.__workers = None
+        self.__fileHashes = {}
     
     
-    def readKendoModel(self, sysModelPath):
+    def readKendoModel(self, sysModelPath, workers = None):
         
         self.__sysModelFile = sysModelPath
-        self.__kendoXMLParser = KendoXMLParser(sysModelPath)
+        self.__workers = workers
+        self.__kendoXMLParser = KendoXMLParser(sysModelPath, workers)
         return self.__kendoXMLParser.parseKendoModel()
 
         
@@ -94,8 +198,12 @@ class Kendo2Lsts:
         
         lstsmodelname = output.split(os.sep)[-2]
         
-        os.mkdir(output)
-        os.mkdir(output + "rm" + os.sep)            
+        #The output directory may contain the files of an earlier conversion
+        if not os.path.isdir(output + "rm" + os.sep):
+            os.makedirs(output + "rm" + os.sep)
+        
+        generated = GeneratedFiles(output)
+        options = (create_taskswitcher, apps_only_ts, generateSleep, defaultSleep)
         
         model_names = []
         
@@ -103,39 +211,53 @@ class Kendo2Lsts:
         system_model = products[0]
         
         if create_taskswitcher:
-            print "Creating TaskSwitcher...",
-            converter = lstsmodel.LstsModelCreator(products[0],products)
-            model = converter.convertToTaskSwitcher(apps_only_ts, lstsmodelname +"-GateModel")
-            
             model_names.append("TaskSwitcher-" + lstsmodelname)
-            self.__writeLsts(model,"TaskSwitcher-" + lstsmodelname, output)
-            
-            gate_model = converter.createGateModel(products[0])
             model_names.append(lstsmodelname +"-GateModel")
-            print "done"
-            print "Writing TaskSwitcher...",
-            self.__writeLsts(gate_model, lstsmodelname +"-GateModel", output) 
-            print "done"
+            files = self.__lstsFiles(model_names[0]) + self.__lstsFiles(model_names[1])
+            key = self.__inputHash(self.__allSources(), options, lstsmodelname)
+            
+            if generated.upToDate(files, key):
+                print "TaskSwitcher is up to date"
+            else:
+                print "Creating TaskSwitcher...",
+                converter = lstsmodel.LstsModelCreator(products[0],products)
+                model = converter.convertToTaskSwitcher(apps_only_ts, lstsmodelname +"-GateModel")
+                
+                self.__writeLsts(model,"TaskSwitcher-" + lstsmodelname, output)
+                
+                gate_model = converter.createGateModel(products[0])
+                print "done"
+                print "Writing TaskSwitcher...",
+                self.__writeLsts(gate_model, lstsmodelname +"-GateModel", output) 
+                print "done"
+                generated.record(files, key)
             #model_names.append(product.getName().replace(" ", "%20"))
             system_model = products.pop(0)
             
+        tasks = []
         for product in products:
             #TODO: if name not given use e.g. "product+id"
-            #self.__writeLsts(product, output)
-            print "Converting "+product.getName()+"...",
-            converter = lstsmodel.LstsModelCreator(product, products)
-            model = converter.convertProduct(create_taskswitcher, generateSleep, defaultSleep)
-            print "done"
-            
             modelName = lstsmodel.getModelName(product)
-            print "Writing "+modelName+"...",
-            self.__writeLsts(model, modelName, output)
             model_names.append(modelName)
+            files = self.__lstsFiles(modelName)
+            key = self.__inputHash(self.__productSources(product), options, modelName)
+            
+            if generated.upToDate(files, key):
+                print modelName + " is up to date"
+            else:
+                tasks.append((product, products, modelName, options, output, files, key))
+        
+        #The products are converted and written in worker processes
+        results = runTasks(self.__writeProduct, tasks, self.__workers)
+        for product, products, modelName, options, output, files, key in tasks:
+            print "Converting "+product.getName()+" and writing "+modelName+"...",
+            results.next()
             print "done"
+            generated.record(files, key)
         
         #Create variable models for flags
         print "Writing flag models...",
-        self.__createFlagModels(output)
+        self.__createFlagModels(output, generated)
         
 
         for flag in self.__kendoXMLParser.getFlags():
@@ -167,12 +289,94 @@ class Kendo2Lsts:
         print "Generating Makefile...",
         self.__generateMakefile(output, model_names, lstsmodelname, create_taskswitcher)  
         print "done"  
-        print "Creating testdata...",
-        self.__createDataTables(output)
-        print "done" 
-        print "Creating coverage requirements based on the use cases...",
-        self.__createCoverageRequirements(output, lstsmodelname)
-        print "done"  
+        
+        testData = [(d.getLogicalName(), [i.getName() for i in d.getItems()])
+                    for d in self.__kendoXMLParser.getTestData()]
+        key = self.__inputHash(testData)
+        if generated.upToDate(["testdata.td"], key):
+            print "Testdata is up to date"
+        else:
+            print "Creating testdata...",
+            self.__createDataTables(output)
+            print "done" 
+            generated.record(["testdata.td"], key)
+        
+        files = ["usecase_coverage_requirements.txt", "run_test.sh"]
+        key = self.__inputHash(self.__allSources(), lstsmodelname)
+        if generated.upToDate(files, key):
+            print "Coverage requirements are up to date"
+        else:
+            print "Creating coverage requirements based on the use cases...",
+            self.__createCoverageRequirements(output, lstsmodelname)
+            print "done"  
+            generated.record(files, key)
+        
+        generated.save()
+    
+
+    def __writeProduct(self, task):
+        
+        product, products, modelName, options, output, files, key = task
+        create_taskswitcher, apps_only_ts, generateSleep, defaultSleep = options
+        
+        converter = lstsmodel.LstsModelCreator(product, products)
+        model = converter.convertProduct(create_taskswitcher, generateSleep, defaultSleep)
+        self.__writeLsts(model, modelName, output)
+    
+    
+    def __lstsFiles(self, model_name):
+        #files written by __writeLsts, relative to the output directory
+        return [model_name + ".lsts", "rm" + os.sep + model_name + "-rm.lsts"]
+    
+    
+    def __fileHash(self, path):
+        
+        if path == None:
+            return None
+        if not path in self.__fileHashes:
+            file = open(path, "rb")
+            self.__fileHashes[path] = md5(file.read()).hexdigest()
+            file.close()
+        return self.__fileHashes[path]
+    
+    
+    def __productSources(self, product):
+        """
+        Returns hashes of the files that the lsts model of the product
+        depends on: the system model, the files of the product and its
+        parent products and the files of the linked products.
+        """
+        
+        paths = set([self.__sysModelFile, product.getModelFileName()])
+        parent = product.getParentProduct()
+        while parent:
+            paths.add(parent.getModelFileName())
+            parent = parent.getParentProduct()
+        for state in product.getStates():
+            if state.getLinkedProduct():
+                paths.add(state.getLinkedProduct().getModelFileName())
+        
+        return sorted([self.__fileHash(path) for path in paths])
+    
+    
+    def __allSources(self):
+        
+        paths = set([self.__sysModelFile])
+        for product in self.__kendoXMLParser.getProducts():
+            paths.add(product.getModelFileName())
+        return sorted([self.__fileHash(path) for path in paths])
+    
+    
+    def __inputHash(self, *inputs):
+        """
+        Returns the hash of the inputs, None if some source file is
+        unknown
+        """
+        
+        for i in inputs:
+            if type(i) == list and None in i:
+                return None
+        return md5(repr((GENERATOR_VERSION,) + inputs)).hexdigest()
     
 
     def __writeLsts(self,lsts_model, model_name, outputDir):
@@ -183,22 +387,30 @@ class Kendo2Lsts:
         actions = lsts_model.getActions()
         state_props = {}
         refinements = []
+        
+        #lsts state and action numbers
+        state_index = {}
+        for i, state in enumerate(states):
+            state_index.setdefault(state, i)
+        action_index = {}
+        for i, action in enumerate(actions):
+            action_index.setdefault(action, i + 1)
 
         for state in lsts_model.getStates():
             state_transitions = []
             for transition in state.getTransitions():
                 #print states[0] == transition.getFromState()
-                state_transitions.append((states.index(transition.getToState()), actions.index(transition.getAction())+1))
+                state_transitions.append((state_index[transition.getToState()], action_index[transition.getAction()]))
         
             transitions.append(state_transitions)
             
             for state_prop in state.getState_propositions():
                 if state_prop.getName() in state_props:
-                    state_props[state_prop.getName()].append(states.index(state))
+                    state_props[state_prop.getName()].append(state_index[state])
 
                 else:
                     state_props[state_prop.getName()] = []
-                    state_props[state_prop.getName()].append(states.index(state))
+                    state_props[state_prop.getName()].append(state_index[state])
                     if state_prop.getKeywords() != None and len(state_prop.getKeywords()) > 0:
                         if state_prop.getName() != "svStart":
                             refinements.append((state_prop.getName(), state_prop.getKeywords()))    
@@ -221,7 +433,7 @@ class Kendo2Lsts:
         w.set_transitions(transitions)
         
         w.set_stateprops(state_props)     
-        w.get_header().initial_states = states.index(lsts_model.getStart_state())
+        w.get_header().initial_states = state_index[lsts_model.getStart_state()]
           
         w.write()
         
@@ -293,6 +505,7 @@ class Kendo2Lsts:
         
         transitions = []
         actions = []
+        action_index = {}
         
         #add central state
         transitions.append([])
@@ -305,6 +518,7 @@ class Kendo2Lsts:
             #start aw/sv
             transitions.append([])
             actions.append("start_" + refName)
+            action_index.setdefault(actions[-1], len(actions))
             transitions[0].append((len(transitions) - 1, len(actions)))
             
             prev_state_index = len(transitions) - 1
@@ -319,11 +533,12 @@ class Kendo2Lsts:
                     for match in matches:
                         #kw = lstsmodel.escape(kw.replace(match,"(OUT = " + match + ".name" + ")"))
                         kw = kw.replace(match,"(OUT = " + self.__removeIllegalChars(match).lower() + ")")
-                if kw in actions:
-                    kw_index = actions.index(kw) + 1
+                if kw in action_index:
+                    kw_index = action_index[kw]
                 else:
                     actions.append(kw)
                     kw_index = len(actions) 
+                    action_index.setdefault(kw, kw_index)
                    
                 transitions.append([])
                 transitions[prev_state_index].append((len(transitions) - 1, kw_index))
@@ -332,6 +547,7 @@ class Kendo2Lsts:
             
             #end aw/sv
             actions.append("end_" + refName)
+            action_index.setdefault(actions[-1], len(actions))
             transitions[prev_state_index].append((0, len(actions)))
             
         
@@ -342,10 +558,15 @@ class Kendo2Lsts:
         w.write()
       
      
-    def __createFlagModels(self, directory):
+    def __createFlagModels(self, directory, generated):
         
            
         for flag in self.__kendoXMLParser.getFlags():    
+            files = self.__lstsFiles("flagmodel_" + flag.getName())
+            key = self.__inputHash(flag.getName(), flag.getDefault_value())
+            if generated.upToDate(files, key):
+                continue
+            
             actions = []
             transitions = []
             
@@ -403,6 +624,8 @@ class Kendo2Lsts:
             #write refinement machines
             self.__writeRefinementMachine({}, ref_machine_file)
             
+            generated.record(files, key)
+            
 
     def __createCoverageRequirements(self, directory, project_name):
     
@@ -416,6 +639,11 @@ class Kendo2Lsts:
 
         if not ucModel:
             return
+        
+        productsByName = {}
+        for p in self.__kendoXMLParser.getProducts():
+            productsByName.setdefault(p.getName(), p)
+        transitionNames = {}
             
         for uc in ucModel.getUseCases():
           
@@ -434,19 +662,14 @@ class Kendo2Lsts:
                     modelName = t[0]
                     transitionId = t[1]
                     
-                    product = None
-                    transitionName = None
-                    
-                    for p in self.__kendoXMLParser.getProducts():
-                        if p.getName() == modelName:
-                            product = p
-                            break
+                    product = productsByName.get(modelName)
                     
                     if product:
-                        for tt in product.getTransitions():
-                            if tt.getId() == transitionId:
-                                transitionName = tt.getEvent_id()
-                                break
+                        if not product in transitionNames:
+                            transitionNames[product] = {}
+                            for tt in product.getTransitions():
+                                transitionNames[product].setdefault(tt.getId(), tt.getEvent_id())
+                        transitionName = transitionNames[product].get(transitionId)
                         
                         if transitionName:
                         
@@ -730,6 +953,10 @@ if __name__ == "__main__":
                       help="Generate sleepts/wakets transitions for tagged states")
     parser.add_option("--sleepByDefault", dest="defaultSleep", default = False, action="store_true", 
                       help="Handle states with no CanSleep/CanNotSleep tag as CanSleeps")
+    parser.add_option("-j", "--jobs", dest="jobs", type="int", default=None,
+                      help="Number of processes reading the model files and converting the application models. Default: number of CPUs.")
+    parser.add_option("-u", "--update", dest="update", default=False, action="store_true",
+                      help="Update an existing output directory. Only the files whose inputs have changed are generated.")
     #parser.add_option("-s", dest="sys_model",
     #                  help="ATS4 AppModel system model xml-file that is converted")
     #parser.add_option(")
@@ -743,7 +970,7 @@ if __name__ == "__main__":
         exit(1)
     else:
         if(options.outdir):
-            if os.path.exists(options.outdir):
+            if os.path.exists(options.outdir) and not options.update:
                 print "Directory \""+ options.outdir +"\" exists. Overwrite? (y/n): ",
                 while True:
                     answer = raw_input("").strip().lower()
@@ -773,7 +1000,7 @@ if __name__ == "__main__":
     converter = Kendo2Lsts()
     #converter.parseKendoModel("voicerecorder_port.xml")
     print "Reading ATS4 AppModel model...",
-    if not converter.readKendoModel(sysmodefile):
+    if not converter.readKendoModel(sysmodefile, options.jobs):
         exit(1)
     print "done"
     #converter.printKendoModel()
@@ -32,11 +32,23 @@ Provides classes for different parts of kendo models
 Provides a parser class (KendoXMLParser) to read kendo xml-file and to
 produce an object hierarchy from it.
 
+The xml-files are streamed with iterparse, so that the whole document
+is never in memory. Application models and test data files are read in
+parallel worker processes.
+
 """
 
-from xml.dom import minidom
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
 import os
 import re
+
+try:
+    import multiprocessing
+except ImportError: # Python 2.5
+    multiprocessing = None
         
 class KendoProduct:
     
@@ -54,6 +66,7 @@ class KendoProduct:
         self.__name = ""
         self.__description = ""
         self.__subModels = []
+        self.__modelFileName = None
        
     
     def printData(self):
@@ -542,6 +555,140 @@ class UseCasePath:
         self.__description = value
         
 
+# Kendo xml-files are read into records. A record is a dict that
+# contains the attributes of an element ("attrib"), the texts of the
+# first descendants with some tags ("text") and the records of some
+# descendant elements in lists keyed by their tag. Records contain only
+# dicts, lists and strings, so worker processes can return them.
+
+# record tag -> tags of the descendants whose text is read
+_RECORD_TEXTS = {
+    "product": ("description",),
+    "state": ("type", "name", "event_id", "description", "linkedModelId"),
+    "transition": (),
+    "UseCaseModel": (),
+    "UseCase": (),
+    "UseCasePath": (),
+    "TestData": ("logicalName", "description"),
+    "TestDataItem": ("name", "path", "result", "priority"),
+    }
+
+# tag -> tags of the ancestor records that list the records of the tag
+_RECORD_LISTS = {
+    "state": ("product",),
+    "transition": ("product", "UseCasePath"),
+    "keywords": ("transition",),
+    "keyword": ("state", "transition"),
+    "activity": ("transition",),
+    "condition": ("transition",),
+    "UseCase": ("UseCaseModel",),
+    "UseCasePath": ("UseCase",),
+    "TestDataItem": ("TestData",),
+    }
+
+# tags whose records are listed for the whole document
+_DOCUMENT_TAGS = ("product", "flag", "UseCaseModel", "TestData")
+
+_RECORD_TAGS = set(_RECORD_TEXTS) | set(_RECORD_LISTS) | set(_DOCUMENT_TAGS)
+
+_TEXT_TAGS = set()
+for _texts in _RECORD_TEXTS.itervalues():
+    _TEXT_TAGS.update(_texts)
+del _texts
+
+
+def _elementText(elem):
+    # None if there is no text, like a missing lastChild in minidom
+    if len(elem) or elem.text is None:
+        return None
+    return unicode(elem.text)
+
+def _requiredText(record, tag):
+    text = record["text"][tag]
+    if text is None:
+        raise ValueError("Element %s has no text" % tag)
+    return text
+
+
+def readKendoXML(xmlPath):
+    """
+    Reads a kendo xml-file to records. Returns a dict that maps the tags
+    product, flag, UseCaseModel and TestData to the records of all the
+    elements with the tag, in document order.
+
+    Elements are cleared as soon as they have been read.
+    """
+    
+    document = dict([(tag, []) for tag in _DOCUMENT_TAGS])
+    open_records = [] # (element, tag, record) of the enclosing records
+    
+    for event, elem in ElementTree.iterparse(xmlPath, ("start", "end")):
+        tag = elem.tag
+        if tag[:1] == "{":
+            tag = tag.split("}", 1)[1]
+        
+        if event == "start":
+            if not tag in _RECORD_TAGS:
+                continue
+            record = {"attrib": dict([(k, unicode(v)) for k, v in elem.attrib.iteritems()]),
+                      "text": {}}
+            if tag in document:
+                document[tag].append(record)
+            ancestor_tags = _RECORD_LISTS.get(tag, ())
+            for open_elem, open_tag, open_record in open_records:
+                if open_tag in ancestor_tags:
+                    open_record.setdefault(tag, []).append(record)
+            if tag in _RECORD_TEXTS:
+                open_records.append((elem, tag, record))
+        
+        else:
+            if tag in _TEXT_TAGS:
+                text = _elementText(elem)
+                for open_elem, open_tag, open_record in open_records:
+                    texts = open_record["text"]
+                    if tag in _RECORD_TEXTS[open_tag] and not tag in texts:
+                        texts[tag] = text
+            if open_records and open_records[-1][0] is elem:
+                open_records.pop()
+            elem.clear()
+    
+    return document
+
+
+def _readKendoXMLOrNone(xmlPath):
+    # Exceptions are not passed back from the worker processes
+    try:
+        return readKendoXML(xmlPath)
+    except:
+        return None
+
+def readKendoXMLFiles(xmlPaths, workers = None):
+    """
+    Reads kendo xml-files with readKendoXML in worker processes.
+    Generates the results in the order of xmlPaths, None for the files
+    that could not be read. workers is the number of processes, by
+    default the number of CPUs.
+    """
+    
+    if multiprocessing == None:
+        workers = 1
+    elif workers == None:
+        workers = multiprocessing.cpu_count()
+    
+    if workers <= 1 or len(xmlPaths) <= 1:
+        for path in xmlPaths:
+            yield _readKendoXMLOrNone(path)
+        return
+    
+    pool = multiprocessing.Pool(min(workers, len(xmlPaths)))
+    try:
+        for document in pool.imap(_readKendoXMLOrNone, xmlPaths):
+            yield document
+    finally:
+        pool.terminate()
+        pool.join()
+
+
 class KendoXMLParser:
     
     """
@@ -551,11 +698,15 @@ class KendoXMLParser:
     an XML-file for the system model and application models in a subfolder <system_model>.xml.dat/apps/
     If the <model>.xml.dat/apps/ folder is not found, the model is considered to be an separate application model
     and is parsed correspondingly.
+
+    The xml-files are read in workers processes, by default as many as
+    there are CPUs.
     """
     
-    def __init__(self, sysModelPath):
+    def __init__(self, sysModelPath, workers = None):
         self.__products = []
         self.__sysModelFile = sysModelPath
+        self.__workers = workers
         #TODO: Are flags definitely always system model level 
         self.__flags = []
         self.__testData = []
@@ -577,36 +728,39 @@ class KendoXMLParser:
         return self.__useCaseModel
 
 
+    def __xmlFiles(self, directory):
+        try:
+            root, dirs, files = os.walk(directory).next()
+        except:
+            return []
+        return [root + os.sep + file for file in files if re.match(".*\.xml", file)]
+
+
     def parseKendoModel(self):     
         
         #if len(file.name.rsplit(os.sep, 1)) > 1:
         #    self.__modelDir = file.name.rsplit(os.sep, 1)[0]
         
-        appModelDirectory = self.__sysModelFile + ".dat" + os.sep + "apps" + os.sep
-        try:
-            root, dirs, files = os.walk(appModelDirectory).next()
-        except:
-            root, dirs, files = None,[],[]
+        appModelFiles = self.__xmlFiles(self.__sysModelFile + ".dat" + os.sep + "apps" + os.sep)
+        testDataFiles = self.__xmlFiles(self.__sysModelFile + ".dat" + os.sep + "TestData" + os.sep)
         
-        appModelFiles = []
-        for file in files:
-            if re.match(".*\.xml", file):
-                appModelFiles.append(file)
+        #The files are independent of each other, so they are read in
+        #parallel. Each one is parsed as soon as it has been read.
+        documents = readKendoXMLFiles([self.__sysModelFile] + appModelFiles + testDataFiles,
+                                      self.__workers)
+        xml = documents.next()
         
-        if not self.__parseKendoProduct(self.__sysModelFile, None):
+        if xml == None or not self.__parseKendoProduct(xml, self.__sysModelFile, None):
             print ("Invalid system model")
             return False;
         
         
         #Parse flags from the system model
         try:
-            xml = minidom.parse(self.__sysModelFile)
-            flags = xml.getElementsByTagName("flag")
-            
-            for flag in flags:
-                name = flag.attributes.getNamedItem("name").value
-                description = flag.attributes.getNamedItem("description").value
-                default_value = flag.attributes.getNamedItem("default_value").value == "true"
+            for flag in xml["flag"]:
+                name = flag["attrib"]["name"]
+                description = flag["attrib"]["description"]
+                default_value = flag["attrib"]["default_value"] == "true"
                 kFlag = KendoFlag(default_value, description, name)
                 self.__flags.append(kFlag)
             
@@ -618,21 +772,18 @@ class KendoXMLParser:
         #Parse use cases from the system model:
         try:
             useCases = []
-            for ucmodel in xml.getElementsByTagName("UseCaseModel"):
-                useCaseNodes = ucmodel.getElementsByTagName("UseCase")
-                for uc in useCaseNodes:
+            for ucmodel in xml["UseCaseModel"]:
+                for uc in ucmodel.get("UseCase", []):
                     useCasePaths =[]
-                    ucName = uc.attributes.getNamedItem("name").value
-                    ucDesc = uc.attributes.getNamedItem("description").value
-                    paths = uc.getElementsByTagName("UseCasePath")
-                    for path in paths:
-                        pathName = path.attributes.getNamedItem("name").value
-                        pathDesc = path.attributes.getNamedItem("description").value
-                        transitions = path.getElementsByTagName("transition")
+                    ucName = uc["attrib"]["name"]
+                    ucDesc = uc["attrib"]["description"]
+                    for path in uc.get("UseCasePath", []):
+                        pathName = path["attrib"]["name"]
+                        pathDesc = path["attrib"]["description"]
                         ucTransitions = []
-                        for trans in transitions:
-                            transModel = trans.attributes.getNamedItem("modelName").value
-                            transId = int(trans.attributes.getNamedItem("id").value)
+                        for trans in path.get("transition", []):
+                            transModel = trans["attrib"]["modelName"]
+                            transId = int(trans["attrib"]["id"])
                             ucTransitions.append((transModel,transId))
                         
                         useCasePaths.append(UseCasePath(pathName,pathDesc,ucTransitions))
@@ -644,72 +795,50 @@ class KendoXMLParser:
             print "Invalid system model"
             return False
         
-        for appModel in appModelFiles:
-            if not self.__parseKendoProduct(root + os.sep + appModel, self.__products[0]):
-                print "Invalid application model: " + appModel
+        del xml
+        for appModelFile in appModelFiles:
+            appModel = documents.next()
+            if appModel == None or not self.__parseKendoProduct(appModel, appModelFile, self.__products[0]):
+                print "Invalid application model: " + os.path.basename(appModelFile)
                 return False;
            
         
+        productsById = {}
+        for product in self.__products:
+            productsById.setdefault(product.getId(), product)
+        
         for product in self.__products:
             for state in product.getStates():
                 if state.getLinkedProductId():
-                    for linked_prod in self.__products:
-                        if linked_prod.getId() == state.getLinkedProductId():
-                            state.setLinkedProduct(linked_prod)
-                            linked_prod.setParentProduct(product)
-                            break
+                    linked_prod = productsById.get(state.getLinkedProductId())
+                    if linked_prod:
+                        state.setLinkedProduct(linked_prod)
+                        linked_prod.setParentProduct(product)
                 
         #Read test data
-        if not self.__parseTestData():
+        if not self.__parseTestData(documents):
             print "Invalid test data"
             return False
         
         return True
         
     
-    def __parseTestData(self):
+    def __parseTestData(self, documents):
     
         try:
-            testDataDir = self.__sysModelFile + ".dat" + os.sep + "TestData" + os.sep
-            
-            try:
-                root, dirs, files = os.walk(testDataDir).next()
-            except:
-                root, dirs, files = None,[],[]
-            
-            testDataFiles = []
-            for file in files:
-                if re.match(".*\.xml", file):
-                    testDataFiles.append(file)
-            
-
-            for file in testDataFiles:
-                xml = minidom.parse(testDataDir + os.sep + file)
-                dataEntities = xml.getElementsByTagName("TestData")
-                for data in dataEntities:
-                    logicalName = data.getElementsByTagName("logicalName")[0].lastChild.nodeValue
-                    try:
-                        desc = data.getElementsByTagName("description")[0].lastChild.nodeValue
-                    except:
-                        desc = ""
-                    items = data.getElementsByTagName("TestDataItem")
+            for xml in documents:
+                if xml == None:
+                    return False
+                
+                for data in xml["TestData"]:
+                    logicalName = _requiredText(data, "logicalName")
+                    desc = data["text"].get("description") or ""
                     testDataItems = []
-                    for item in items:
-                        itemName = item.getElementsByTagName("name")[0].lastChild.nodeValue
-                        try:
-                            path = item.getElementsByTagName("path")[0].lastChild.nodeValue
-                        except:
-                            path = ""
-                        
-                        try:
-                            result = item.getElementsByTagName("result")[0].lastChild.nodeValue
-                        except:
-                            result = ""
-                            
-                        try:
-                            priority = item.getElementsByTagName("priority")[0].lastChild.nodeValue
-                        except:
-                            priority = ""
+                    for item in data.get("TestDataItem", []):
+                        itemName = _requiredText(item, "name")
+                        path = item["text"].get("path") or ""
+                        result = item["text"].get("result") or ""
+                        priority = item["text"].get("priority") or ""
                         
                         testDataItems.append(TestDataItem(itemName,path,result,priority))
                     
@@ -727,15 +856,17 @@ class KendoXMLParser:
         #self.__products[0].printData()
         
         
-    def __parseKendoProduct(self, xmlPath, parentProduct):    
+    def __parseKendoProduct(self, xml, xmlPath, parentProduct):    
         
         try:
         
-            xml = minidom.parse(xmlPath)
-            products = xml.getElementsByTagName("product")
             first_product = None
             parent = parentProduct
-            for product in products:
+            
+            #Transitions get the name of the last state read
+            stateName = ""
+            
+            for product in xml["product"]:
                 
                 if parent:
                     kendoProduct = KendoProduct()
@@ -743,111 +874,92 @@ class KendoXMLParser:
                     parent = product
                     kendoProduct = SystemProduct()
                 
-                productId = int(product.attributes.getNamedItem("id").value)
-                productName = product.attributes.getNamedItem("name").value
-                
-                try:
-                    productDesc = product.getElementsByTagName("description")[0].lastChild.nodeValue
-                except:
-                    productDesc =""
+                productId = int(product["attrib"]["id"])
+                productName = product["attrib"]["name"]
+                productDesc = product["text"].get("description") or ""
                     
                 kendoProduct.setDescription(productDesc)
                 kendoProduct.setId(productId)
                 kendoProduct.setName(productName)
-                
-                states = product.getElementsByTagName("state")
-                transitions = product.getElementsByTagName("transition")
+                kendoProduct.setModelFileName(xmlPath)
                 
                 #Parse states
-                for state in states:
-                    
-                    id = int(state.attributes.getNamedItem("id").value)
-                    type = state.getElementsByTagName("type")[0].lastChild.nodeValue
-                    
-                    try:
-                        name = state.getElementsByTagName("name")[0].lastChild.nodeValue
-                    except:
-                        name = ""
+                statesById = {}
+                for state in product.get("state", []):
                     
-                    event_id = state.getElementsByTagName("event_id")[0].lastChild.nodeValue
-                    try:
-                        desc = state.getElementsByTagName("description")[0].lastChild.nodeValue
-                    except:
-                        desc = ""
+                    id = int(state["attrib"]["id"])
+                    type = _requiredText(state, "type")
+                    name = state["text"].get("name") or ""
+                    event_id = _requiredText(state, "event_id")
+                    desc = state["text"].get("description") or ""
                     try:
-                        linkedModelId = int(state.getElementsByTagName("linkedModelId")[0].lastChild.nodeValue)
+                        linkedModelId = int(state["text"]["linkedModelId"])
                     except:
                         linkedModelId = None
-                            
                      
                     #Read keywords 
                     keywords = []
-                    kws = state.getElementsByTagName("keyword")
-                    for kw in kws:
-                        keywordType = kw.attributes.getNamedItem("type").value
-                        keywordParams = kw.attributes.getNamedItem("parameter").value
+                    for kw in state.get("keyword", []):
+                        keywordType = kw["attrib"]["type"]
+                        keywordParams = kw["attrib"]["parameter"]
                         keywords.append(keywordType + " " + keywordParams)
                         
                     kendoState = KendoState(id, name, desc, type, event_id, linkedModelId, keywords)
                     
                     kendoProduct.addState(kendoState)
+                    statesById.setdefault(id, kendoState)
+                    stateName = name
                 
                 #Parse transitions
-                for transition in transitions:
+                for transition in product.get("transition", []):
                     
-                    id = int(transition.attributes.getNamedItem("id").value)
+                    id = int(transition["attrib"]["id"])
                     
-                    event_id = transition.attributes.getNamedItem("event_id").value
+                    event_id = transition["attrib"]["event_id"]
                     
-                    try:
-                        name = state.getElementsByTagName("name")[0].lastChild.nodeValue
-                    except:
-                        name = ""
+                    name = stateName
                     
-                    toStateId = int(transition.attributes.getNamedItem("to").value)
-                    fromStateId = int(transition.attributes.getNamedItem("from").value)
+                    toStateId = int(transition["attrib"]["to"])
+                    fromStateId = int(transition["attrib"]["from"])
                     
-                    toPort = transition.attributes.getNamedItem("toport").value
-                    fromPort = transition.attributes.getNamedItem("fromport").value
+                    toPort = transition["attrib"]["toport"]
+                    fromPort = transition["attrib"]["fromport"]
                     
                     
-                    if transition.getElementsByTagName("keywords") == None or len(transition.getElementsByTagName("keywords")) == 0:
+                    if not "keywords" in transition:
                         keywords = None
                     else:    
                         #Read keywords 
                         keywords = []
-                        kws = transition.getElementsByTagName("keyword")
-                        for kw in kws:
-                            keywordType = kw.attributes.getNamedItem("type").value
-                            keywordParams = kw.attributes.getNamedItem("parameter").value
+                        for kw in transition.get("keyword", []):
+                            keywordType = kw["attrib"]["type"]
+                            keywordParams = kw["attrib"]["parameter"]
                             keywords.append(keywordType + " " + keywordParams)
                       
                     #Read activities
                     activities = []
-                    acts = transition.getElementsByTagName("activity")
-                    for act in acts:
+                    for act in transition.get("activity", []):
                         
-                        actValue = act.attributes.getNamedItem("value").value
-                        actType = act.attributes.getNamedItem("type").value
-                        actKey = act.attributes.getNamedItem("key").value
+                        actValue = act["attrib"]["value"]
+                        actType = act["attrib"]["type"]
+                        actKey = act["attrib"]["key"]
                         
                         kendoAct = KendoActivity(actValue, actType, actKey)
                         activities.append(kendoAct)
                         
                     #Read guard conditions
                     guard_conditions = []
-                    conditions = transition.getElementsByTagName("condition")
-                    for cond in conditions:
+                    for cond in transition.get("condition", []):
                         
-                        condType = cond.attributes.getNamedItem("type").value
-                        condRegVal = cond.attributes.getNamedItem("required_value").value
-                        cond = cond.attributes.getNamedItem("key").value
+                        condType = cond["attrib"]["type"]
+                        condRegVal = cond["attrib"]["required_value"]
+                        condKey = cond["attrib"]["key"]
                         
-                        condition = GuardCondition(condType, condRegVal, cond)
+                        condition = GuardCondition(condType, condRegVal, condKey)
                         guard_conditions.append(condition)
         
-                    toState = kendoProduct.getStateById(toStateId)
-                    fromState = kendoProduct.getStateById(fromStateId)
+                    toState = statesById.get(toStateId)
+                    fromState = statesById.get(fromStateId)
                                                                              
                     kendoTransition = KendoTransition(id, name, event_id, keywords, toState, fromState, toPort, fromPort, activities, guard_conditions)
                     kendoProduct.addTransition(kendoTransition)
@@ -74,6 +74,7 @@ class LstsModel:
         self.__states = []
         self.__transitions = []
         self.__actions = []
+        self.__actionsByName = {}
         self.__start_state = None
 
     def getStates(self):
@@ -99,12 +100,12 @@ class LstsModel:
     
     def addAction(self, action_name, refinements):
         #check if action already exists
-        for a in self.__actions:
-            if a.getName() == action_name:
-                return a
+        if action_name in self.__actionsByName:
+            return self.__actionsByName[action_name]
         
         new_action = Action(action_name, refinements)
         self.__actions.append(new_action)
+        self.__actionsByName[action_name] = new_action
         return new_action
     
     def removeState(self, state):
@@ -171,6 +172,8 @@ class LstsState:
     def __init__(self):
         self.__state_propositions = []
         self.__transitions = []
+        #The first transition of each action
+        self.__transitionsByAction = {}
 
     def setState_propositions(self, sps):
         self.__state_propositions = sps
@@ -186,12 +189,23 @@ class LstsState:
     
     def addTransition(self, transition):
         self.__transitions.append(transition)
+        self.__transitionsByAction.setdefault(transition.getAction(), transition)
         
     def getTransitions(self):
         return self.__transitions
     
+    def getTransitionByAction(self, action):
+        """
+        Returns the first transition with the action leaving the state,
+        None if there is no such transition
+        """
+        return self.__transitionsByAction.get(action)
+    
     def setTransitions(self, transitions):
         self.__transitions = transitions
+        self.__transitionsByAction = {}
+        for transition in reversed(transitions):
+            self.__transitionsByAction[transition.getAction()] = transition
         
   
 class Action:
@@ -361,6 +375,11 @@ class LstsModelCreator:
         self.__lsts_model.setStart_state(start_state)
         self.__lsts_model.setStates(states)
         
+        #Leaving transitions of the states by state id
+        transitionsFrom = {}
+        for t in self.__product.getTransitions():
+            transitionsFrom.setdefault(t.getFromState().getId(), []).append(t)
+        
         #Process the states and their transitions
         for s in self.__product.getStates():
             
@@ -386,21 +405,19 @@ class LstsModelCreator:
                 continue             
             
             #Prosess the leaving transitions of this state.
-            for t in self.__product.getTransitions():         
+            for t in transitionsFrom.get(s.getId(), []):         
                 
-                if s.getId() == t.getFromState().getId():
-                    
-                    if re.match("in\d+|out\d+", t.getFromPort()) and self.__generate_ts: continue
-                    
-                    #If the transition ends to the first state of the model (after start_state),
-                    #the transtion is attached to the start_state of the model, because in kendo
-                    #keywords that are defined in start state are executed always when entering the first state.
-                    if t.getToState().getEvent_id() =="S1" and len(entry_points) == 1 and s.getType() != "START_STATE" and s.getType() != "ENTRY_POINT":
-                        to_state = self.__stateMapper[entry_points[0].getId()] #TODO: Certain that id 1 is always the start state?
-                    else:
-                        to_state = self.__stateMapper[t.getToState().getId()]
-                    
-                    self.__processTransition(t,state, to_state)
+                if re.match("in\d+|out\d+", t.getFromPort()) and self.__generate_ts: continue
+                
+                #If the transition ends to the first state of the model (after start_state),
+                #the transtion is attached to the start_state of the model, because in kendo
+                #keywords that are defined in start state are executed always when entering the first state.
+                if t.getToState().getEvent_id() =="S1" and len(entry_points) == 1 and s.getType() != "START_STATE" and s.getType() != "ENTRY_POINT":
+                    to_state = self.__stateMapper[entry_points[0].getId()] #TODO: Certain that id 1 is always the start state?
+                else:
+                    to_state = self.__stateMapper[t.getToState().getId()]
+                
+                self.__processTransition(t,state, to_state)
                     
                     
         return self.__lsts_model
@@ -413,9 +430,9 @@ class LstsModelCreator:
         
         #if the given action already exists in the state ( multiple transitions to InGate situations),
         #the two states are merged
-        for transition in state.getTransitions():
-            if transition.getAction() == action:
-                return transition.getToState()
+        transition = state.getTransitionByAction(action)
+        if transition:
+            return transition.getToState()
         
         target = None
         if targetState != None:
@@ -839,9 +856,9 @@ class LstsModelCreator:
                 
                 wake_state = None
                 #check if the given wake already exists (multiple transitions to one InGate) 
-                for t in initial_state.getTransitions():
-                    if t.getAction() == action:
-                        wake_state =  t.getToState()
+                t = initial_state.getTransitionByAction(action)
+                if t:
+                    wake_state = t.getToState()
                 
                 if not wake_state:
                     
@@ -0,0 +1,155 @@
+# Copyright (c) 2006-2010 Tampere University of Technology
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Farm coverage is the coverage requirement of a worker in a test farm
+(see tema.testengine.testfarm). The coordinator of the farm divides the
+target actions of the coverage requirement of the farm between the
+workers. A worker reports the target actions it executes to the
+coordinator, and gets in return its share of the unfinished actions
+and the coverage of the whole farm.
+
+The coverage requirement is the UNIX socket of the coordinator and the
+number of the worker:
+
+--coverage=farmcoverage --coveragereq="/tmp/farm.sock 0"
+
+The percentage is the share of the target actions executed by all the
+workers, plus the actions of the worker's own share executed in the
+search of the guidance. So guidances that compare percentages prefer
+the worker's own actions. The execution hint contains the unfinished
+actions of the share. The percentage is 1.0 when the whole farm is
+finished.
+
+FarmRequirement reads the following parameter values:
+
+- poll (seconds, default: 1)
+
+  how often the share is asked from the coordinator when no target
+  actions are executed
+"""
+
+import socket
+import time
+import re
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import tema.coverage.coverage as coverage
+
+
+def _names(actions):
+    # json gives unicode strings, the coordinator sends the action
+    # names (byte strings) as latin-1
+    return [ a.encode("latin-1") for a in actions ]
+
+
+class FarmRequirement(coverage.Requirement):
+
+    def __init__(self, reqstr):
+        try:
+            socketpath, worker = reqstr.strip().rsplit(None, 1)
+            worker = int(worker)
+        except ValueError:
+            raise ValueError("Invalid farm requirement: '%s'. "
+                             "Expected 'SOCKET WORKERNUMBER'" % reqstr)
+        self._worker = worker
+        self._poll = 1.0
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(socketpath)
+        self._input = self._sock.makefile("r")
+        self._targets = frozenset()
+        self._assigned = frozenset()
+        self._covered = 0
+        self._total = 0
+        self._done = False
+        # the actions of the share executed in the search, one set for
+        # every push
+        self._found = set()
+        self._foundstack = []
+        reply = self._request("hello %s" % worker)
+        self._targets = frozenset(_names(reply["targets"]))
+        self.log("Worker %s of the farm, %s target actions, %s in the share"
+                 % (worker, len(self._targets), len(self._assigned)))
+
+    def _request(self, message):
+        self._sock.sendall(message + "\n")
+        line = self._input.readline()
+        if not line:
+            raise Exception("Connection to the farm coordinator closed")
+        reply = json.loads(line)
+        self._assigned = frozenset(_names(reply["assigned"]))
+        self._covered = reply["covered"]
+        self._total = reply["total"]
+        self._done = reply["done"]
+        self._lastrequest = time.time()
+        return reply
+
+    def setParameter(self, parametername, value):
+        if parametername == "poll":
+            self._poll = float(value)
+        else:
+            print __doc__
+            raise Exception("Invalid parameter '%s' for farmcoverage."
+                            % parametername)
+
+    def markExecuted(self, transition):
+        name = transition.getAction().toString()
+        if self._foundstack:
+            # in the search of the guidance
+            if name in self._assigned:
+                self._found.add(name)
+        elif name in self._targets:
+            self._request("executed %s" % name)
+        elif time.time() - self._lastrequest >= self._poll:
+            self._request("poll")
+
+    def push(self):
+        self._foundstack.append(self._found)
+        self._found = set(self._found)
+
+    def pop(self):
+        self._found = self._foundstack.pop()
+
+    def getPercentage(self):
+        if self._done:
+            return 1.0
+        if not self._total:
+            return 0.0
+        return (self._covered + len(self._found)) / float(self._total)
+
+    def getExecutionHint(self):
+        actions = self._assigned.difference(self._found)
+        return (set([ re.compile(re.escape(a) + "$") for a in actions ]),
+                len(actions))
+
+    def pickDataValue(self, set_of_possible_values):
+        return None
+
+
+def requirement(reqstr, model=None):
+    if hasattr(requirement, "log"):
+        FarmRequirement.log = requirement.log
+    return FarmRequirement(reqstr)
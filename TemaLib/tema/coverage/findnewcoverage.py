@@ -39,7 +39,7 @@ Find new ("state-wise unique") switches between apps A and B:
 "findnew switch[apps:A B]"
 
 Find new transitions of model components whose name contains Calendar:
-"findnew componenttransition[model:model.ext,components:.*Calendar.*]
+"findnew componenttransition[components:.*Calendar.*]
 
 -----
 
@@ -75,17 +75,17 @@ switch:
             The apps we're trying to switch between.
             The appnames must contain the device name(??). Eg. "MyPhone/App1".
 componenttransition:
-    unique transitions of the given model components.
+    unique transitions of the given components of the parallel lsts model.
     Special params:
-        (either give both 'model' and 'components',
-         or neither to search for all the component transitions)
-        model:MODELFILENAME
-            The parallel composition model, eg. target/combined-rules.ext
         components:C1 C2 ...
             the component names, whitespace-separated, may be regexp,
             eg. .*Switcher.* Note that the component names must be in the
             same format as in the model file, so there may be some device etc.
             stuff in front of the actual model name, eg. DeviceX/rm/ModelName
+            (default: all the components)
+        model:MODELFILENAME
+            The parallel composition model, eg. target/combined-rules.ext
+            Only needed if the model is not given to requirement().
 ...
 
 
@@ -94,7 +94,8 @@ componenttransition:
 version = "0.0003"
 
 import re
-from tema.coverage.tabulist import TabuList
+from tema.coverage.tabulist import TabuList, FingerprintTabuList, \
+    IndexTabuList
 from tema.coverage.coverage import Requirement, CombinedRequirement, ecoAnd
 
 def requirement(req, model=None):
@@ -110,7 +111,15 @@ def requirement(req, model=None):
     except ValueError:
         raise ValueError("Invalid tabu string: '%s'" % req)
 
-    return TabuRequirement(tabuStr)
+    if model is not None:
+        # the rest of the actions are classified when they are first seen
+        try: classifyActions(model.getActions())
+        except NotImplementedError: pass
+
+    tabuReq = TabuRequirement(tabuStr)
+    if model is not None:
+        tabuReq.setModel(model)
+    return tabuReq
 
 
 _PARAM_PATTERN = r"(?:\[([^\]]*)\])?"
@@ -146,7 +155,7 @@ class TabuRequirement(Requirement,object):
     def __init__(self,paramStr):
         # default params:
         self.setParameter("weight","decreasing")
-        self._tabuList = TabuList()
+        self._tabuList = self._newTabuList()
         # user-given params:
         self.setParameterStr(paramStr)
 
@@ -160,7 +169,7 @@ class TabuRequirement(Requirement,object):
     def setParameter(self,name,value):
         name = name.lower()
         if name in ("size","tabusize"):
-            self._tabuList = TabuList( _parseSize(value) )
+            self._tabuList = self._newTabuList( _parseSize(value) )
         elif name == "weight":
             if value in ("decreasing","decr"):
                 self.weight = self._decreasingWeight
@@ -173,6 +182,13 @@ class TabuRequirement(Requirement,object):
             raise ValueError(
                 "Invalid param '%s' for %s"%(name,self.__class__.__name__))
 
+    def _newTabuList(self,size=None):
+        return TabuList(size)
+
+    def setModel(self,model):
+        """Called by requirement() with the model being tested."""
+        pass
+
     def getPercentage(self):
         """ Doesn't actually return "coverage" per se, but is a function that's
             getting closer and closer to 1 as new items are found.
@@ -259,94 +275,86 @@ class SingleTabuRequirement(TabuRequirement):
     def filterRelevant(self,transition):
         return self._tabuFilter(transition)
 
+    def _newTabuList(self,size=None):
+        if self._name in FINGERPRINT_FILTERS:
+            return FingerprintTabuList(size)
+        return TabuList(size)
+
 
 
 class ComponentTransitionTabuRequirement(SingleTabuRequirement):
     """Finds new transitions of given model components.
 
-    findnew componenttransition[model:MODELFILE,components=COMPONENTNAMES]
-    MODELFILE = The parallel composition model, eg. target/combined-rules.ext
+    findnew componenttransition[components:COMPONENTNAMES,model:MODELFILE]
     COMPONENTNAMES = The names of the model components whose transitions we
-                     are searching.
+                     are searching (default: all the components).
+    MODELFILE = The parallel composition model, eg. target/combined-rules.ext
+                Only read if no parallel lsts model is given to setModel().
+
+    The component transitions are identified by their indices in the
+    ComponentTransitionIndex of the model, and the found ones are kept
+    in a bitset.
     """
     def __init__(self,tabuStr):
         self._model = None
+        self._modelFile = None
         self._components = []
+        self._numTrans = None
         SingleTabuRequirement.__init__(self,tabuStr)
+        # the filter is created when it is first needed, by then the
+        # model has been given
+        self._tabuFilter = self._createFilterAndFilter
 
     def setParameter(self,name,value):
         if name == "components":
             self._components = value.strip().split()
-            self._createFilter()
         elif name == "model":
-            self._model = value
-            self._createFilter()
+            self._modelFile = value
         else:
             SingleTabuRequirement.setParameter(self,name,value)
 
-    def _createFilter(self,raiseIfFails=False):
-        if self._model and self._components:
-            # Assumes that:
-            #  N first rows of _model file are the components in the parallel
-            #  composition. (Only) these rows match _RE_COMPONENT_FILE.
-            #  The components are in the same order as in the parallel state id.
-            #  These rows tell the name of model component file (relative to
-            #  the dir of model file).
-            #  The model component files contain "Transition_cnt = XX" line.
-            #  + propably something else...
-            import os.path
-            compFiles = {} # key: the index in parallel composition
-            _RE_COMPONENT_FILE = re.compile('([^()=]*)="([^()]*)"')
-            # the component filenames are relative to this path:
-            modeldir = os.path.dirname(self._model)
-
-            f = open(self._model)
+    def setModel(self,model):
+        if hasattr(model,"getLstsList"):
+            self._model = model
+
+    def _newTabuList(self,size=None):
+        return IndexTabuList(size)
+
+    def _createFilter(self):
+        if self._model is None:
+            if not self._modelFile:
+                raise ValueError("componenttransition needs a parallel "\
+                    "lsts model, or its filename in the 'model' param.")
+            import tema.model.parallellstsmodel as parallellstsmodel
+            self._model = parallellstsmodel.Model()
+            f = open(self._modelFile)
             try:
-                for num, line in enumerate(f):
-                    match = _RE_COMPONENT_FILE.match(line)
-                    if not match:
-                        break
-                    compname,filename = match.groups()
-                    for comp in self._components:
-                        if re.match(comp+"$",compname):
-                            self.log("Searching for transitions of component %i: %s" % (num,compname,))
-                            compFiles[num] = os.path.join(modeldir,filename)
-                            break # each component only once
+                self._model.loadFromFile(f)
             finally:
                 f.close()
-
-            # finding out the total num of transitions from component files
-            numTrans = 0
-            for num,filename in compFiles.iteritems():
-                cf = open(filename)
-                try:
-                    inHeader = False
-                    for line in cf:
-                        li = line.strip().lower()
-                        if inHeader:
-                            if li.startswith("transition_cnt"):
-                                numTrans += int(li.rsplit(None,1)[-1])
-                                break
-                            elif li.startswith("end header"):
-                                raise IOError(
-                                    "No Transition_cnt in '''%s'''" % (
-                                    filename,))
-                        elif li.startswith("begin header"):
-                            inHeader = True
-                finally:
-                    cf.close()
-            self._numTrans = numTrans
-
-            compIndices = [i for i in compFiles.iterkeys()]
-            self._tabuFilter = createComponentTransitionFilter(compIndices)
+        index = componentTransitionIndex(self._model)
+        if self._components:
+            comps = []
+            for num,compname in enumerate(index.getComponentNames()):
+                for comp in self._components:
+                    if re.match(comp+"$",compname):
+                        self.log("Searching for transitions of component %i: %s" % (num,compname,))
+                        comps.append(num)
+                        break # each component only once
         else:
-            # either 'model' or 'components' param is not given.
-            # no need to panic yet, since the missing param may be coming.
-            self._tabuFilter = createUndefinedFilter("componenttransition "\
-                "needs both 'model' and 'components' params! (or neither to "\
-                "find transitions of every component).")
+            comps = None
+        self._numTrans = index.getTransitionCount(comps)
+        self._tabuFilter = createComponentTransitionFilter(index,comps)
+
+    def _createFilterAndFilter(self,transition):
+        self._createFilter()
+        return self._tabuFilter(transition)
 
     def getPercentage(self):
+        if self._numTrans is None:
+            self._createFilter()
+        if self._numTrans == 0:
+            return 1.0
         return float(self._tabuList.lenUnique()) / self._numTrans
 
 
@@ -370,6 +378,10 @@ class OperatorTabuRequirement(TabuRequirement):
             r.pop()
         TabuRequirement.pop(self)
 
+    def setModel(self,model):
+        for r in self._requirements:
+            r.setModel(model)
+
 
 
 
@@ -409,6 +421,10 @@ class WhileTabuRequirement(TabuRequirement):
         self._name = "WHILE"
         TabuRequirement.__init__(self,paramStr)
 
+    def setModel(self,model):
+        for r in self._requirements:
+            r.setModel(model)
+
     def filterRelevant(self, transition):
         """ Yields all the possible tuples of the form (y1,y2,...) where
         y1 is something yielded by the filter of my first requirement,
@@ -461,7 +477,7 @@ class SwitchTabuRequirement(SingleTabuRequirement):
         TabuRequirement.markExecuted(self,transition)
         for fromApp in self._tabuFilter(transition):
             self._fromApp = fromApp
-            self._fromState = transition.getDestState()
+            self._fromState = transition.getDestState().fingerprint()
             break
         for fromApp,toApp in self._actFilter(transition):
             self._fromApp = toApp
@@ -469,10 +485,11 @@ class SwitchTabuRequirement(SingleTabuRequirement):
     def _filterRelevantStatewise(self,transition):
         for toApp in self._tabuFilter(transition):
             if self._fromApp is not None and self._fromApp != toApp:
-                yield (self._fromState,transition.getDestState())
+                yield (self._fromState,transition.getDestState().fingerprint())
 
         for fromApp,toApp in self._actFilter(transition):
-            yield (transition.getSourceState(), transition.getDestState())
+            yield (transition.getSourceState().fingerprint(),
+                   transition.getDestState().fingerprint())
 
     def _filterRelevantAppwise(self,transition):
         for toApp in self._tabuFilter(transition):
@@ -504,59 +521,110 @@ def _parseSize(size):
     return retSize
 
 
+# Action categories. The filters are run for every transition evaluated
+# by the guidance, so the names of the actions are classified only once:
+# the category bits are stored in the action objects, like their
+# fingerprints. requirement() classifies the actions of the model
+# beforehand.
+
+AC_START_AW = 1     # start_aw of an application (not of TaskSwitcherGEN)
+AC_END_AW = 2       # end_aw of an application (not of TaskSwitcherGEN)
+AC_KEYWORD = 4      # keyword, name begins with "kw"
+AC_WAKE = 8         # name begins with "WAKEtsWAKE"
+AC_ACTIVATES = 16   # "X ACTIVATES Y"
+
+_RE_ACTIVATES = re.compile("(.*) ACTIVATES (.*)")
+
+def _classifyAction(action):
+    aStr = str(action)
+    bits = 0
+    if "TaskSwitcherGEN" not in aStr:
+        if "start_aw" in aStr:
+            bits |= AC_START_AW
+        if "end_aw" in aStr:
+            bits |= AC_END_AW
+    if aStr.startswith("kw"):
+        bits |= AC_KEYWORD
+    if aStr.startswith("WAKEtsWAKE"):
+        bits |= AC_WAKE
+    if " ACTIVATES " in aStr:
+        bits |= AC_ACTIVATES
+        x, y = _RE_ACTIVATES.match(aStr).groups()
+        if "/" in x:
+            # if there's a device name in x, prepend it y also
+            y = x.split("/",1)[0] + "/" + y
+        action._findnewActivates = (x, y)
+    action._findnewCategories = bits
+    return bits
+
+def actionCategories(action):
+    """Returns the category bits (AC_*) of the action."""
+    try:
+        return action._findnewCategories
+    except AttributeError:
+        return _classifyAction(action)
+
+def classifyActions(actions):
+    """Classifies the actions, eg. model.getActions(), in advance."""
+    for action in actions:
+        _classifyAction(action)
+
+
 # "tabu filters" take a transition as a parameter.
 # if the transition is something the tabu filter is intrested in, it yields
 # something that identifies the thing they're tabuing.
 # Eg. destStateFilter yields the destination state of the transition.
 # yielding instead of returning because there may be multiple things to yield,
 # like in statePropFilter.
+# States, transitions and edges are identified by their fingerprints to keep
+# the tabulists small.
 
 def destStateFilter(transition):
-    yield str(transition.getDestState())
+    yield transition.getDestState().fingerprint()
 
 def sourceStateFilter(transition):
-    yield str(transition.getSourceState())
+    yield transition.getSourceState().fingerprint()
 
 def transitionFilter(transition):
-    yield transition
+    yield transition.fingerprint()
 
 def edgeFilter(transition):
-    yield transition.getAction()
+    yield transition.getAction().fingerprint()
 
 def startAWFilter(transition):
     action = transition.getAction()
-    if "start_aw" in str(action) and "TaskSwitcherGEN" not in str(action):
-        yield action
+    if actionCategories(action) & AC_START_AW:
+        yield action._id
 
 def sourceStateOfStartAWFilter(transition):
     for a in startAWFilter(transition):
-        yield transition.getSourceState()
+        yield transition.getSourceState().fingerprint()
 
 def destStateOfStartAWFilter(transition):
     for a in startAWFilter(transition):
-        yield transition.getSourceState()
+        yield transition.getSourceState().fingerprint()
 
 def endAWFilter(transition):
     action = transition.getAction()
-    if "end_aw" in str(action) and "TaskSwitcherGEN" not in str(action):
-        yield action
+    if actionCategories(action) & AC_END_AW:
+        yield action._id
 
 def sourceStateOfEndAWFilter(transition):
     for a in endAWFilter(transition):
-        yield transition.getSourceState()
+        yield transition.getSourceState().fingerprint()
 
 def destStateOfEndAWFilter(transition):
     for a in endAWFilter(transition):
-        yield transition.getDestState()
+        yield transition.getDestState().fingerprint()
 
 def wakeFilter(transition):
-    if str(transition.getAction()).startswith("WAKEtsWAKE"):
+    if actionCategories(transition.getAction()) & AC_WAKE:
         yield True
 
 def keywordFilter(transition):
     action = transition.getAction()
-    if str(action).startswith("kw"): # or "kw_"?
-        yield action
+    if actionCategories(action) & AC_KEYWORD: # or "kw_"?
+        yield action._id
 
 def statePropFilter(transition):
     action = transition.getAction()
@@ -579,24 +647,31 @@ def statePropInclSleepFilter(transition):
     for spStr in props:
         yield spStr
 
+# The app filters depend on the app names, so each of them has a table of
+# its own: action id -> the app names (or pairs) it yields for the action.
+
+def _appTableFilter(match):
+    table = {}
+    def filter(transition):
+        action = transition.getAction()
+        try:
+            apps = table[action._id]
+        except KeyError:
+            apps = table[action._id] = tuple(match(action))
+        return iter(apps)
+    return filter
+
 def createAppNameFilter(appNames):
-    def appNameFilter(transition):
-        aStr = str(transition.getAction())
-        for app in appNames:
-            if aStr.startswith(app):
-                yield app
-    return appNameFilter
+    def match(action):
+        aStr = str(action)
+        return [app for app in appNames if aStr.startswith(app)]
+    return _appTableFilter(match)
 
-_RE_ACTIVATES = re.compile("(.*) ACTIVATES (.*)")
 def createActivatesFilter(appNames):
-    def appNameFilter(transition):
-        aStr = str(transition.getAction())
-        if not " ACTIVATES " in aStr:
-            return
-        x, y = _RE_ACTIVATES.match(aStr).groups()
-        if "/" in x:
-            # if there's a device name in x, prepend it y also
-            y = x.split("/",1)[0] + "/" + y
+    def match(action):
+        if not actionCategories(action) & AC_ACTIVATES:
+            return []
+        x, y = action._findnewActivates
         a1, a2 = None, None
         for app in appNames:
             if x.startswith(app):
@@ -604,26 +679,25 @@ def createActivatesFilter(appNames):
             if y.startswith(app):
                 a2 = app
         if a1 and a2 and (a1 != a2):
-            yield (a1,a2)
-    return appNameFilter
+            return [(a1,a2)]
+        return []
+    return _appTableFilter(match)
 
 def createWakeFilter(appNames):
     _wake_re = re.compile(
         r"WAKEtsWAKE<(%s).*>" % 
         (r"|".join(["(?:%s)" % a for a in appNames])) )
-    def wakeFilter(transition):
-        for app in _wake_re.findall( str(transition.getAction()) ):
-            yield app
-    return wakeFilter
+    def match(action):
+        return [intern(app) for app in _wake_re.findall(str(action))]
+    return _appTableFilter(match)
 
 def createSleepFilter(appNames):
     _sleep_re = re.compile(
         r"SLEEPts<(%s).*>" % 
         (r"|".join([r"(?:%s)" % a for a in appNames])) )
-    def sleepFilter(transition):
-        for app in _sleep_re.findall( str(transition.getAction()) ):
-            yield app
-    return sleepFilter
+    def match(action):
+        return [intern(app) for app in _sleep_re.findall(str(action))]
+    return _appTableFilter(match)
 
 def createOfFilter(thisOf,ofThis):
     def ofFilter(transition):
@@ -659,32 +733,105 @@ def createCompoFilter(filters):
     return compoFilter
 
 
-def createComponentTransitionFilter(comps=None):
+class ComponentTransitionIndex(object):
+    """Numbers the transitions of the components of a parallel lsts
+    model. The index of a component transition is the number of the
+    transition in its component plus the offset of the component, ie.
+    the number of transitions in the components before it.
+
+    A transition of the parallel model executes the transitions of the
+    components that take part in the rule of its action. They are
+    looked up once per transition object.
+    """
+    def __init__(self,model):
+        self._names = []
+        self._offsets = []
+        # _numbers[N]: (source, action, dest) -> index of the transition
+        # of component N
+        self._numbers = []
+        componentOfAction = {}
+        offset = 0
+        for num,(name,lstsobj) in enumerate(model.getLstsList()):
+            numbers = {}
+            for source,outTransitions in enumerate(lstsobj.get_transitions()):
+                for dest,action in outTransitions:
+                    key = (source,action,dest)
+                    if key not in numbers:
+                        numbers[key] = offset + len(numbers)
+                    componentOfAction[action] = num
+            self._names.append(name)
+            self._offsets.append(offset)
+            self._numbers.append(numbers)
+            offset += len(numbers)
+        self._offsets.append(offset)
+        # result action -> the (component, action) pairs of its rules
+        syncActions = {}
+        for rule in model.getRuleList():
+            pairs = syncActions.setdefault(rule.getResult(),[])
+            for action in rule.getSynchronousActions():
+                if action in componentOfAction:
+                    pair = (componentOfAction[action],action)
+                    if pair not in pairs:
+                        pairs.append(pair)
+        self._syncActions = dict([(result,tuple(pairs))
+                                  for result,pairs in syncActions.iteritems()])
+
+    def getComponentNames(self):
+        return self._names
+
+    def getTransitionCount(self,comps=None):
+        """Returns the number of the transitions of the given components
+        (default: all the components)."""
+        if comps is None:
+            return self._offsets[-1]
+        return sum([self._offsets[n+1] - self._offsets[n] for n in comps])
+
+    def getComponentTransitions(self,transition):
+        """Returns the (component, index) pairs of the component
+        transitions executed by the transition of the parallel model."""
+        try:
+            return transition._componentTransitions
+        except AttributeError:
+            pass
+        pairs = []
+        source = transition.getSourceState()._id
+        dest = transition.getDestState()._id
+        for n,action in self._syncActions.get(transition.getAction()._id,()):
+            index = self._numbers[n].get((source[n]._id,action,dest[n]._id))
+            if index is not None:
+                pairs.append((n,index))
+        transition._componentTransitions = tuple(pairs)
+        return transition._componentTransitions
+
+def componentTransitionIndex(model):
+    """Returns the ComponentTransitionIndex of the parallel lsts model,
+    it is created only once per model."""
+    try:
+        return model._componentTransitionIndex
+    except AttributeError:
+        model._componentTransitionIndex = ComponentTransitionIndex(model)
+        return model._componentTransitionIndex
+
+def createComponentTransitionFilter(index,comps=None):
     if comps is None:
         # all the components
         def componentTransitionFilter(transition):
-            numComps = len(transition.getSourceState()._id)
-            for n in xrange(numComps):
-                # does the state of component n change?
-                source = transition.getSourceState()._id[n]._id
-                dest = transition.getDestState()._id[n]._id
-                if source != dest:
-                    yield (n,source,str(transition.getAction()),dest)
+            for n,i in index.getComponentTransitions(transition):
+                yield i
         componentTransitionFilter.__doc__ = """
-            Yields all the component transitions that are executed when
-            the given (parallel) transition is executed."""
+            Yields the indices of all the component transitions that are
+            executed when the given (parallel) transition is executed."""
     else:
         # only the given component indices
+        compSet = frozenset(comps)
         def componentTransitionFilter(transition):
-            for n in comps:
-                # does the state of component n change?
-                source = transition.getSourceState()._id[n]._id
-                dest = transition.getDestState()._id[n]._id
-                if source != dest:
-                    yield (n,source,str(transition.getAction()),dest)
+            for n,i in index.getComponentTransitions(transition):
+                if n in compSet:
+                    yield i
         componentTransitionFilter.__doc__ = """
-            Yields all the transitions of components %s that are executed when
-            the given (parallel) transition is executed.""" % (comps,)
+            Yields the indices of the transitions of components %s that are
+            executed when the given (parallel) transition is executed.""" % (
+            comps,)
     return componentTransitionFilter
 
 def createUndefinedFilter(text):
@@ -714,10 +861,17 @@ TABU_FILTERS = {
     "dest_state_of_start_aw": createOfFilter(destStateFilter,startAWFilter),
     "dest_state_of_end_aw": createOfFilter(destStateFilter,endAWFilter),
     "stateprop_of_endaw": createOfFilter(statePropFilter, endAWFilter),
-    "componenttransition": createComponentTransitionFilter(),
+    "componenttransition": createUndefinedFilter("componenttransition "\
+        "needs a parallel lsts model"),
     "switch": createUndefinedFilter("switch needs a param 'apps'")
 }
 
+# filters that yield only fingerprints, their reqs use FingerprintTabuLists
+FINGERPRINT_FILTERS = set([
+    "sourcestate", "deststate", "state", "transition", "edge",
+    "source_state_of_start_aw", "source_state_of_end_aw",
+    "dest_state_of_start_aw", "dest_state_of_end_aw"])
+
 def tabuFilterByType(filterName):
     if filterName in TABU_FILTERS:
         return TABU_FILTERS[filterName]
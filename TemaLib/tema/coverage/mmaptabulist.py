@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2006-2010 Tampere University of Technology
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+MmapTabuList - an unlimited tabulist in a memory-mapped file.
+
+The tabulist is an open-addressing hash table of 64-bit fingerprints
+of the items. Any number of processes on the same host may open the
+same file; they all see the same tabulist. There is no server
+process, the file stays valid as long as it exists.
+
+Inserts are serialized with an exclusive lock on the file, lookups
+read the table without locking.
+
+File layout (all integers little-endian):
+
+    0  magic 'TEMATABU'
+    8  format version (uint32)
+    12 number of opened connections (uint32)
+    16 item type, 16 bytes, zero-padded
+    32 number of slots (uint64, power of two)
+    40 number of items (uint64)
+    64 the slots, uint64 each. 0 means an empty slot.
+
+MmapTabuList interface:
+    add(item)
+    addMany(items)
+    __contains__(item)
+    tabunessOf(items)
+    __len__()
+    connNum()
+    getItemType()
+    close()
+
+Items may be strings or anything whose repr() identifies them
+(e.g. tuples of strings and integers).
+
+    tl = MmapTabuList("/tmp/tabu.bin", "state")
+    tl.add("(1, 2, 3)")
+    # "(1, 2, 3)" in tl == True
+"""
+
+import os
+import mmap
+import struct
+
+from tema.model.model import fingerprintOfString
+
+try:
+    import fcntl
+except ImportError:
+    # No file locking available (e.g. Windows). Inserts from
+    # concurrent processes may then be lost, which is harmless for a
+    # tabulist.
+    fcntl = None
+
+MAGIC = "TEMATABU"
+FORMAT_VERSION = 1
+
+_HEADER_SIZE = 64
+_SLOT_SIZE = 8
+_OFS_VERSION = 8
+_OFS_CONNS = 12
+_OFS_ITEMTYPE = 16
+_OFS_NUMSLOTS = 32
+_OFS_COUNT = 40
+
+# The table is considered full when this fraction of slots is in use.
+_MAX_LOAD = 0.75
+
+DEFAULT_SLOTS = 1 << 22 # 32 MB file, sparse on most filesystems
+DEFAULT_MAX_ITEMS = int(DEFAULT_SLOTS * _MAX_LOAD)
+
+
+def fingerprint(item):
+    """Returns a non-zero 64-bit integer fingerprint of the item."""
+    if not isinstance(item, str):
+        item = repr(item)
+    return fingerprintOfString(item) or 1
+
+
+class MmapTabuList(object):
+
+    def __init__(self, filename, itemtype=None, maxitems=None):
+        """Opens the tabulist in the file, creating it if necessary.
+
+        itemtype and maxitems are only used when the file is created.
+        If the file exists and itemtype is given, it must match the
+        one in the file.
+        """
+        self._filename = filename
+        self._fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0666)
+        self._lock()
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                self._initFile(itemtype or "", maxitems or DEFAULT_MAX_ITEMS)
+            self._mmap = mmap.mmap(self._fd, _HEADER_SIZE)
+            if self._mmap[:len(MAGIC)] != MAGIC:
+                raise ValueError("'%s' is not a shared tabulist file"
+                                 % (filename,))
+            if self._getUInt32(_OFS_VERSION) != FORMAT_VERSION:
+                raise ValueError("Unsupported shared tabulist version in '%s'"
+                                 % (filename,))
+            self._numslots = self._getUInt64(_OFS_NUMSLOTS)
+            self._mmap.close()
+            self._mmap = mmap.mmap(self._fd, _HEADER_SIZE +
+                                   self._numslots * _SLOT_SIZE)
+            self._itemtype = self._mmap[_OFS_ITEMTYPE:_OFS_NUMSLOTS]\
+                             .rstrip("\0")
+            if itemtype is not None and itemtype != self._itemtype:
+                raise ValueError("Shared tabulist '%s' contains '%s' items, "
+                                 "not '%s'" % (filename, self._itemtype,
+                                               itemtype))
+            self._connNum = self._getUInt32(_OFS_CONNS) + 1
+            struct.pack_into("<I", self._mmap, _OFS_CONNS, self._connNum)
+        finally:
+            self._unlock()
+        self._mask = self._numslots - 1
+        self._maxCount = int(self._numslots * _MAX_LOAD)
+
+    def _initFile(self, itemtype, maxitems):
+        # a power of two that keeps the load under _MAX_LOAD
+        numslots = 2
+        while numslots * _MAX_LOAD < maxitems:
+            numslots <<= 1
+        if len(itemtype) > _OFS_NUMSLOTS - _OFS_ITEMTYPE:
+            raise ValueError("Too long item type: %s" % (itemtype,))
+        os.ftruncate(self._fd, _HEADER_SIZE + numslots * _SLOT_SIZE)
+        header = struct.pack("<8sII16sQQ", MAGIC, FORMAT_VERSION, 0,
+                             itemtype, numslots, 0)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, header)
+
+    def _lock(self):
+        if fcntl is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+
+    def _unlock(self):
+        if fcntl is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _getUInt32(self, offset):
+        return struct.unpack_from("<I", self._mmap, offset)[0]
+
+    def _getUInt64(self, offset):
+        return struct.unpack_from("<Q", self._mmap, offset)[0]
+
+    def _findSlot(self, fp):
+        """Returns the offset of the slot that contains fp or of the
+        empty slot where fp would be inserted. Returns None if the
+        table is full and fp is not found."""
+        mm = self._mmap
+        mask = self._mask
+        pos = fp & mask
+        for i in xrange(self._numslots):
+            offset = _HEADER_SIZE + pos * _SLOT_SIZE
+            slot = struct.unpack_from("<Q", mm, offset)[0]
+            if slot == fp or slot == 0:
+                return offset
+            pos = (pos + 1) & mask
+        return None
+
+    def _containsFingerprint(self, fp):
+        offset = self._findSlot(fp)
+        return offset is not None and self._getUInt64(offset) == fp
+
+    def _addFingerprints(self, fps):
+        """Adds the fingerprints, returns the number of them that did not
+        fit in the table."""
+        dropped = 0
+        self._lock()
+        try:
+            count = self._getUInt64(_OFS_COUNT)
+            for fp in fps:
+                offset = self._findSlot(fp)
+                if offset is None or self._getUInt64(offset) == fp:
+                    continue
+                if count >= self._maxCount:
+                    dropped += 1
+                    continue
+                struct.pack_into("<Q", self._mmap, offset, fp)
+                count += 1
+            struct.pack_into("<Q", self._mmap, _OFS_COUNT, count)
+        finally:
+            self._unlock()
+        return dropped
+
+    def add(self, item):
+        return self._addFingerprints([fingerprint(item)])
+
+    def addMany(self, items):
+        return self._addFingerprints([fingerprint(i) for i in items])
+
+    def __contains__(self, item):
+        return self._containsFingerprint(fingerprint(item))
+
+    def tabunessOf(self, items):
+        """ Eg. If the 3 first items are tabu and the last one is not,
+            returns: (True,True,True,False)
+        """
+        return tuple([self._containsFingerprint(fingerprint(i))
+                      for i in items])
+
+    def __len__(self):
+        return self._getUInt64(_OFS_COUNT)
+    len = __len__
+
+    def capacity(self):
+        return self._maxCount
+
+    def connNum(self):
+        return self._connNum
+
+    def getItemType(self):
+        return self._itemtype
+
+    def close(self):
+        self._mmap.close()
+        os.close(self._fd)
@@ -1,8 +1,28 @@
 
 """ TabuList.
     Separate implementations for LimitedTabuList and UnlimitedTabuList.
+
+    FingerprintTabuList is a TabuList for non-negative 64-bit integer
+    items, such as the fingerprints returned by the fingerprint() methods
+    of states, actions and transitions. It stores the items in compact
+    arrays instead of Python lists.
+
+    IndexTabuList is a TabuList for small non-negative integer items,
+    such as indices of transitions. An unlimited one is a bitset.
 """
 
+import sys
+from array import array
+
+# array type for 64-bit unsigned integers. 'L' is 32 bits on some
+# platforms, use plain lists there.
+if array('L').itemsize >= 8:
+    def _intArray(size=0):
+        return array('L',[0])*size
+else:
+    def _intArray(size=0):
+        return [0]*size
+
 class TabuList(object):
     """ TabuList contains some items, added with the add() method.
         TabuList can be pushed and popped. A pop restores the tabulist to
@@ -279,3 +299,285 @@ class LimitedTabuList(TabuList):
     def __str__(self):
         return "[%s]" % ", ".join([str(item) for item in self])
 
+
+class FingerprintTabuList(TabuList):
+    """ FingerprintTabuList has the same interface as TabuList, but its
+        items must be integers in range 0..2**64-1.
+
+        In addition to the TabuList interface:
+            memoryUsage()
+    """
+
+    def __new__(cls, max_size=None):
+        """ Returns a FingerprintTabuList.
+            max_size is a natural number -> LimitedFingerprintTabuList
+            max_size is anything else (or omitted) ->
+                UnlimitedFingerprintTabuList
+        """
+        try:
+            max_size = int(max_size)
+        except:
+            max_size = None
+
+        if max_size is None or max_size < 0:
+            return object.__new__(UnlimitedFingerprintTabuList)
+        else:
+            return object.__new__(LimitedFingerprintTabuList)
+
+    def memoryUsage(self):
+        """Returns the approximate number of bytes used by the tabulist."""
+        raise NotImplementedError()
+
+
+class UnlimitedFingerprintTabuList(FingerprintTabuList):
+    """ Unlimited tabulist of integer items.
+
+        The items are in a set for searching and in an array in the order
+        they were added. A pop removes the items added after the
+        corresponding push from the end of the array.
+    """
+    def __init__(self,max_size=None):
+        self.clear()
+
+    def clear(self):
+        self._currItems = set()
+        # new items in the order they were added
+        self._added = _intArray()
+        # _pushStack[N] is the len of _added when push level N+1 started
+        self._pushStack = []
+
+    def add(self,item):
+        if item not in self._currItems:
+            self._currItems.add(item)
+            self._added.append(item)
+
+    def __contains__(self,item):
+        return item in self._currItems
+
+    def __len__(self):
+        return len(self._currItems)
+    lenUnique = __len__
+
+    def push(self):
+        self._pushStack.append(len(self._added))
+
+    def pop(self):
+        if not self._pushStack:
+            raise ValueError("Can't pop a non-pushed TabuList!")
+        start = self._pushStack.pop()
+        added = self._added
+        remove = self._currItems.remove
+        for i in xrange(start,len(added)):
+            remove(added[i])
+        del added[start:]
+
+    def __iter__(self):
+        return self._currItems.__iter__()
+
+    def memoryUsage(self):
+        return (sys.getsizeof(self._currItems) +
+                sys.getsizeof(self._added) +
+                sys.getsizeof(self._pushStack))
+
+    def __str__(self):
+        return "{%s}" % ", ".join([str(item) for item in self])
+
+
+class LimitedFingerprintTabuList(FingerprintTabuList):
+    """ Limited tabulist of integer items.
+
+        Works like LimitedTabuList: contains maximum of 'max_size' items,
+        possibly multiple equal ones, and a full tabulist forgets its
+        oldest item when a new one is added.
+
+        The items are in a preallocated ring buffer. When pushed, the
+        overwritten items are saved in an undo array so that a pop can
+        put them back.
+    """
+
+    def __init__(self,max_size):
+        self.MAX_SIZE = max_size
+        self.clear()
+
+    def clear(self):
+        self._ring = _intArray(self.MAX_SIZE)
+        self._start = 0 # position of the oldest item
+        self._size = 0
+        # items overwritten while pushed, in overwrite order
+        self._overwritten = _intArray()
+        # _pushStack[N] is (_size, len(_overwritten)) when push level N+1
+        # started
+        self._pushStack = []
+        # key: item, value: how many of those items there are
+        self._currItems = {}
+
+    def add(self,item):
+        if self.MAX_SIZE == 0:
+            return
+        currItems = self._currItems
+        if self._size == self.MAX_SIZE:
+            # full, overwrite the oldest item
+            oldest = self._ring[self._start]
+            self._ring[self._start] = item
+            self._start = (self._start + 1) % self.MAX_SIZE
+            if self._pushStack:
+                self._overwritten.append(oldest)
+            if currItems[oldest] == 1:
+                del currItems[oldest]
+            else:
+                currItems[oldest] -= 1
+        else:
+            self._ring[(self._start + self._size) % self.MAX_SIZE] = item
+            self._size += 1
+        currItems[item] = currItems.get(item,0) + 1
+
+    def _forget(self,item):
+        if self._currItems[item] == 1:
+            del self._currItems[item]
+        else:
+            self._currItems[item] -= 1
+
+    def __contains__(self,item):
+        return item in self._currItems
+
+    def __len__(self):
+        return len(self._currItems)
+    lenUnique = __len__
+
+    def lenInclDuplicates(self):
+        return self._size
+
+    def push(self):
+        self._pushStack.append( (self._size,len(self._overwritten)) )
+
+    def pop(self):
+        if not self._pushStack:
+            raise ValueError("Can't pop a non-pushed TabuList!")
+        size,numOverwritten = self._pushStack.pop()
+        currItems = self._currItems
+        ring = self._ring
+        # on each push level the ring first fills up and is then
+        # overwritten, so undo in the reverse order: overwrites first.
+        overwritten = self._overwritten
+        for i in xrange(len(overwritten)-1,numOverwritten-1,-1):
+            self._start = (self._start - 1) % self.MAX_SIZE
+            self._forget(ring[self._start])
+            old = overwritten[i]
+            ring[self._start] = old
+            currItems[old] = currItems.get(old,0) + 1
+        del overwritten[numOverwritten:]
+        # then the items appended to a non-full ring
+        while self._size > size:
+            self._size -= 1
+            self._forget(ring[(self._start + self._size) % self.MAX_SIZE])
+
+    def __iter__(self):
+        return self._currItems.__iter__()
+    iterUnique = __iter__
+
+    def iterInclDuplicates(self):
+        """Yields all the items from oldest to newest."""
+        for i in xrange(self._size):
+            yield self._ring[(self._start + i) % self.MAX_SIZE]
+
+    def memoryUsage(self):
+        return (sys.getsizeof(self._ring) +
+                sys.getsizeof(self._overwritten) +
+                sys.getsizeof(self._currItems) +
+                sys.getsizeof(self._pushStack))
+
+    def __str__(self):
+        return "[%s]" % ", ".join([str(item) for item in self])
+
+
+class IndexTabuList(TabuList):
+    """ IndexTabuList has the same interface as TabuList, but its items
+        must be non-negative integers. The memory used by an unlimited
+        one is proportional to the largest item.
+    """
+
+    def __new__(cls, max_size=None):
+        """ Returns a tabulist for integer items.
+            max_size is a natural number -> LimitedFingerprintTabuList
+            max_size is anything else (or omitted) -> BitsetTabuList
+        """
+        try:
+            max_size = int(max_size)
+        except:
+            max_size = None
+
+        if max_size is None or max_size < 0:
+            return object.__new__(BitsetTabuList)
+        else:
+            return LimitedFingerprintTabuList(max_size)
+
+
+class BitsetTabuList(IndexTabuList):
+    """ Unlimited tabulist of integer items in a bitset.
+
+        The number of set bits is kept up to date, so len() is cheap.
+        Items added while pushed are saved in an array so that a pop
+        can clear their bits.
+    """
+    def __init__(self,max_size=None):
+        self.clear()
+
+    def clear(self):
+        self._bits = bytearray()
+        self._len = 0
+        # items added while pushed, in the order they were added
+        self._added = _intArray()
+        # _pushStack[N] is the len of _added when push level N+1 started
+        self._pushStack = []
+
+    def add(self,item):
+        byte = item >> 3
+        bit = 1 << (item & 7)
+        bits = self._bits
+        if byte >= len(bits):
+            bits.extend(bytearray(max(byte + 1 - len(bits), len(bits))))
+        elif bits[byte] & bit:
+            return
+        bits[byte] |= bit
+        self._len += 1
+        if self._pushStack:
+            self._added.append(item)
+
+    def __contains__(self,item):
+        byte = item >> 3
+        return byte < len(self._bits) and \
+            self._bits[byte] & (1 << (item & 7)) != 0
+
+    def __len__(self):
+        return self._len
+    lenUnique = __len__
+
+    def push(self):
+        self._pushStack.append(len(self._added))
+
+    def pop(self):
+        if not self._pushStack:
+            raise ValueError("Can't pop a non-pushed TabuList!")
+        start = self._pushStack.pop()
+        added = self._added
+        bits = self._bits
+        for i in xrange(start,len(added)):
+            item = added[i]
+            bits[item >> 3] &= ~(1 << (item & 7))
+        self._len -= len(added) - start
+        del added[start:]
+
+    def __iter__(self):
+        for byte,value in enumerate(self._bits):
+            if value:
+                for bit in xrange(8):
+                    if value & (1 << bit):
+                        yield (byte << 3) | bit
+
+    def memoryUsage(self):
+        return (sys.getsizeof(self._bits) +
+                sys.getsizeof(self._added) +
+                sys.getsizeof(self._pushStack))
+
+    def __str__(self):
+        return "{%s}" % ", ".join([str(item) for item in self])
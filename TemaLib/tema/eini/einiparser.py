@@ -33,6 +33,11 @@ initial_state: 1
 """
 
 import re
+import cPickle
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import md5
 
 # ??? this DIFFERS from EINI-BNF:
 # NAME is allowed to start with a number and _, because otherwise
@@ -75,8 +80,10 @@ EPE_sfderror="STR_FIELD_DEFINITION expected."
 EPE_field_numbers="Data row should have %s fields. Found %s."
 EPE_syntax_error="Syntax error."
 
-comment_hash = re.compile("#[^\n]*")
-comment_multiline = re.compile("/\*.*?\*/",re.DOTALL) # TODO! test '/' in /* */
+# Both kinds of comments in one pattern. A '#' inside /* */ and a '/*'
+# after '#' do not start a comment. An unterminated /* comment lasts
+# until the end of the file.
+comment = re.compile("#[^\n]*|/\*.*?(?:\*/|\Z)",re.DOTALL)
 
 def error(line,errmsg):
     raise EiniParserException("Eini parser error\n\ton line: '%s'\n\t%s"
@@ -84,45 +91,45 @@ def error(line,errmsg):
 
 
 def remove_comments(s):
-    i=0
-    len_s=len(s)
-    results=[]
-    while i < len_s:
-        if s[i]=='#':
-            i+=1
-            while (i<len_s) and (s[i]!='\n'): i+=1
-        elif s[i:i+2]=='/*':
-            i+=2
-            while (i<len_s) and (s[i:i+2]!='*/'): i+=1
-            if s[i:i+2]=='*/': i+=2
-        else:
-            results.append(s[i])
-            i+=1
-    return "".join(results)
+    return comment.sub("",s)
+
+_ESCAPE_START=chr(2)
+
+# escape sequence, name of its marker, unescaped value. The sequences
+# are replaced with the markers in this order.
+_ESCAPE_TABLE=[('\\#','hash','#'),
+               ('\\/*','region','/*'),
+               ('\\,','comma',','),
+               ('\\\\','backslash','\\'),
+               ('\\ ','space',' '),
+               ('\\0','emptystring',''),
+               ('\\N/A','N/A',None)]
+
+_ESCAPES=[ (seq,chr(2)+'EINIESCAPED_'+name+chr(3))
+           for seq,name,value in _ESCAPE_TABLE ]
+
+_UNESCAPES=[ (chr(2)+'EINIESCAPED_'+name+chr(3),value)
+             for seq,name,value in _ESCAPE_TABLE if value!=None ]
+
+_NA_MARKER=chr(2)+'EINIESCAPED_N/A'+chr(3)
 
 def escape(s):
-    s=s.replace('\\#',chr(2)+'EINIESCAPED_hash'+chr(3))
-    s=s.replace('\\/*',chr(2)+'EINIESCAPED_region'+chr(3))
-    s=s.replace('\\,',chr(2)+'EINIESCAPED_comma'+chr(3))
-    s=s.replace('\\\\',chr(2)+'EINIESCAPED_backslash'+chr(3))
-    s=s.replace('\\ ',chr(2)+'EINIESCAPED_space'+chr(3))
-    s=s.replace('\\0',chr(2)+'EINIESCAPED_emptystring'+chr(3))
-    s=s.replace('\\N/A',chr(2)+'EINIESCAPED_N/A'+chr(3))
+    if '\\' not in s: return s
+    for seq,marker in _ESCAPES:
+        s=s.replace(seq,marker)
     return s
 
 def unescape(s):
-    if s==chr(2)+'EINIESCAPED_N/A'+chr(3):
+    if _ESCAPE_START not in s:
+        return s
+    if s==_NA_MARKER:
         return None
-    elif chr(2)+'EINIESCAPED_N/A'+chr(3) in s:
+    elif _NA_MARKER in s:
         raise error('\\N/A should be alone.',
                     EPE_syntax_error)
     else:
-        s=s.replace(chr(2)+'EINIESCAPED_hash'+chr(3),'#')
-        s=s.replace(chr(2)+'EINIESCAPED_region'+chr(3),'/*')
-        s=s.replace(chr(2)+'EINIESCAPED_comma'+chr(3),',')
-        s=s.replace(chr(2)+'EINIESCAPED_backslash'+chr(3),'\\')
-        s=s.replace(chr(2)+'EINIESCAPED_space'+chr(3),' ')
-        s=s.replace(chr(2)+'EINIESCAPED_emptystring'+chr(3),'')
+        for marker,value in _UNESCAPES:
+            s=s.replace(marker,value)
         return s
 
 def cleanstr(s):
@@ -137,20 +144,49 @@ class Entity(dict):
     def fields(self):
         return self._fieldname_fieldtype_dict
 
+# md5 of parsed contents -> pickled result, or None if the contents
+# have been parsed only once. Results are pickled only when the same
+# contents are parsed again, because pickling costs a part of parsing.
+_parse_cache={}
+PARSE_CACHE_SIZE=32
+
 class Parser(object):
 
     def _complete(self,contents):
         # adds missing fields with data value None to the elements
         # which do not have fields
-        c=contents
-        for ent in c:
-            ent_fields=c[ent].fields()
-            for dkey in c[ent]:
-                for f in ent_fields:
-                    if c[ent][dkey]==None: c[ent][dkey]={}
-                    if not f in c[ent][dkey]: c[ent][dkey][f]=None
+        for entity in contents.itervalues():
+            ent_fields=entity.fields()
+            field_count=len(ent_fields)
+            for dkey,instance in entity.iteritems():
+                if instance==None:
+                    instance=entity[dkey]={}
+                # instances have only declared fields, so only the
+                # ones with fewer fields need completing
+                if len(instance)!=field_count:
+                    for f in ent_fields:
+                        if not f in instance: instance[f]=None
 
     def parse(self,fileobj):
+        """Parses the contents of fileobj. The result of parsing the
+        same contents again is unpickled from a cache."""
+        contents=fileobj.read()
+        if not isinstance(contents,str):
+            return self._parse(contents)
+
+        digest=md5(contents).digest()
+        if _parse_cache.get(digest)!=None:
+            return cPickle.loads(_parse_cache[digest])
+        result=self._parse(contents)
+        if digest in _parse_cache:
+            _parse_cache[digest]=cPickle.dumps(result,2)
+        else:
+            if len(_parse_cache)>=PARSE_CACHE_SIZE:
+                _parse_cache.clear()
+            _parse_cache[digest]=None
+        return result
+
+    def _parse(self,contents):
 
         def add_field(entityname,fieldname,fieldtype,d):
             """adds field to dictionary d of an entity"""
@@ -168,87 +204,95 @@ class Parser(object):
         # end of add_field
 
         result={}
-        uncommented = remove_comments(escape(fileobj.read()))
+        uncommented = remove_comments(escape(contents))
 
         current_entity=None
         current_field_type=None
         current_fields=[]
 
+        # Headers start with '[' and field definitions contain ':',
+        # other lines are instance lists. Only the matching regex is
+        # tried.
         for line in uncommented.split('\n'):
             line=line.strip()
 
             if line=="": continue
-            
-            m=NO_FIELD_HEADER.match(line)
-            if m:
-                current_entity=m.group(1)
-                current_field_type=None
-                current_fields=[]
-                add_field(current_entity,None,None,result)
-                continue
-            
-            m=LIST_FIELD_HEADER.match(line)
-            if m:
-                current_entity=m.group(1)
-                current_field_type=list
-                current_fields=[m.group(2)]
-                add_field(current_entity,m.group(2),current_field_type,result)
-                continue
-
-            m=STR_FIELD_HEADER.match(line)
-            if m:
-                current_entity=m.group(1)
-                current_field_type=str
-                current_fields=[]
-                if m.group(2)==None: # no fields: [only_entity]
+
+            if line[0]=='[':
+                m=NO_FIELD_HEADER.match(line)
+                if m:
+                    current_entity=m.group(1)
+                    current_field_type=None
                     current_fields=[]
                     add_field(current_entity,None,None,result)
-                else: # at least one field: [entity:field1,field2]
-                    for fieldspec in m.group(2)[1:].split(PURE_FSEP):
-                        this_field=fieldspec.strip()
-                        current_fields.append(fieldspec.strip())
-                        add_field(current_entity,this_field,str,result)
-                        del this_field
-                if not current_entity in result: result[current_entity]={}
-                continue
-
-            m=INSTANCE_LIST.match(line)
-            if m:
-                if current_field_type!=None:
-                    error(line,EPE_syntax_error)
-                for fieldspec in m.group(0).split(PURE_FSEP):
-                    this_field=fieldspec.strip()
-                    if not this_field in result[current_entity]:
-                        result[current_entity][this_field]={}
-                continue
-
-            m=X_FIELD_DEFINITION.match(line)
-            if m:
-                data_key=m.group(1).strip()
-                if not data_key in result[current_entity]:
-                    result[current_entity][data_key]={}
-                if current_field_type==str:
-                    # try to read STR_FIELD_DEFINITION
-                    if m.group(2).strip()=="":
-                        error(line,EPE_sfderror)
-                    field_data=FSEPre.split(m.group(2))
-                    if len(field_data)!=len(current_fields):
-                        error(line,EPE_field_numbers % (len(current_fields),
-                                                        len(field_data)))
-                    for i,value in enumerate(field_data):
-                        result[current_entity][data_key][current_fields[i]]=cleanstr(value)
                     continue
-                if current_field_type==list:
-                    # try to read LIST_FIELD_DEFINITION
-                    if not current_fields[0] in result[current_entity][data_key]:
-                        result[current_entity][data_key][current_fields[0]]=[]
-                    field_data=FSEPre.split(m.group(2))
-                    for value in field_data:
-                        if value.strip()=='': continue
-                        result[current_entity][data_key][current_fields[0]].append(
-                            cleanstr(value))
+
+                m=LIST_FIELD_HEADER.match(line)
+                if m:
+                    current_entity=m.group(1)
+                    current_field_type=list
+                    current_fields=[m.group(2)]
+                    add_field(current_entity,m.group(2),current_field_type,result)
                     continue
-                assert("code should have continued before this line"==0)
+
+                m=STR_FIELD_HEADER.match(line)
+                if m:
+                    current_entity=m.group(1)
+                    current_field_type=str
+                    current_fields=[]
+                    if m.group(2)==None: # no fields: [only_entity]
+                        current_fields=[]
+                        add_field(current_entity,None,None,result)
+                    else: # at least one field: [entity:field1,field2]
+                        for fieldspec in m.group(2)[1:].split(PURE_FSEP):
+                            this_field=fieldspec.strip()
+                            current_fields.append(fieldspec.strip())
+                            add_field(current_entity,this_field,str,result)
+                            del this_field
+                    if not current_entity in result: result[current_entity]={}
+                    continue
+
+            elif not PURE_ESEP in line:
+                m=INSTANCE_LIST.match(line)
+                if m:
+                    if current_field_type!=None:
+                        error(line,EPE_syntax_error)
+                    for fieldspec in m.group(0).split(PURE_FSEP):
+                        this_field=fieldspec.strip()
+                        if not this_field in result[current_entity]:
+                            result[current_entity][this_field]={}
+                    continue
+
+            else:
+                m=X_FIELD_DEFINITION.match(line)
+                if m:
+                    data_key=m.group(1).strip()
+                    entity=result[current_entity]
+                    if not data_key in entity:
+                        entity[data_key]={}
+                    instance=entity[data_key]
+                    if current_field_type==str:
+                        # try to read STR_FIELD_DEFINITION
+                        if m.group(2).strip()=="":
+                            error(line,EPE_sfderror)
+                        field_data=FSEPre.split(m.group(2))
+                        if len(field_data)!=len(current_fields):
+                            error(line,EPE_field_numbers % (len(current_fields),
+                                                            len(field_data)))
+                        for i,value in enumerate(field_data):
+                            instance[current_fields[i]]=cleanstr(value)
+                        continue
+                    if current_field_type==list:
+                        # try to read LIST_FIELD_DEFINITION
+                        if not current_fields[0] in instance:
+                            instance[current_fields[0]]=[]
+                        values=instance[current_fields[0]]
+                        field_data=FSEPre.split(m.group(2))
+                        for value in field_data:
+                            if value.strip()=='': continue
+                            values.append(cleanstr(value))
+                        continue
+                    assert("code should have continued before this line"==0)
             error(line,EPE_syntax_error)
         self._complete(result)
         return result
@@ -44,6 +44,10 @@ class State(model.State):
 		self._model = filterModel
 
 
+	def fingerprint(self):
+		return self._state.fingerprint()
+
+
 	def getOutTransitions(self):
 		"""Returns list of transitions that leaves the state."""
 		if self._outTransitions == None:
@@ -56,13 +60,30 @@ class State(model.State):
 
 
 class FilterModel(model.Model):
+	"""
+	Leaves the transitions with forbidden actions out of another
+	model. If the other model implements setForbiddenActions and
+	getForbiddenActions (like ParallelModel does), the forbidden
+	actions are added to its own and its states are used as they are.
+	Otherwise the states of the other model are wrapped and their out
+	transitions filtered.
+
+	The FilterModel owns the other model: while it is wrapped, it is
+	filtered also when used directly. Its own forbidden actions are
+	given back to it when another model is loaded or releaseModel is
+	called.
+	"""
 	def __init__(self, modelObject=None, forbiddenActions=None):
 		self._stateCache = {}
 		self._model = modelObject
+		# the forbidden actions of the other model before pushing down
+		self._innerForbidden = None
+		self._pushed = False
 		if forbiddenActions != None:
 			self._forbidden = frozenset(forbiddenActions)
 		else:
 			self._forbidden = None
+		self._pushForbiddenActions()
 
 
 	def clearCache(self):
@@ -73,18 +94,52 @@ class FilterModel(model.Model):
 
 	def loadFromObject(self, modelObject):
 		self.clearCache()
+		self._restoreForbiddenActions()
 		self._model = modelObject
+		self._pushForbiddenActions()
+
+
+	def releaseModel(self):
+		"""Gives the other model its own forbidden actions back and
+		returns it. The FilterModel has no model after this."""
+		self.clearCache()
+		self._restoreForbiddenActions()
+		modelObject, self._model = self._model, None
+		self._pushedDown = False
+		return modelObject
 
 
 	def setForbiddenActions(self, forbiddenActions):
 		self._forbidden = frozenset(forbiddenActions)
+		self._stateCache.clear()
+		self._pushForbiddenActions()
 
 
 	def getForbiddenActions(self):
 		return self._forbidden
 
 
+	def _pushForbiddenActions(self):
+		self._pushedDown = self._model != None and \
+		    hasattr(self._model, "setForbiddenActions")
+		if self._pushedDown and self._forbidden != None:
+			if not self._pushed:
+				self._innerForbidden = self._model.getForbiddenActions()
+				self._pushed = True
+			self._model.setForbiddenActions(
+				self._forbidden | (self._innerForbidden or frozenset()))
+
+
+	def _restoreForbiddenActions(self):
+		if self._pushed:
+			self._model.setForbiddenActions(self._innerForbidden or ())
+			self._innerForbidden = None
+			self._pushed = False
+
+
 	def getInitialState(self):
+		if self._pushedDown:
+			return self._model.getInitialState()
 		return self._newState(self._model.getInitialState())
 
 
@@ -102,9 +157,10 @@ class FilterModel(model.Model):
 
 
 	def _getOutTransitions(self, state):
+		forbidden = self._forbidden or ()
 		return [Transition(self._newState(transition.getSourceState()), transition.getAction(), self._newState(transition.getDestState())) \
                         for transition in state.getOutTransitions() \
-                        if str(transition.getAction()) not in self._forbidden]
+                        if str(transition.getAction()) not in forbidden]
 
 
 
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2006-2010 Tampere University of Technology
+# 
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# 
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Distance heuristic for guided search in parallel lsts models.
+
+The heuristic estimates how many transitions of the composed model have
+to be executed before one of the target actions can be executed. The
+estimate is computed from the components of the model (a pattern
+database): for each component action that takes part in a rule
+resulting in a target action, the shortest distances from every state
+of the component to the states where the action is enabled are computed
+once, with a backwards breadth first search in the component.
+
+A transition of the composed model executes at most one transition in
+each component. So a composed state is at least as far from a rule as
+the farthest of the participating components is from its action, and
+the estimate for a set of target actions is the minimum of those over
+their rules. The estimate never exceeds the real distance and decreases
+by at most one per transition (it is admissible and consistent), so a
+best-first search ordered by path length + estimate (A*) still finds
+the shortest paths.
+
+Usage:
+
+    heuristic = distanceHeuristic(model) # None if not a parallel lsts model
+    estimate = heuristic.getEstimator(["action name", ...])
+    estimate(state) # a natural number or INFINITY
+"""
+
+from array import array
+from collections import deque
+
+# the estimate for the states from which no target action can be reached
+INFINITY = 2**31-1
+
+class DistanceHeuristic(object):
+    def __init__(self,model):
+        self._actionmapper = model.getLstsList()
+        # _transitions[N] are the out transitions of the states of component N
+        self._transitions = []
+        self._predecessors = []
+        componentOfAction = {}
+        for num,(name,lstsobj) in enumerate(model.getLstsList()):
+            transitions = lstsobj.get_transitions()
+            self._transitions.append(transitions)
+            self._predecessors.append(None)
+            for outTransitions in transitions:
+                for dest,action in outTransitions:
+                    componentOfAction[action] = num
+        # result action -> the rules resulting in it, as tuples of
+        # (component, action) pairs
+        self._rulesByResult = {}
+        for rule in model.getRuleList():
+            pairs = []
+            for action in rule.getSynchronousActions():
+                if action not in componentOfAction:
+                    # no transitions with the action, the rule is never
+                    # enabled
+                    break
+                pairs.append((componentOfAction[action],action))
+            else:
+                self._rulesByResult.setdefault(
+                    rule.getResult(),set()).add(tuple(pairs))
+        # (component, action) -> distances from the states of the
+        # component to the states where the action is enabled
+        self._distanceTables = {}
+
+    def _getPredecessors(self,component):
+        predecessors = self._predecessors[component]
+        if predecessors is None:
+            transitions = self._transitions[component]
+            predecessors = [ [] for s in transitions ]
+            for source,outTransitions in enumerate(transitions):
+                for dest,action in outTransitions:
+                    predecessors[dest].append(source)
+            self._predecessors[component] = predecessors
+        return predecessors
+
+    def getDistanceTable(self,component,action):
+        """Returns an array whose Nth item is the length of the shortest
+        path from state N of the component to a state where the action
+        is enabled, or INFINITY if there is no such path."""
+        try:
+            return self._distanceTables[(component,action)]
+        except KeyError:
+            pass
+        transitions = self._transitions[component]
+        predecessors = self._getPredecessors(component)
+        distances = array('l',[INFINITY])*len(transitions)
+        waiting = deque()
+        for state,outTransitions in enumerate(transitions):
+            for dest,a in outTransitions:
+                if a == action:
+                    distances[state] = 0
+                    waiting.append(state)
+                    break
+        while waiting:
+            state = waiting.popleft()
+            d = distances[state] + 1
+            for p in predecessors[state]:
+                if distances[p] > d:
+                    distances[p] = d
+                    waiting.append(p)
+        self._distanceTables[(component,action)] = distances
+        return distances
+
+    def getEstimator(self,actionNames):
+        """Returns a function that estimates the number of transitions
+        to execute from a state of the model before one of the actions
+        can be executed. The estimates are cached by state."""
+        rules = set()
+        for name in actionNames:
+            try:
+                result = self._actionmapper.act2int(name)
+            except KeyError:
+                continue
+            rules.update(self._rulesByResult.get(result,()))
+        patterns = [ tuple([ (c,self.getDistanceTable(c,a)) for c,a in rule ])
+                     for rule in rules ]
+        cache = {}
+        def estimate(state):
+            key = str(state)
+            try:
+                return cache[key]
+            except KeyError:
+                pass
+            localStates = [ s._id for s in state._id ]
+            best = INFINITY
+            for pattern in patterns:
+                farthest = 0
+                for c,distances in pattern:
+                    d = distances[localStates[c]]
+                    if d > farthest:
+                        farthest = d
+                        if farthest >= best:
+                            break
+                if farthest < best:
+                    best = farthest
+                    if best == 0:
+                        break
+            cache[key] = best
+            return best
+        return estimate
+
+def distanceHeuristic(model):
+    """Returns the DistanceHeuristic of the model, or None if the model
+    is not a parallel lsts model. It is created only once per model."""
+    if not hasattr(model,"getLstsList"):
+        return None
+    try:
+        return model._distanceHeuristic
+    except AttributeError:
+        model._distanceHeuristic = DistanceHeuristic(model)
+        return model._distanceHeuristic
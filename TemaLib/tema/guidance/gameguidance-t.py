@@ -83,7 +83,8 @@ class GuidanceT(GuidanceBase):
             raise Exception("Invalid parameter '%s' for gameguidance." % parametername)
         GuidanceBase.setParameter(self,parametername,parametervalue)
         if parametername=='randomseed':
-            self._rndchoose=random.Random(parametervalue).choice
+            self._random=random.Random(parametervalue)
+            self._rndchoose=self._random.choice
 
     def prepareForRun(self):
         GuidanceBase.prepareForRun(self)
@@ -36,6 +36,24 @@ GameGuidance reads the following parameter values:
   route will be recalculated when rerouteafter steps have been taken
   (or when execution has run out of the previous route in any case)
 
+- reduction (0 or 1, default: 0)
+
+  with a parallel lsts model and requirements that give execution
+  hints, only the transitions in the stubborn sets for reaching the
+  hinted actions are explored (see stubbornsets)
+
+- macros (0 or 1, default: 0)
+
+  the chains of transitions without branches and keywords are explored
+  as one step (see macrotransitions), so lookahead is about the number
+  of keywords instead of the number of transitions
+
+- processes (natural number, default: 1)
+
+  the number of worker processes that plan routes in parallel. The
+  transitions from the current state are divided between them, and
+  the best route of the workers is chosen (see parallelsearch)
+
 """
 
 # TODO
@@ -52,6 +70,10 @@ GameGuidance reads the following parameter values:
 
 
 from tema.guidance.guidance import Guidance as GuidanceBase
+from tema.guidance.stubbornsets import stubbornSets
+from tema.guidance.macrotransitions import macroTransitions, \
+    transitionsOf, expandTransitions
+from tema.guidance.parallelsearch import parallelSearch
 import random
 import time # for random seed initialization
 
@@ -67,16 +89,22 @@ class Guidance(GuidanceBase):
         self.setParameter('lookahead',15)
         self.setParameter('randomseed',time.time())
         self.setParameter('rerouteafter',1)
+        self.setParameter('reduction',0)
+        self.setParameter('macros',0)
+        self.setParameter('processes',1)
         self._lastroute=[]
         self._steps_to_reroute=0
+        self._successors=lambda state: state.getOutTransitions()
 
     def setParameter(self,parametername,parametervalue):
-        if not parametername in ['lookahead','randomseed','rerouteafter']:
+        if not parametername in ['lookahead','randomseed','rerouteafter',
+                                 'reduction','macros','processes']:
             print __doc__
             raise Exception("Invalid parameter '%s' for gameguidance." % parametername)
         GuidanceBase.setParameter(self,parametername,parametervalue)
         if parametername=='randomseed':
-            self._rndchoose=random.Random(parametervalue).choice
+            self._random=random.Random(parametervalue)
+            self._rndchoose=self._random.choice
         elif parametername=='rerouteafter':
             self._steps_to_reroute=self.getParameter(parametername)
 
@@ -96,7 +124,11 @@ class Guidance(GuidanceBase):
                 self.log("There is only one possible action: %s" % self._lastroute[-1].getAction())
             else:
                 self.log("Rerouting...")
-                points,self._lastroute = self._plan_route(state_object,self.getParameter('lookahead'))
+                self._successors=self._successor_function()
+                points,route = self._plan(state_object,self.getParameter('lookahead'))
+                # the route is in reverse order, and so are the
+                # transitions of its macro transitions
+                self._lastroute = expandTransitions(route[::-1])[::-1]
                 self._steps_to_reroute=self.getParameter('rerouteafter')
                 
                 log_actions=[t.getAction().toString() for t in self._lastroute[::-1]]
@@ -109,12 +141,61 @@ class Guidance(GuidanceBase):
         self._steps_to_reroute-=1
         return next_transition.getAction()
 
-    def _plan_route(self,state_object,depth):
+    def _successor_function(self):
+        """Returns the function that gives the transitions to explore
+        from a state. With macros, they are macro transitions."""
+        successors=None
+        if int(self.getParameter('reduction')):
+            reduction=stubbornSets(self._testmodel)
+            targets=self.getHintedActions()
+            if reduction is not None and targets:
+                successors=reduction.getSuccessorFunction(targets)
+        if int(self.getParameter('macros')):
+            return macroTransitions(self._testmodel).getSuccessorFunction(
+                successors)
+        if successors is None:
+            return lambda state: state.getOutTransitions()
+        return successors
+
+    def _plan(self,state_object,depth):
+        """Returns a pair (points, path) like _plan_route. With processes,
+        the routes beginning with different transitions are planned in
+        different processes, and the path consists of transitions of the
+        model.
+        """
+        processes=int(self.getParameter('processes'))
+        if processes<=1 or depth<=0:
+            return self._plan_route(state_object,depth)
+
+        def search(transitions):
+            points,route=self._plan_route(state_object,depth,transitions)
+            # the route is in reverse order
+            return (points,len(route)),expandTransitions(route[::-1])
+
+        results=parallelSearch(search,state_object,
+                               self._successors(state_object),processes)
+        self.log("Planned routes in %s processes" % len(results))
+        finishing=[ (length,route) for (points,length),route in results
+                    if points[0]==Guidance.FINISHPOINTS ]
+        if finishing:
+            minlen=min([ length for length,route in finishing ])
+            route=self._rndchoose([ route for length,route in finishing
+                                    if length==minlen ])
+            return [Guidance.FINISHPOINTS,0],route[::-1]
+        maximumpoints=max([ points for (points,length),route in results ])
+        route=self._rndchoose([ route for (points,length),route in results
+                                if points==maximumpoints ])
+        return maximumpoints,route[::-1]
+
+    def _plan_route(self,state_object,depth,outtrans=None):
         """Returns a pair (points, path) where length of path is the
         parameter depth+1 and points is a pair
         (points_in_the_end_of_path,
         number_of_unnecessary_depth_in_the_end_of_the_path).
         The unnecessary steps do not increase the points.
+        With macros, the path consists of macro transitions.
+        If outtrans is given, only the paths beginning with them are
+        planned.
         """
         # if no look-ahead, return zero points and any out transition
         if depth<=0:
@@ -128,7 +209,8 @@ class Guidance(GuidanceBase):
                 self.log("Deadlock state: %s" % state_object)
                 raise Exception("Unexpected deadlock in the test model.")
 
-        outtrans=state_object.getOutTransitions()
+        if outtrans is None:
+            outtrans=self._successors(state_object)
 
         # Initialize transition point table of length of
         # outtransitions with pairs of zeros. The table contains the
@@ -143,7 +225,8 @@ class Guidance(GuidanceBase):
             # mark transition t executed in every requirement and calc points
             for r in self._requirements:
                 r.push()
-                r.markExecuted(t)
+                for step in transitionsOf(t):
+                    r.markExecuted(step)
                 points[transition_index][0]+=r.getPercentage()
                 
             if int(points[transition_index][0])>=len(self._requirements):
@@ -21,26 +21,47 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 """
-Greedy guidance is a breadth first searching algorithm that
+Greedy guidance is a best first searching algorithm that
 returns the shortest path improving coverage.  If one of the search
 limits is reached, a random path is selected.
 
+With a parallel lsts model, the search is an A* search whose estimate
+of the distance to the actions improving coverage is computed from the
+model components (see distanceheuristic). States from which those
+actions can not be reached are not expanded. With other models, the
+search is breadth first.
+
 Greedy guidance reads the following parameter values:
 
 - max_states (positive integer, default: 10000)
 
-  The number of states the breath search algorithm expands in a single
+  The number of states the search algorithm expands in a single
   search round.
 
 - max_second (positive value, default: 3600)
 
   The maximum amount of time in seconds a single search can last.
+
+- heuristic (0 or 1, default: 1)
+
+  Whether to use the distance estimate with parallel lsts models.
+
+- reduction (0 or 1, default: 0)
+
+  Whether to search only the transitions in the stubborn sets for
+  reaching the target actions with parallel lsts models (see
+  stubbornsets). The paths found are as short as without it.
 """
 
 version='wormguidance based on greedyguidance: 0.beta'
 
 from tema.guidance.guidance import Guidance as GuidanceBase
+from tema.guidance.distanceheuristic import distanceHeuristic, INFINITY
+from tema.guidance.stubbornsets import stubbornSets
 from tema.model.model import Transition
+from collections import deque
+from heapq import heappush, heappop
+from itertools import count
 import random
 import time
 import re
@@ -61,11 +82,65 @@ class StopCondition:
         return rval
         
 
+class BreadthFirstFrontier:
+    """The transitions waiting to be searched, the oldest first. depth
+    is the length of the path to the destination state of a transition,
+    pop returns the (transition, depth) pair."""
+    def __init__(self):
+        self._waiting = deque()
+
+    def push(self, transition, depth):
+        self._waiting.append((transition, depth))
+
+    def pop(self):
+        return self._waiting.popleft()
+
+    def isExhausted(self):
+        return not self._waiting
+
+    def transitions(self):
+        return [ t for t, depth in self._waiting ]
+
+
+class EstimatedFrontier:
+    """The transitions waiting to be searched, the one whose path length
+    plus the estimated distance from its destination state to a target
+    is the smallest first. The transitions from whose destination state
+    no target can be reached are kept separately: there is no need to
+    search them, but they may be selected randomly. The starting state
+    (depth 0) is searched anyway."""
+    def __init__(self, estimate):
+        self._estimate = estimate
+        self._heap = []
+        self._hopeless = []
+        self._counter = count()
+
+    def push(self, transition, depth):
+        h = self._estimate(transition.getDestState())
+        if h == INFINITY and depth > 0:
+            self._hopeless.append(transition)
+        else:
+            # the counter keeps the equally good ones in fifo order
+            heappush(self._heap,
+                     (depth + h, self._counter.next(), depth, transition))
+
+    def pop(self):
+        f, unused, depth, transition = heappop(self._heap)
+        return (transition, depth)
+
+    def isExhausted(self):
+        return not self._heap
+
+    def transitions(self):
+        return [ item[3] for item in self._heap ] + self._hopeless
+
+
 class Guidance(GuidanceBase):
     def __init__(self):
         GuidanceBase.__init__(self)
         self._stored_path=[]
-        self._random_select=random.Random(time.time()).choice
+        self._random=random.Random(time.time())
+        self._random_select=self._random.choice
         self._sleep_ts_re = re.compile(r"SLEEPts.*")
         
     def _search_transition_by_name(self, from_state, a_name):
@@ -89,28 +164,43 @@ class Guidance(GuidanceBase):
             s=rval[0].getSourceState()
         return rval[1:]
 
-    def _breadth_first_search(self, from_state, target_actions):
+    def _new_frontier(self, target_actions):
+        if self._heuristic is None:
+            return BreadthFirstFrontier()
+        return EstimatedFrontier(self._heuristic.getEstimator(target_actions))
+
+    def _successor_function(self, target_actions):
+        if self._reduction is None:
+            return lambda state: state.getOutTransitions()
+        return self._reduction.getSuccessorFunction(target_actions)
+
+    def _best_first_search(self, from_state, target_actions):
         self.setParameter("max_states",self.getParameter("max_states",10000))
         closed={}
-        waiting=[Transition(None,None,from_state)]
+        successors=self._successor_function(target_actions)
+        waiting=self._new_frontier(target_actions)
+        waiting.push(Transition(None,None,from_state), 0)
         stop_condition=StopCondition(self,closed,self._start_time)
         
-        while waiting and not stop_condition() :
-            current_trans = waiting.pop(0)
+        while not waiting.isExhausted() and not stop_condition() :
+            current_trans, depth = waiting.pop()
             current_state = current_trans.getDestState()
-            if  not closed.has_key(str(current_state)) :
-                closed[str(current_state)] = current_trans
-                for trs in current_state.getOutTransitions():
+            current_key = str(current_state)
+            if  not closed.has_key(current_key) :
+                closed[current_key] = current_trans
+                for trs in successors(current_state):
                     if str(trs.getAction()) in target_actions :
                         self._forbiden_set=set()
                         return (self._construct_path_to(trs, closed), True)
-                    elif str(trs.getDestState()) in self._forbiden_set:
+                    dest_key = str(trs.getDestState())
+                    if dest_key in self._forbiden_set:
                         pass
-                    elif closed.has_key(str(trs.getDestState())) :
+                    elif closed.has_key(dest_key) :
                         pass
                     else:
-                        waiting.append(trs)
+                        waiting.push(trs, depth+1)
 
+        waiting = waiting.transitions()
         if waiting :
             trs=self._random_select(waiting)
             #self._forbiden_set = self._forbiden_set | set(closed.keys())
@@ -123,13 +213,13 @@ class Guidance(GuidanceBase):
 
     def _search_engine(self, from_state, target_actions):
         
-        self._stored_path, success = self._breadth_first_search (from_state,\
+        self._stored_path, success = self._best_first_search (from_state,\
                                                         target_actions)
         if success :
             self._search_state = GoodState
         elif ( self._search_state == UglyState and random.random() < 0.25) \
           or not self._stored_path :
-            back_path, success = self._breadth_first_search (from_state,\
+            back_path, success = self._best_first_search (from_state,\
                                           self._to_sleep_actions)
             if success :
                 self._stored_path = back_path
@@ -156,6 +246,12 @@ class Guidance(GuidanceBase):
         self._last_go_back = False
         self._search_state = GoodState
         self._forbiden_set = set()
+        self._heuristic = None
+        if int(self.getParameter("heuristic",1)):
+            self._heuristic = distanceHeuristic(self._testmodel)
+        self._reduction = None
+        if int(self.getParameter("reduction",0)):
+            self._reduction = stubbornSets(self._testmodel)
         self.log("Wormguidance ready for rocking")
 
     def _trslist_to_str(self,path):
@@ -59,6 +59,9 @@ import tema.coverage.coverage as coverage
 import tema.model.model as model
 
 class Guidance:
+    # the own random generator of the guidance, if any
+    _random=None
+
     def __init__(self):
         self._requirements=[]
         self._testmodel=None
@@ -97,6 +100,27 @@ class Guidance:
             raise TypeError("invalid requirement")
         self._requirements.append( requirement )
 
+    def getHintedActions(self):
+        """Returns the names of the actions in the execution hints of the
+        requirements, or None if some requirement gives no hint."""
+        actions=set()
+        for r in self._requirements:
+            try: rex,unused=r.getExecutionHint()
+            except NotImplementedError: return None
+            actions.update(self._testmodel.matchedActions(rex))
+        return actions
+
+    def getRandomState(self):
+        """Returns the state of the own random generator of the
+        guidance, or None if the guidance uses only the random module.
+        Checkpoints store it so that a resumed run makes the same
+        random choices as the original one."""
+        if self._random is None: return None
+        return self._random.getstate()
+
+    def setRandomState(self,state):
+        if state is not None: self._random.setstate(state)
+
     def suggestAction(self,state_object):
         raise NotImplementedError()
 
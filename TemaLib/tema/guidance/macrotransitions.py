@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2006-2010 Tampere University of Technology
+# 
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# 
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Macro transitions for searches that count keywords instead of
+transitions.
+
+Most transitions of a test model do not interact with the system under
+test: they are the internal synchronisations between the components
+and the action words that only lead to keywords. A search that counts
+every transition spends most of its depth on such chains. A macro
+transition starts with a transition of the model and continues it with
+the chain of states that have exactly one out transition whose action
+is not a keyword. It ends in a state that branches, is a deadlock or
+where the only out transition is a keyword. So there is at most one
+keyword in a macro transition, at its beginning, and the length of a
+path of macro transitions is about the number of interactions with the
+system under test.
+
+A macro transition carries the transitions it is made of. The guidances
+mark all of them executed in the coverage requirements and execute them
+one by one: only the search sees the macro transitions.
+
+Usage:
+
+    macros = macroTransitions(model)
+    successors = macros.getSuccessorFunction() # or
+    successors = macros.getSuccessorFunction(other_successor_function)
+    for m in successors(state):
+        m.getTransitions() # the transitions of the model in m
+    expandTransitions(path) # a path of macro transitions as transitions
+"""
+
+from tema.model.model import Transition
+
+# a chain of non-keyword transitions is cut after this many transitions
+MAX_LENGTH = 1000
+
+class MacroTransition(Transition):
+    """A transition from the source state of the first transition of a
+    chain to the destination state of the last one, labelled by the
+    action of the first transition. A macro transition is identified by
+    its first transition."""
+    def __init__(self,transitions):
+        Transition.__init__(self,transitions[0].getSourceState(),
+                            transitions[0].getAction(),
+                            transitions[-1].getDestState())
+        self._transitions = tuple(transitions)
+
+    def __hash__(self):
+        return hash(self._transitions[0])
+
+    def __eq__(self,other):
+        try:
+            return self._transitions[0] == other._transitions[0]
+        except AttributeError:
+            return False
+
+    def __str__(self):
+        return "(%s)" % ",".join([str(t) for t in self._transitions])
+
+    def __len__(self):
+        return len(self._transitions)
+
+    def getTransitions(self):
+        """Returns the transitions of the model in the macro transition
+        in the order of execution."""
+        return self._transitions
+
+def transitionsOf(transition):
+    """Returns the transitions of the model in a macro transition or a
+    tuple of the transition, if it is a transition of the model."""
+    if isinstance(transition,MacroTransition):
+        return transition.getTransitions()
+    return (transition,)
+
+def expandTransitions(path):
+    """Returns a list of the transitions of the model in the path of
+    macro transitions and transitions."""
+    expanded = []
+    for t in path:
+        expanded.extend(transitionsOf(t))
+    return expanded
+
+class MacroTransitions(object):
+    def __init__(self,model):
+        self._model = model
+
+    def getMacroTransition(self,transition):
+        """Returns the macro transition that starts with the transition.
+        It is cached in the transition."""
+        try:
+            return transition._macroTransition
+        except AttributeError:
+            pass
+        transitions = [transition]
+        seen = set([str(transition.getSourceState())])
+        state = transition.getDestState()
+        while len(transitions) < MAX_LENGTH:
+            key = str(state)
+            if key in seen:
+                # a loop of internal transitions
+                break
+            seen.add(key)
+            outTransitions = state.getOutTransitions()
+            if len(outTransitions) != 1 or \
+                    outTransitions[0].getAction().isKeyword():
+                break
+            transitions.append(outTransitions[0])
+            state = outTransitions[0].getDestState()
+        transition._macroTransition = MacroTransition(transitions)
+        return transition._macroTransition
+
+    def getOutTransitions(self,state):
+        """Returns the macro transitions that start with the out
+        transitions of the state."""
+        return [ self.getMacroTransition(t)
+                 for t in state.getOutTransitions() ]
+
+    def getSuccessorFunction(self,successors=None):
+        """Returns a function that gives the macro transitions starting
+        with the transitions that successors(state) gives, by default
+        all the out transitions of the state."""
+        if successors is None:
+            return self.getOutTransitions
+        getMacroTransition = self.getMacroTransition
+        return lambda state: [ getMacroTransition(t)
+                               for t in successors(state) ]
+
+def macroTransitions(model):
+    """Returns the MacroTransitions of the model. It is created only once
+    per model."""
+    try:
+        return model._macroTransitions
+    except AttributeError:
+        model._macroTransitions = MacroTransitions(model)
+        return model._macroTransitions
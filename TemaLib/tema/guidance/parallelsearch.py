@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2006-2010 Tampere University of Technology
+# 
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# 
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Parallel search for the guidances that search ahead in the test model.
+
+The transitions from the current state are divided between worker
+processes, and each worker searches the paths that begin with its
+share. The search of the guidance runs in one process at a time (the
+GIL), so threads would not help.
+
+The workers are forked for every search. So each worker has the test
+model and the requirements of the guidance as they are when the search
+begins, copy-on-write, and nothing has to be synchronised between the
+searches. A worker returns the score of its best path and the path as
+the indices of its transitions in the out transitions of the states,
+and the parent finds the same transitions in its own model. Forking
+takes a few milliseconds, so only searches that take longer than that
+benefit from the workers. Without os.fork (Windows), the search runs in
+the guidance process.
+
+Usage:
+
+    # search(transitions) returns (score, path), where path is a list
+    # of transitions of the model starting from state
+    for score, path in parallelSearch(search, state, transitions, 8):
+        ...
+"""
+
+import os
+import sys
+import cPickle
+
+def canFork():
+    return hasattr(os, "fork")
+
+def _index(transition):
+    outTransitions = transition.getSourceState().getOutTransitions()
+    for i, t in enumerate(outTransitions):
+        if t is transition:
+            return i
+    return outTransitions.index(transition)
+
+def _pathFromIndices(state, indices):
+    path = []
+    for i in indices:
+        t = state.getOutTransitions()[i]
+        path.append(t)
+        state = t.getDestState()
+    return path
+
+def _runWorker(search, roots, fd):
+    try:
+        try:
+            score, path = search(roots)
+            if path is not None:
+                path = [ _index(t) for t in path ]
+            result = ("ok", score, path)
+        except Exception, e:
+            result = ("error", "%s: %s" % (e.__class__.__name__, e), None)
+        f = os.fdopen(fd, "wb")
+        cPickle.dump(result, f, cPickle.HIGHEST_PROTOCOL)
+        f.close()
+    finally:
+        # no cleanup or buffers of the parent in the worker
+        os._exit(0)
+
+def parallelSearch(search, state, transitions, processes):
+    """Divides the transitions from the state between at most processes
+    workers, which call search with their share. Returns a list of the
+    (score, path) pairs returned by the workers, path being None or a
+    list of the transitions of the model from the state."""
+    processes = min(processes, len(transitions))
+    if processes <= 1 or not canFork():
+        return [ search(transitions) ]
+    sys.stdout.flush()
+    sys.stderr.flush()
+    workers = []
+    for n in range(processes):
+        readfd, writefd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(readfd)
+            _runWorker(search, transitions[n::processes], writefd)
+        os.close(writefd)
+        workers.append((pid, readfd))
+    results = []
+    errors = []
+    for pid, readfd in workers:
+        f = os.fdopen(readfd, "rb")
+        try:
+            try:
+                status, score, path = cPickle.load(f)
+            except EOFError:
+                status, score = "error", "search worker %s died" % pid
+        finally:
+            f.close()
+            os.waitpid(pid, 0)
+        if status == "ok":
+            if path is not None:
+                path = _pathFromIndices(state, path)
+            results.append((score, path))
+        else:
+            errors.append(score)
+    if errors:
+        raise Exception("Parallel search failed: %s" % "; ".join(errors))
+    return results
@@ -32,6 +32,12 @@ use the same tabulist.
 
 When the starter sharedtabuguidance stops, the tabulist process stops also. :(
 
+Alternatively, guidances on the same host can share a tabulist through
+a memory-mapped file given with 'file:FILENAME'. Then there is no
+tabulist process: the first guidance creates the file, the others
+use it, and it stays usable as long as the file exists. The file
+contains only 64-bit fingerprints of the tabu items.
+
 Accepted guidance-args:
 
     'startandconnect:PORT'
@@ -40,8 +46,13 @@ Accepted guidance-args:
     'connect:PORT'
         Connects to an existing shared tabulist on localhost:PORT.
 
-Other guidance-args, only accepted with 'startandconnect'.
-('connect'ing guidances will use those same args)
+    'file:FILENAME'
+        Uses the shared-memory tabulist in FILENAME, creating it if it
+        doesn't exist yet.
+
+Other guidance-args, only accepted with 'startandconnect' or 'file'.
+('connect'ing guidances will use those same args. With 'file', they're
+used when creating the file and must match the file otherwise.)
     
     'tabuitems:TABUITEMTYPE'
         One of the following:
@@ -49,6 +60,10 @@ Other guidance-args, only accepted with 'startandconnect'.
             statecomponent
             transition
 
+    'tabulistsize:N'
+        Only with 'file'. Maximum number of items in the tabulist
+        (default: about 3 million). Items added after that are ignored.
+
 
 NOTE:
 
@@ -74,7 +89,9 @@ version="0.01"
 
 from tema.guidance.guidance import Guidance as GuidanceBase
 from tema.coverage.tabulist import TabuList
+from tema.coverage.mmaptabulist import MmapTabuList
 import random
+import os
 
 try:
     from multiprocessing.managers import SyncManager
@@ -149,6 +166,7 @@ class Guidance(GuidanceBase):
     def __init__(self):
         GuidanceBase.__init__(self)
         self._port = None
+        self._tabufile = None
         self._manager = None
         self._iAmTheManagerStarter = False
         self._sgParams = []
@@ -162,6 +180,8 @@ class Guidance(GuidanceBase):
         elif name == 'startandconnect':
             self._port = value
             self._iAmTheManagerStarter = True
+        elif name == 'file':
+            self._tabufile = value
         else:
             self._sgParams.append( (name,value) )
 #        GuidanceBase.setParameter(self,name,value)
@@ -183,8 +203,11 @@ class Guidance(GuidanceBase):
             raise ValueError("Invalid argument: %s" % (name,))
 
     def prepareForRun(self):
+        if self._tabufile is not None:
+            return self._prepareSharedFile()
         if self._port is None:
-            raise ValueError("'connect' or 'startandconnect' must be given!")
+            raise ValueError("'connect', 'startandconnect' or 'file' "+
+                             "must be given!")
 
         if self._sgParams and not self._iAmTheManagerStarter:
             raise ValueError("Setting parameters are only allowed "+
@@ -216,6 +239,33 @@ class Guidance(GuidanceBase):
                   " It already contains %i items.")%(connNum,le))
 
 
+    def _prepareSharedFile(self):
+        if self._port is not None:
+            raise ValueError("'file' can't be used together with "+
+                             "'connect' or 'startandconnect'.")
+        itemtype = None
+        maxitems = None
+        for n,v in self._sgParams:
+            if n in ('tabuitems','tabuitem'):
+                itemtype = _normalizedItemType(v)
+            elif n == 'tabulistsize':
+                maxitems = int(v)
+            else:
+                raise ValueError("Invalid argument: %s" % (n,))
+        if itemtype is None and not os.path.exists(self._tabufile):
+            itemtype = 'state'
+        self.log("Using the shared tabulist file '%s'." % (self._tabufile,))
+        self._remoteTabuList = MmapTabuList(self._tabufile,itemtype,maxitems)
+        self._sgParams = [('tabuitems',self._remoteTabuList.getItemType())]
+        for (n,v) in self._sgParams:
+            self._setParameterForReal(n,v)
+        self.log("The guidance params are: %s" % (self._sgParams,))
+
+        le = self._remoteTabuList.len()
+        connNum = self._remoteTabuList.connNum()
+        self.log(("I was the guidance number %i to use this tabulist."+
+                  " It already contains %i items.")%(connNum,le))
+
     def _markExecuted_destState(self, transition):
         s = str(transition.getDestState())
         self._remoteTabuList.add(s)
@@ -283,6 +333,15 @@ class Guidance(GuidanceBase):
         return False
 
 
+def _normalizedItemType(value):
+    if value.startswith('statecomp'):
+        return 'statecomponent'
+    elif value in ('state','states'):
+        return 'state'
+    elif value in ('transition','transitions'):
+        return 'transition'
+    raise ValueError("Invalid tabuitems: %s" % (value,))
+
 def _compStates(transition):
     jeje = [s._id for s in transition.getDestState()._id]
     return tuple([(i,s) for i,s in enumerate(jeje)])
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2006-2010 Tampere University of Technology
+# 
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+# 
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Partial-order reduction for searches in parallel lsts models.
+
+A transition of the composed model executes a rule: the synchronous
+actions of the rule are executed in the components that take part in
+it. Rules of disjoint sets of components are independent, they can be
+executed in either order with the same result, so a search that tries
+all the interleavings of independent rules does the same work many
+times. A stubborn set of a state is a set of rules from which it is
+enough to try the enabled ones, and still a shortest path to a target
+action is found, if there is one.
+
+The stubborn set is computed from the rule structure. It contains the
+rules resulting in the target actions and is closed as follows:
+
+- if an enabled rule is in the set, all the rules of its components
+  and all the rules with the same result are in the set.
+
+- if a disabled rule is in the set, all the rules of one of its
+  components whose local state does not enable its action are in the
+  set. The component has to move before the rule can be executed.
+
+Only the search is reduced. If a target action is enabled, or the set
+contains no enabled rules, all the out transitions are returned.
+
+Usage:
+
+    reduction = stubbornSets(model) # None if not a parallel lsts model
+    successors = reduction.getSuccessorFunction(["action name", ...])
+    successors(state) # some of state.getOutTransitions()
+"""
+
+class StubbornSets(object):
+    def __init__(self,model):
+        self._actionmapper = model.getLstsList()
+        componentOfAction = {}
+        for num,(name,lstsobj) in enumerate(model.getLstsList()):
+            for actionname in lstsobj.get_actionnames():
+                try:
+                    action = self._actionmapper.act2int(
+                        "%s.%s" % (name,actionname))
+                except KeyError:
+                    continue
+                componentOfAction[action] = num
+        # _rules[N] = (result, ((component, action), ...)) of rule N
+        self._rules = []
+        self._rulesOfComponent = [ [] for c in model.getLstsList() ]
+        self._rulesOfResult = {}
+        for rule in model.getRuleList():
+            num = len(self._rules)
+            parts = tuple([ (componentOfAction[a],a)
+                            for a in rule.getSynchronousActions() ])
+            self._rules.append((rule.getResult(),parts))
+            for c,a in parts:
+                self._rulesOfComponent[c].append(num)
+            self._rulesOfResult.setdefault(rule.getResult(),[]).append(num)
+
+    def getStubbornResults(self,state,targets):
+        """Returns the results of the enabled rules in a stubborn set of
+        the state for reaching the target actions (action numbers)."""
+        enabledActions = set()
+        for componentState in state.getComponentStates():
+            for t in componentState.getOutTransitions():
+                enabledActions.add(t.getAction()._id)
+        rules = self._rules
+        rulesOfComponent = self._rulesOfComponent
+        rulesOfResult = self._rulesOfResult
+        stubborn = set()
+        components = set()
+        results = set()
+        waiting = []
+        for target in targets:
+            waiting.extend(rulesOfResult.get(target,()))
+        while waiting:
+            num = waiting.pop()
+            if num in stubborn:
+                continue
+            stubborn.add(num)
+            result,parts = rules[num]
+            disabled = [ c for c,a in parts if a not in enabledActions ]
+            if not disabled:
+                if result not in results:
+                    results.add(result)
+                    waiting.extend(rulesOfResult[result])
+                newComponents = [ c for c,a in parts if c not in components ]
+            elif [ c for c in disabled if c in components ]:
+                # the rules of a disabling component are already in
+                newComponents = []
+            else:
+                newComponents = disabled[:1]
+            for c in newComponents:
+                if c not in components:
+                    components.add(c)
+                    waiting.extend(rulesOfComponent[c])
+        return results
+
+    def getSuccessorFunction(self,actionNames):
+        """Returns a function that returns the out transitions of a state
+        in a stubborn set for reaching the actions. The results are
+        cached by state."""
+        targets = set()
+        for name in actionNames:
+            try:
+                targets.add(self._actionmapper.act2int(name))
+            except KeyError:
+                pass
+        cache = {}
+        def successors(state):
+            key = str(state)
+            try:
+                return cache[key]
+            except KeyError:
+                pass
+            transitions = state.getOutTransitions()
+            if len(transitions) > 1 and targets and not \
+                    [ t for t in transitions if t.getAction()._id in targets ]:
+                results = self.getStubbornResults(state,targets)
+                reduced = [ t for t in transitions
+                            if t.getAction()._id in results ]
+                if reduced:
+                    transitions = reduced
+            cache[key] = transitions
+            return transitions
+        return successors
+
+def stubbornSets(model):
+    """Returns the StubbornSets of the model, or None if the model is
+    not a parallel lsts model. It is created only once per model."""
+    if not hasattr(model,"getLstsList"):
+        return None
+    try:
+        return model._stubbornSets
+    except AttributeError:
+        model._stubbornSets = StubbornSets(model)
+        return model._stubbornSets
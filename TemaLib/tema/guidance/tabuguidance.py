@@ -42,16 +42,21 @@ If no such transition is found after searching through all the tabulists,
 a random action is suggested.
 
 If there are many possible actions to execute, one of them is chosen randomly.
+
+The tabulists contain 64-bit fingerprints of the actions/states/transitions,
+their memory usage is logged every 10000 executed transitions.
 """
 
 version="tabuguidance 0.21"
 
 from tema.guidance.guidance import Guidance as GuidanceBase
-from tema.coverage.tabulist import TabuList
+from tema.coverage.tabulist import FingerprintTabuList
 import random
 
 INFINITY = () # () is a good choice for INFINITY since () > anything...
 
+MEMORY_REPORT_INTERVAL = 10000
+
 
 class Guidance(GuidanceBase):
     def __init__(self):
@@ -62,6 +67,7 @@ class Guidance(GuidanceBase):
         self._tabulist_action = None
         self._tabulist_state = None
         self._tabulist_transition = None
+        self._numExecuted = 0
 
     def setParameter(self,paramname,paramvalue):
         accepted = ("numtabuactions","numtabustates","numtabutransitions")
@@ -98,13 +104,14 @@ class Guidance(GuidanceBase):
 
         # order: action, state, transition
         if self._NUM_TABU_ACTIONS is not None:
-            self._tabulist_action = TabuList(self._NUM_TABU_ACTIONS)
+            self._tabulist_action = FingerprintTabuList(self._NUM_TABU_ACTIONS)
             self._suggesters.append(self._newAction)
         if self._NUM_TABU_STATES is not None:
-            self._tabulist_state = TabuList(self._NUM_TABU_STATES)
+            self._tabulist_state = FingerprintTabuList(self._NUM_TABU_STATES)
             self._suggesters.append(self._newStateAction)
         if self._NUM_TABU_TRANSITIONS is not None:
-            self._tabulist_transition = TabuList(self._NUM_TABU_TRANSITIONS)
+            self._tabulist_transition = FingerprintTabuList(
+                self._NUM_TABU_TRANSITIONS)
             self._suggesters.append(self._newTransitionAction)
 
     def markExecuted(self, transition):
@@ -112,18 +119,30 @@ class Guidance(GuidanceBase):
         # special case: add the very first (source) state to the tabu-list
         statelist = self._tabulist_state
         if statelist and len(statelist) == 0:
-            statelist.add( transition.getSourceState() )
+            statelist.add( transition.getSourceState().fingerprint() )
 
         # add actions/states/transitions to tabulists if given tabulist exists
         if self._tabulist_action is not None:
-            self._tabulist_action.add( str(transition.getAction()) )
+            self._tabulist_action.add( transition.getAction().fingerprint() )
         if self._tabulist_state is not None:
-            self._tabulist_state.add( str(transition.getDestState()) )
+            self._tabulist_state.add( transition.getDestState().fingerprint() )
         if self._tabulist_transition is not None:
-            self._tabulist_transition.add( str(transition) )
+            self._tabulist_transition.add( transition.fingerprint() )
 
         GuidanceBase.markExecuted(self,transition)
 
+        self._numExecuted += 1
+        if self._numExecuted % MEMORY_REPORT_INTERVAL == 0:
+            self._logMemoryUsage()
+
+    def _logMemoryUsage(self):
+        for name,tl in (("action",self._tabulist_action),
+                        ("state",self._tabulist_state),
+                        ("transition",self._tabulist_transition)):
+            if tl is not None:
+                self.log("%s tabulist: %i items, %i bytes" %
+                         (name,len(tl),tl.memoryUsage()))
+
     def suggestAction(self, from_state):
 
         out_trans = from_state.getOutTransitions()
@@ -140,21 +159,21 @@ class Guidance(GuidanceBase):
     def _newAction(self, trans):
         """returns a non-tabu action, or None"""
         for t in trans:
-            if str(t.getAction()) not in self._tabulist_action:
+            if t.getAction().fingerprint() not in self._tabulist_action:
                 return t.getAction()
         return None
 
     def _newStateAction(self, trans):
         """returns an action leading to a non-tabu state, or None"""
         for t in trans:
-            if str(t.getDestState()) not in self._tabulist_state:
+            if t.getDestState().fingerprint() not in self._tabulist_state:
                 return t.getAction()
         return None
 
     def _newTransitionAction(self, trans):
         """returns an action of a non-tabu transition, or None"""
         for t in trans:
-            if str(t) not in self._tabulist_transition:
+            if t.fingerprint() not in self._tabulist_transition:
                 return t.getAction()
         return None
 
@@ -71,6 +71,36 @@ Parameters:
 
         default: 'noloops'
 
+    'heuristic':
+        0: Search all the paths.
+        1: With a parallel lsts model and a requirement that gives an
+           execution hint, search only the paths that can still reach one
+           of the hinted actions within 'searchdepth'. The distance to
+           the actions is estimated with distanceheuristic.
+        default: 0
+
+    'reduction':
+        0: Search all the interleavings of the transitions.
+        1: With a parallel lsts model and a requirement that gives an
+           execution hint, search only the transitions in the stubborn sets
+           for reaching the hinted actions (see stubbornsets).
+        default: 0
+
+    'macros':
+        0: A path is a sequence of transitions of the model.
+        1: A path is a sequence of macro transitions: the chains of
+           transitions without branches and keywords are searched as one
+           step (see macrotransitions), so 'searchdepth' is about the
+           number of keywords. 'heuristic' is not used with macros.
+        default: 0
+
+    'processes':
+        The number of worker processes that search in parallel. The
+        transitions from the current state are divided between them, and
+        so is 'maxtransitions'. The best path of the workers is chosen
+        (see parallelsearch).
+        default: 1
+
 
     'transitionweight':
         TODO
@@ -84,6 +114,11 @@ import random
 from heapq import heappush, heappop
 
 from tema.guidance.guidance import Guidance as GuidanceBase
+from tema.guidance.distanceheuristic import distanceHeuristic
+from tema.guidance.stubbornsets import stubbornSets
+from tema.guidance.macrotransitions import macroTransitions, \
+    transitionsOf, expandTransitions
+from tema.guidance.parallelsearch import parallelSearch
 
 version = '0.1'
 
@@ -99,10 +134,15 @@ class Guidance(GuidanceBase):
         self.setParameter("maxtransitions",10000)
         self.setParameter("greedy",0)
         self.setParameter("searchconstraint","noloops")
+        self.setParameter("heuristic",0)
+        self.setParameter("reduction",0)
+        self.setParameter("macros",0)
+        self.setParameter("processes",1)
 
     def setParameter(self,name,value):
         accepted = ("transitionweight","searchorder","searchdepth",
-                    "maxtransitions","searchconstraint")
+                    "maxtransitions","searchconstraint","heuristic",
+                    "reduction","macros","processes")
         if name == "transitionweight":
             if isinstance(value,str) and value.startswith('kw:'):
                 kww = float(value[3:])
@@ -137,6 +177,14 @@ class Guidance(GuidanceBase):
                 self._seco = NONE
             else:
                 raise ValueError("Invalid searchconstraint '%s'"%value)
+        elif name == "heuristic":
+            self._useHeuristic = int(value)
+        elif name == "reduction":
+            self._useReduction = int(value)
+        elif name == "macros":
+            self._useMacros = int(value)
+        elif name == "processes":
+            self._processes = int(value)
         else:
             print __doc__
             raise ValueError("Invalid parameter '%s' for newguidance. "%name +
@@ -155,7 +203,8 @@ class Guidance(GuidanceBase):
         if not self._thePlan:
             self.log("Computing a new path...")
             # reverse the path so we can pop() the next transition...
-            self._thePlan = [t for t in reversed(self._search(fromState))]
+            path = expandTransitions(self._search(fromState))
+            self._thePlan = [t for t in reversed(path)]
             self._testmodel.clearCache()
 
         nextTrans = self._thePlan.pop()
@@ -173,13 +222,50 @@ class Guidance(GuidanceBase):
             return self.suggestAction(fromState)
         return nextTrans.getAction()
 
+    def _searchAids(self):
+        """Returns (estimate, successors, targets): the estimator of the
+        distance to the actions of the execution hint of the requirement,
+        the function giving the transitions to search from a state, and
+        the names of the actions. estimate and targets are None if the
+        heuristic is not used. With macros, successors gives macro
+        transitions."""
+        estimate, successors, targets = None, None, None
+        if self._useHeuristic or self._useReduction:
+            targets = self.getHintedActions()
+            if targets is None:
+                self.log("The requirement gives no execution hint, "+
+                         "searching all the paths.")
+                self._useHeuristic = self._useReduction = 0
+        if targets:
+            if self._useHeuristic and self._useMacros:
+                # the estimate counts transitions, not macro transitions
+                self.log("The heuristic is not used with macros.")
+            elif self._useHeuristic:
+                heuristic = distanceHeuristic(self._testmodel)
+                if heuristic is not None:
+                    estimate = heuristic.getEstimator(targets)
+            if self._useReduction:
+                reduction = stubbornSets(self._testmodel)
+                if reduction is not None:
+                    successors = reduction.getSuccessorFunction(targets)
+        if successors is None:
+            successors = lambda state: state.getOutTransitions()
+        if self._useMacros:
+            successors = \
+                macroTransitions(self._testmodel).getSuccessorFunction(
+                successors)
+        if estimate is None:
+            targets = None
+        return estimate, successors, targets
+
     def _search(self,fromState):
         """ Searches from the given state until:
             - all the paths with length 'searchdepth' have been searched
             - OR 'maxtransitions' transitions seen
             - OR 'greedy' is enabled and any path improving coverage is found.
 
-            Returns the best path found.
+            Returns the best path found. With 'macros', the path consists
+            of macro transitions and its length is their number.
 
             Goodness of a path =
                 covreq.transitionPoints(t) - _transitionweight(t)
@@ -192,14 +278,57 @@ class Guidance(GuidanceBase):
                 always check the shortest unfinished path next
             'searchorder'=='bestfirst':
                 always check the best unfinished path found so far
+
+            With 'processes' > 1, the paths beginning with different
+            transitions are searched in different processes, and the path
+            is of transitions of the model.
         """
 
         if len(self._requirements) > 1:
             raise NotImplementedError("Only one requirement, please.")
 
+        # with the heuristic, the paths that can't reach a target action
+        # within MAX_LENGTH are not searched
+        aids = self._searchAids()
+        successors = aids[1]
+        startingTrans = [t for t in successors(fromState)]
+
+        if self._processes <= 1:
+            return self._searchPaths(fromState, startingTrans, aids,
+                                     self._maxTransitions)[1]
+
+        maxTransitions = max(1, self._maxTransitions // self._processes)
+        def search(transitions):
+            badness, path = self._searchPaths(fromState, transitions, aids,
+                                              maxTransitions)
+            if path is None:
+                return (badness, 0), None
+            return (badness, len(path)), expandTransitions(path)
+        results = [ (score, path) for score, path in
+                    parallelSearch(search, fromState, startingTrans,
+                                   self._processes)
+                    if path is not None ]
+        if not results:
+            return None
+        # the least badness, then the shortest path
+        bestScore = min([ score for score, path in results ])
+        bestPath = random.choice([ path for score, path in results
+                                   if score == bestScore ])
+        self.log("Returning the best path of %i search processes, "
+                 "badness = %f" % (len(results), bestScore[0]))
+        return bestPath
+
+    def _searchPaths(self,fromState,startingTrans,aids,maxTransitions):
+        """ Searches the paths beginning with startingTrans.
+            Returns (badness, path): the best path found and its badness,
+            which is 0 if no path improves the coverage.
+        """
+
         req = self._requirements[0]
         startCov = req.getPercentage()
 
+        estimate, successors, targets = aids
+
         # If the req has transitionPoints method, we'll use that.
         # Otherwise, using getPercentage()
         useTP = hasattr(req,"transitionPoints")
@@ -208,7 +337,6 @@ class Guidance(GuidanceBase):
         # the goodness of the last transition of each of the paths has not been
         # determined yet.
 
-        startingTrans = [t for t in fromState.getOutTransitions()]
         pathHeap = [self._toHeap((t,),0) for t in startingTrans]
         seenTrans = set(startingTrans)
 
@@ -217,7 +345,7 @@ class Guidance(GuidanceBase):
         bestPaths = []
         leastBadness = 0
 
-        SEARCH_TRANSITIONS = self._maxTransitions
+        SEARCH_TRANSITIONS = maxTransitions
         MAX_LENGTH = self._searchDepth
 
         # the paths whose length is max. their search has been thus stopped.
@@ -253,12 +381,17 @@ class Guidance(GuidanceBase):
             # If the req has transitionPoints method, we'll use that.
             # Otherwise, using getPercentage (all reqs should have that).
             if useTP:
-                for t in path[:-1]:
+                for t in expandTransitions(path[:-1]):
+                    req.markExecuted(t)
+                lastTransitions = transitionsOf(last)
+                for t in lastTransitions[:-1]:
+                    badness -= req.transitionPoints(t)
+                    badness += self._transitionweight(t)
                     req.markExecuted(t)
-                badness -= req.transitionPoints(last)
-                badness += self._transitionweight(last)
+                badness -= req.transitionPoints(lastTransitions[-1])
+                badness += self._transitionweight(lastTransitions[-1])
             else:
-                for t in path:
+                for t in expandTransitions(path):
                     req.markExecuted(t)
                 # adding a nonpositive number
                 badness = startCov - req.getPercentage()
@@ -280,7 +413,13 @@ class Guidance(GuidanceBase):
 
             if len(path) < MAX_LENGTH:
                 isDeadEnd = True # dead end until proven otherwise
-                for t in last.getDestState().getOutTransitions():
+                # the number of transitions left after the next one
+                room = MAX_LENGTH - len(path) - 1
+                for t in successors(last.getDestState()):
+                    if estimate is not None and \
+                            estimate(t.getDestState()) >= room and \
+                            str(t.getAction()) not in targets:
+                        continue
                     if self._tranShouldBeSearched(t,path,seenTrans):
                         # add an one-transition-longer path to pathHeap
                         heappush(pathHeap, self._toHeap(path+(t,),badness))
@@ -299,13 +438,14 @@ class Guidance(GuidanceBase):
             if pathHeap:
                 self.log("Returning a random unsearched path.")
                 p,unused = self._fromHeap(random.choice(pathHeap))
-                return p
+                return 0, p
             elif maxLenPaths:
                 self.log("Returning a random max_len path (len = %i)" % (MAX_LENGTH,))
-                return random.choice( maxLenPaths )
+                return 0, random.choice( maxLenPaths )
             elif deadEnds:
                 self.log("Returning a random dead end path.")
-                return random.choice( deadEnds )
+                return 0, random.choice( deadEnds )
+            return 0, None
         else:
             # found one or more good paths
             shortestBestPathLen = min([len(q) for q in bestPaths])
@@ -314,7 +454,7 @@ class Guidance(GuidanceBase):
             bestPath = random.choice(shortestBestPaths)
             self.log("Returning a path whose length is %i, badness = %f" % (
                 len(bestPath),leastBadness) )
-            return bestPath
+            return leastBadness, bestPath
 
     def _tranShouldBeSearched(self,t,path,seenTrans):
         return (self._seco == NO_CROSSING_PATHS and t not in seenTrans
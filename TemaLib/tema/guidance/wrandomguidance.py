@@ -57,7 +57,8 @@ class WGuidance(GuidanceBase):
             raise Exception("Invalid parameter '%s' for gameguidance." % parametername)
         GuidanceBase.setParameter(self,parametername,parametervalue)
         if parametername=='randomseed':
-            self._rndchoose=random.Random(parametervalue).choice
+            self._random=random.Random(parametervalue)
+            self._rndchoose=self._random.choice
 
     def suggestAction(self,state_object):
         # check that getProbability is implemented
@@ -19,14 +19,30 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+
 class InitEngineError(Exception): pass
 
+import os
 import random
+import re
+import copy
+import threading
+
+# targetting keyword of multi-target models, see generatetestconf
+_RE_TARGETTING_KW = re.compile(r"~?[kK]w_SetTarget\s+(.*)$")
 
 class InitEngine:
     """
     This class reads --initmodel arguments and executes the given test
     models until it reaches a deadlock.
+
+    Every model belongs to a target, given by appending '@TARGET' to
+    the file name, or found from the kw_SetTarget keywords of the
+    model if they all refer to the same target. If the adapter can
+    provide separate connections to the targets (it has method
+    getTargetAdapter), consecutive models of different targets are
+    run concurrently. Models of the same target are run in the given
+    order, and models without a single target are run alone.
     """
     def log(self,*a): pass
 
@@ -34,6 +50,7 @@ class InitEngine:
         self.log("Initializing")
         self._modelnames=[]
         self._models=[]
+        self._targets=[]
         try: self._guidance=__import__("tema.guidance.randomguidance",globals(),locals(),['']).Guidance()
         except Exception, e:
             self.log("Failed to load randomguidance.")
@@ -45,20 +62,54 @@ class InitEngine:
         name defines the model interface (lstsmodel,
         parallellstsmodel, ...).
         value is the name of the file from which the model can be
-        loaded.
+        loaded, optionally followed by '@TARGET'. The part after the
+        last '@' is the target only if it is not a path and the part
+        before it is an existing file, so file names may contain '@'.
         """
+        target=None
+        if "@" in value:
+            filename,suffix=value.rsplit("@",1)
+            if os.sep not in suffix and "/" not in suffix and \
+                    os.path.exists(filename):
+                value,target=filename,suffix
         self.log("Loading file '%s' through interface '%s'" % (value,name))
         try: model = __import__("tema.model."+name,{},{},['']).Model()
         except Exception, e:
             raise Exception("Error '%s' when loading interface '%s'." % (e,name))
         model.loadFromFile(file(value))
+        if target is None:
+            target=self._findTarget(model)
+        if target is not None:
+            self.log("Target of '%s' is '%s'" % (value,target))
         self._modelnames.append(value)
         self._models.append(model)
+        self._targets.append(target)
+
+    def _findTarget(self,model):
+        """Returns the target that all the targetting keywords of the
+        model refer to, or None."""
+        targets=set()
+        for a in model.getActions():
+            m=_RE_TARGETTING_KW.match(a.toString())
+            if m:
+                targets.add(m.group(1).strip())
+        if len(targets)==1:
+            return targets.pop()
+        return None
+
+    def _actionIndex(self,testmodel):
+        """Returns dict: action name -> set of action ids."""
+        index={}
+        for a in testmodel.getActions():
+            index.setdefault(a.toString(),set()).add(a._id)
+        return index
     
-    def _run_model(self, testmodel, testdata, adapter, appchain):
+    def _run_model(self, testmodel, testdata, adapter, appchain, logprefix=""):
         stepcounter=0
         current_state=testmodel.getInitialState()
         guidance=self._guidance
+        action_index=self._actionIndex(testmodel)
+        no_actions=frozenset()
 
         while len(current_state.getOutTransitions())>0:
             stepcounter+=1
@@ -75,7 +126,7 @@ class InitEngine:
                     testdata.processAction(
                     action_name)))
             except Exception, e:
-                self.log("Sending input caused error: '%s'" % e)
+                self.log("%sSending input caused error: '%s'" % (logprefix,e))
                 raise e
             if (result==True and not suggested_action.isNegative()) or \
                    (result==False and suggested_action.isNegative()): # executed successfully
@@ -87,12 +138,13 @@ class InitEngine:
             # 3. Find out which transition in the model matches to
             # executed_action_name
 
+            executed_ids=action_index.get(executed_action_name,no_actions)
             possible_transitions=[ t for t in current_state.getOutTransitions() \
-                                   if t.getAction().toString()==executed_action_name ]
+                                   if t.getAction()._id in executed_ids ]
             
             if possible_transitions==[]:
-                self.log("Cannot execute action '%s' in state '%s'"
-                         %(executed_action_name,current_state))
+                self.log("%sCannot execute action '%s' in state '%s'"
+                         %(logprefix,executed_action_name,current_state))
                 raise InitEngineError("Cannot execute action '%s' in state '%s'"
                                       % (executed_action_name,current_state))
 
@@ -101,20 +153,96 @@ class InitEngine:
             if len(possible_transitions)>1:
                 print "Non determinism:",[str(t) for t in possible_transitions]
 
-            self.log("Executing: %s" % chosen_transition.getAction())
-            self.log("New state: %s" % chosen_transition.getDestState())
+            self.log("%sExecuting: %s" % (logprefix,chosen_transition.getAction()))
+            self.log("%sNew state: %s" % (logprefix,chosen_transition.getDestState()))
 
             # --- markExecuted is not called here
 
             current_state=chosen_transition.getDestState()
         # end while loop
-        self.log("Deadlock reached.")
+        self.log("%sDeadlock reached." % logprefix)
+
+    def _phases(self):
+        """Yields lists of (target, model indices) pairs. The targets
+        in a list are different and can be initialized concurrently.
+        A model without a target is alone in its list."""
+        phase=[]
+        for mindex,target in enumerate(self._targets):
+            if target is None:
+                if phase: yield phase
+                phase=[]
+                yield [(None,[mindex])]
+                continue
+            for t,mindices in phase:
+                if t==target:
+                    mindices.append(mindex)
+                    break
+            else:
+                phase.append((target,[mindex]))
+        if phase: yield phase
+
+    def _run_group(self, target, mindices, testdata, adapter, appchain):
+        if target is None: logprefix=""
+        else: logprefix="[%s] " % target
+        for mindex in mindices:
+            self.log("%sInitialization run %s/%s ('%s')"
+                     % (logprefix,mindex+1,len(self._models),
+                        self._modelnames[mindex]))
+            self._run_model(self._models[mindex],testdata,adapter,
+                            appchain,logprefix)
+        if target is not None:
+            self.log("Target '%s' ready." % target)
+
+    def _run_concurrently(self, phase, adapter, testdata, appchain):
+        testdata=_SynchronizedTestData(testdata)
+        errors=[]
+        def run(*args):
+            try:
+                self._run_group(*args)
+            except Exception, e:
+                errors.append(e)
+        threads=[]
+        for target,mindices in phase:
+            targetname=testdata.processAction(target)
+            targetadapter=adapter.getTargetAdapter(targetname)
+            if targetadapter is None:
+                raise InitEngineError("No connection to target '%s'"
+                                      % targetname)
+            # action postprocessors may remember the current target
+            t=threading.Thread(target=run,
+                               args=(target,mindices,testdata,targetadapter,
+                                     copy.deepcopy(appchain)))
+            t.setDaemon(True)
+            threads.append(t)
+        self.log("Initializing targets %s concurrently."
+                 % ", ".join(["'%s'" % target for target,m in phase]))
+        for t in threads: t.start()
+        for t in threads: t.join()
+        if errors:
+            raise errors[0]
 
     def run_init(self, adapter, testdata, appchain):
         self.log("Starting initialization, going through %s model(s)."
                  % len(self._models))
-        for mindex, m in enumerate(self._models):
-            self.log("Initialization run %s/%s ('%s')"
-                     % (mindex+1,len(self._models),self._modelnames[mindex]))
-            self._run_model(m,testdata,adapter,appchain)
+        concurrent=hasattr(adapter,"getTargetAdapter")
+        for phase in self._phases():
+            if concurrent and len(phase)>1:
+                self._run_concurrently(phase,adapter,testdata,appchain)
+            else:
+                for target,mindices in phase:
+                    self._run_group(target,mindices,testdata,adapter,appchain)
         self.log("Initialization done.")
+
+
+class _SynchronizedTestData:
+    """Test data shared by concurrent initialization runs."""
+    def __init__(self,testdata):
+        self._testdata=testdata
+        self._lock=threading.Lock()
+
+    def processAction(self,actionstring):
+        self._lock.acquire()
+        try:
+            return self._testdata.processAction(actionstring)
+        finally:
+            self._lock.release()
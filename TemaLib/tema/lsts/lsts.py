@@ -95,6 +95,10 @@ r.read()
 
 reads the LSTS in s.
 
+open_lsts(filename,mode) opens an LSTS file. Files whose name ends
+with .gz are written compressed. The reader decompresses gzip
+compressed files automatically.
+
 props_by_states(lsts_object) returns table indexed with state
 numbers. The table includes lists of state proposition numbers. For
 example,
@@ -111,8 +115,11 @@ name_of_prop=stateproplist[num_of_a_stateprop]
 
 """
 
-version="0.522 svn"
+version="0.530 svn"
 
+# 0.522 -> 0.530 writer formats the file in large chunks, writes
+#                 state prop ranges "x..y". gzip compressed files are
+#                 read and written transparently (see open_lsts).
 # 0.490 -> 0.522 support for dos lines (carriage returns are removed)
 # 0.110 -> 0.490 support for multirow action names
 # 0.55 -> 0.110 lsts file objects can be read and written already in
@@ -129,6 +136,13 @@ version="0.522 svn"
 # 0.50 -> 0.52 added support for state prop ranges "x..y"
 
 from sys import stderr
+import gzip
+
+GZIP_MAGIC="\x1f\x8b"
+
+# The writer passes the file to its write method in chunks of at most
+# this many rows.
+WRITE_BUFFER_ROWS=10000
 
 class fakefile:
     """
@@ -147,6 +161,55 @@ class fakefile:
         self.s+=s
 
 
+def open_lsts(filename,mode="r"):
+    """open_lsts(filename, mode) -> file object
+
+    Opens an LSTS file for reading or writing. If the name of the file
+    ends with .gz, the file is compressed with gzip when written. The
+    reader detects compressed files by their contents, so they can be
+    read whatever their names are.
+    """
+    if filename.endswith(".gz"):
+        return gzip.open(filename,mode,6)
+    return open(filename,mode)
+
+
+def _ungzipped(file):
+    """Returns a file object that decompresses file if it begins with
+    the gzip magic number, otherwise file itself. Only files that
+    support seeking (not pipes) can be detected."""
+    try:
+        pos=file.tell()
+        magic=file.read(len(GZIP_MAGIC))
+        file.seek(pos)
+    except (AttributeError,IOError):
+        return file
+    if magic==GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=file,mode="rb")
+    return file
+
+
+def _state_ranges(states):
+    """Returns the state numbers in the format of a State_props row,
+    for example [0,1,2,3,7] -> ' 1..4 8'. Runs of three or more
+    consecutive states are written as ranges."""
+    if not hasattr(states,"__getitem__"):
+        states=list(states)
+    out=[]
+    i=0
+    n=len(states)
+    while i<n:
+        j=i
+        while j+1<n and states[j+1]==states[j]+1:
+            j+=1
+        if j-i>=2:
+            out.append(" %s..%s" % (states[i]+1,states[j]+1))
+        else:
+            out.extend([" %s" % (v+1) for v in states[i:j+1]])
+        i=j+1
+    return "".join(out)
+
+
 def props_by_states(lsts_object):
     """props_by_states(lsts_object) -> state_table
 
@@ -204,7 +267,7 @@ class lsts:
         self._header.action_cnt=len(self._actionnames)-1
             
 
-    def set_transitions(self,transitions):
+    def set_transitions(self,transitions,state_cnt=None,transition_cnt=None):
         """
         Parameters:
 
@@ -218,12 +281,21 @@ class lsts:
         actionnames lists. That is, they may have values from 0 to
         len(list)-1.
 
+        - if state_cnt and transition_cnt are given, transitions may
+        be any iterable that yields the lists of pairs in the order
+        of states, for example a generator that reads them from a
+        file. It is iterated only once, when the LSTS is written.
+
         Notes:
-        
+
         This method modifies State_cnt and Transition_cnt fields in
         the header.
         """
         self._transitions=transitions
+        if state_cnt is not None and transition_cnt is not None:
+            self._header.state_cnt=state_cnt
+            self._header.transition_cnt=transition_cnt
+            return
         self._header.state_cnt=len(transitions)
         self._header.transition_cnt=0
         for s in transitions:
@@ -326,57 +398,54 @@ class writer(lsts):
             self._written_in_constructor=None
             return
         
-        file.write("Begin Lsts\n\n")
+        out=[]
+        out.append("Begin Lsts\n\n")
 
-        file.write("Begin History\n")
+        out.append("Begin History\n")
         for num,s in enumerate(self._history):
-            file.write("\t"+str(num+1)+"\n")
-            file.write("\t\""+s+"\"\n")
-            
-        file.write("End History\n\n")
-        
-        file.write("Begin Header\n")
-        file.write(" State_cnt = " + str(self._header.state_cnt) + "\n")
-        file.write(" Action_cnt = " + str(self._header.action_cnt) + "\n")
-        file.write(" Transition_cnt = " + str(self._header.transition_cnt) + "\n")
+            out.append('\t%s\n\t"%s"\n' % (num+1,s))
+        out.append("End History\n\n")
+
+        out.append("Begin Header\n")
+        out.append(" State_cnt = %s\n" % self._header.state_cnt)
+        out.append(" Action_cnt = %s\n" % self._header.action_cnt)
+        out.append(" Transition_cnt = %s\n" % self._header.transition_cnt)
         if self._stateprops:
-            file.write(" State_prop_cnt = " + str(self._header.state_prop_cnt) + "\n")
-        file.write(" Initial_states = " + str(self._header.initial_states+1) + ";\n")
-        file.write("End Header\n\n")
+            out.append(" State_prop_cnt = %s\n" % self._header.state_prop_cnt)
+        out.append(" Initial_states = %s;\n" % (self._header.initial_states+1))
+        out.append("End Header\n\n")
 
-        file.write("Begin Action_names\n")
-        for ai,a in enumerate(self._actionnames[1:]):
-            file.write(" "+str(ai+1)+' = "'+a+'"\n')
-        file.write("End Action_names\n\n")
+        out.append("Begin Action_names\n")
+        out.extend([' %s = "%s"\n' % (ai+1,a)
+                    for ai,a in enumerate(self._actionnames[1:])])
+        out.append("End Action_names\n\n")
 
         if self._stateprops:
-            file.write("Begin State_props\n")
+            out.append("Begin State_props\n")
             propnames=self._stateprops.keys()
             propnames.sort()
             for key in propnames:
-                file.write('  "%s" :' % key)
-                for v in self._stateprops[key]:
-                    file.write(' %s' % (v+1))
-                file.write(';\n')
-            file.write("End State_props\n\n")
-            
-        file.write("Begin Transitions\n")
+                out.append('  "%s" :%s;\n' % (key,_state_ranges(self._stateprops[key])))
+            out.append("End State_props\n\n")
+
+        out.append("Begin Transitions\n")
         for si,s in enumerate(self._transitions):
-            file.write(" "+str(si+1)+":")
-            for (dest_state,action_index) in s:
-                file.write(" "+str(dest_state+1)+","+str(action_index))
-            file.write(";\n")
-        file.write("End Transitions\n\n")
+            out.append(" %s:%s;\n" % (si+1,"".join([" %s,%s" % (dest_state+1,action_index)
+                                                      for (dest_state,action_index) in s])))
+            if len(out)>=WRITE_BUFFER_ROWS:
+                file.write("".join(out))
+                del out[:]
+        out.append("End Transitions\n\n")
 
         if self._layout:
-            file.write("Begin Layout\n")
-            for statenum, xcoor, ycoord in [(num, val[0], val[1])
-                                            for num, val in enumerate(self._layout)
-                                            if val!=None]:
-                file.write(' %s %s %s\n' % (statenum+1, xcoor, ycoord))
-            file.write("End Layout\n")
+            out.append("Begin Layout\n")
+            out.extend([' %s %s %s\n' % (num+1, val[0], val[1])
+                        for num, val in enumerate(self._layout)
+                        if val!=None])
+            out.append("End Layout\n")
 
-        file.write("End Lsts\n")
+        out.append("End Lsts\n")
+        file.write("".join(out))
 
 
 class reader(lsts):
@@ -424,6 +493,7 @@ class reader(lsts):
             return
         if not file:
             file=self.__file
+        file=_ungzipped(file)
         sidx=0 # index of section that we expect to read next
         secs=self.__sections
         layout_rows=[]
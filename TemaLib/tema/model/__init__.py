@@ -30,12 +30,26 @@ import tema.model.parallelmodel
 ...etc
 """
 
+import os
+
 def loadModel(modeltypestr,file_object):
     module=__import__("tema.model." + modeltypestr,globals(),locals(),[""])
     model_object=module.Model()
     model_object.loadFromFile(file_object)
     return model_object
 
+# (model type, absolute file name) -> model loaded in advance. The test
+# engine daemon sets these in its worker processes.
+_preloaded_models={}
+
+def setPreloadedModel(modeltypestr,filename,model_object):
+    _preloaded_models[(modeltypestr,os.path.abspath(filename))]=model_object
+
+def getPreloadedModel(modeltypestr,filename):
+    """Returns the model that has been loaded from the file in
+    advance, or None."""
+    return _preloaded_models.get((modeltypestr,os.path.abspath(filename)))
+
 def getModelType(modelfile):
         if modelfile.endswith(".ext") or modelfile.endswith(".parallellsts") or  modelfile.endswith(".parallel"):
                 return "parallellstsmodel"
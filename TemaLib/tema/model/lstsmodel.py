@@ -46,6 +46,9 @@ class State(model.State):
 
     def __str__(self):
         return str(self._id)
+
+    def fingerprint(self):
+        return self._id
         
     def getOutTransitions(self):
         """Returns list of transitions that leaves the state."""
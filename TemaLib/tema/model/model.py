@@ -23,6 +23,8 @@
 This module introduces base classes for testmodels.
 """
 import re
+import struct
+import hashlib
 _kwsplit=re.compile('^([a-zA-Z0-9]+:)?(~)?((kw|vw).*)$')
 _awsplit=re.compile('^([a-zA-Z0-9]+:)?(~)?((end_aw|aw).*)$')
 
@@ -41,6 +43,31 @@ def _separate(kw,splitter):
         else: g2=''       
         return g1,g2,matchobj.group(3)
 
+_FP_MASK=0xFFFFFFFFFFFFFFFF
+_FNV_OFFSET=0xcbf29ce484222325
+_FNV_PRIME=0x100000001b3
+
+def fingerprintOfString(s):
+    """
+    Returns a 64-bit integer fingerprint of the string. The same
+    string gets the same fingerprint in every process.
+    """
+    return struct.unpack("<Q",hashlib.md5(s).digest()[:8])[0]
+
+def fingerprintOfInts(ints):
+    """
+    Returns a 64-bit integer fingerprint of a sequence of non-negative
+    integers (e.g. fingerprints of component states).
+    """
+    h=_FNV_OFFSET
+    for i in ints:
+        h=((h^i)*_FNV_PRIME)&_FP_MASK
+    # final mixing so that close sequences get far-apart fingerprints
+    h^=h>>33
+    h=(h*0xff51afd7ed558ccd)&_FP_MASK
+    h^=h>>33
+    return h
+
 class StateProp(object):
     """
     Each StateProp object contains the information on a single state
@@ -139,6 +166,17 @@ class Action:
     def equals(self,action):
         return self.__eq__(action)
 
+    def fingerprint(self):
+        """
+        Returns a 64-bit integer that identifies the action by its
+        name. Tabulists store these instead of action names.
+        """
+        try:
+            return self._fingerprint
+        except AttributeError:
+            self._fingerprint=fingerprintOfString(str(self))
+            return self._fingerprint
+
 class State:
     """
     State class contains the id of a state and can generate the
@@ -177,6 +215,14 @@ class State:
     def equals(self, other):
         return self.__eq__(other)
 
+    def fingerprint(self):
+        """
+        Returns a 64-bit integer that identifies the state in its
+        model. Subclasses with integer state ids override this with
+        something cheaper than hashing str(self).
+        """
+        return fingerprintOfString(str(self))
+
 
 class Transition:
     def __init__(self,sourceState,action,destState):
@@ -212,6 +258,15 @@ class Transition:
     def equals(self,transition):
         return self.__eq__(transition)
 
+    def fingerprint(self):
+        """
+        Returns a 64-bit integer that identifies the transition by its
+        source state, action and destination state.
+        """
+        return fingerprintOfInts((self._sourceState.fingerprint(),
+                                  self._action.fingerprint(),
+                                  self._destState.fingerprint()))
+
 class Model:
     """
     Model is abstract base class for models. The point here is to show
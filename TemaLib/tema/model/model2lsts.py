@@ -23,6 +23,10 @@
 import sys
 import os
 import optparse
+import tempfile
+import time
+from array import array
+from collections import deque
 
 import tema.lsts.lsts as lsts
 from tema.model import getModelType,loadModel
@@ -44,7 +48,10 @@ Options:
         Specifies the model format of the file. If no format is specified, format is inferred from the file extension.
 
 -o <filename>, --output <filename>
-        Specifies the output file. If no file is specified, model will be printed into standard output.
+        Specifies the output file. If no file is specified, model will be printed into standard output. If the name of the file ends with .gz, the output is compressed with gzip.
+
+-p, --progress
+        Report the number of states found and the exploration speed to standard error.
 
 Examples:
 
@@ -52,42 +59,118 @@ model2lsts model.mdm
 model2lsts -f parallellsts -o rules.lsts rules.ext
 """
 
+# the model cache is cleared after expanding this many states
+CACHE_CLEARANCE_INTERVAL = 10000
+
+# progress is reported after expanding this many states
+PROGRESS_INTERVAL = 10000
+
 class ConversionModel(object):
+    """
+    Explores the state space of a model breadth first, numbering the
+    states in the order they are found. States are recognized by their
+    fingerprints, so only the fingerprint-to-number table and the
+    unexpanded states are kept in memory. The transitions are written
+    to a temporary spool file as they are found and read back by
+    getTransitions.
+    """
     def __visit_state(self, state):
-        if state not in self.__visitted:
+        fp = state.fingerprint()
+        num = self.__visited.get(fp)
+        if num is None:
+            num = self.__next_state_num
             if len(self.__stateprops) > 0:
                 for prop in state.getStateProps():
-                    self.__stateprops[str(prop)].append(self.__next_state_num)
-            self.__unexpanded.add(state)
-            self.__visitted[state] = self.__next_state_num
+                    self.__stateprops[str(prop)].append(num)
+            self.__unexpanded.append(state)
+            self.__visited[fp] = num
             self.__next_state_num += 1
-            self.__transitions.append([])
+        return num
 
-    def __init__(self, action_map, stateprops, init_state):
-        self.__transitions = []
+    def __action_num(self, alpha):
+        try:
+            return self.__action_nums[alpha]
+        except KeyError:
+            num = self.__action_map[str(alpha)]
+            self.__action_nums[alpha] = num
+            return num
+
+    def __init__(self, action_map, stateprops, init_state, model=None,
+                 progress=None):
+        """
+        action_map maps action names to action numbers.
+
+        If model is given, its cache is cleared every now and then.
+
+        progress is an optional file-like object to which the number of
+        states and transitions found so far and the exploration speed
+        are written.
+        """
+        self.__action_map = action_map
+        self.__action_nums = {}
         self.__stateprops = dict()
         for prop in stateprops:
-            self.__stateprops[prop] = []
-        self.__visitted=dict()
-        self.__unexpanded = set()
+            self.__stateprops[prop] = array('l')
+        self.__visited = dict()
+        self.__unexpanded = deque()
         self.__next_state_num = 0
+        self.__transition_cnt = 0
+        self.__spool = tempfile.TemporaryFile()
+        start_time = time.time()
+
         self.__visit_state(init_state)
+        expanded = 0
         while self.__unexpanded:
-            this = self.__unexpanded.pop()
-            this_num = self.__visitted[this]
-            for alpha, dest in [(a.getAction(), a.getDestState()) for a in this.getOutTransitions()]:
-                self.__visit_state(dest)
-                dest_num = self.__visitted[dest]
-                alpha_num = action_map[str(alpha)]
-                self.__transitions[this_num].append((dest_num, alpha_num))
+            # states are expanded in the order of their numbers, so the
+            # spool contains the transitions of states 0, 1, 2, ...
+            this = self.__unexpanded.popleft()
+            row = array('l', [0])
+            for t in this.getOutTransitions():
+                row.append(self.__visit_state(t.getDestState()))
+                row.append(self.__action_num(t.getAction()))
+            row[0] = (len(row) - 1) // 2
+            self.__transition_cnt += row[0]
+            row.tofile(self.__spool)
+
+            expanded += 1
+            if expanded % CACHE_CLEARANCE_INTERVAL == 0 and model is not None:
+                model.clearCache()
+            if progress is not None and expanded % PROGRESS_INTERVAL == 0:
+                self.__report(progress, start_time)
+        self.__visited = None
+        if progress is not None:
+            self.__report(progress, start_time)
+
+    def __report(self, progress, start_time):
+        elapsed = max(time.time() - start_time, 1e-6)
+        print >>progress, "States: %i (%i unexpanded), transitions: %i, " \
+              "%.0f states/s" % (self.__next_state_num, len(self.__unexpanded),
+                                 self.__transition_cnt,
+                                 self.__next_state_num / elapsed)
+
+    def getStateCount(self):
+        return self.__next_state_num
+
+    def getTransitionCount(self):
+        return self.__transition_cnt
 
     def getTransitions(self):
-        return self.__transitions
+        """Yields the list of (dest_state, action) pairs of every state,
+        in the order of states."""
+        spool = self.__spool
+        spool.seek(0)
+        for unused in xrange(self.__next_state_num):
+            row = array('l')
+            row.fromfile(spool, 1)
+            if row[0]:
+                row.fromfile(spool, 2 * row[0])
+            yield [(row[i], row[i+1]) for i in xrange(1, len(row), 2)]
+        spool.close()
 
     def getStateProps(self):
         return self.__stateprops
 
-def convert_to_lsts(model, filelike_object):
+def convert_to_lsts(model, filelike_object, progress=None):
     action_map = dict()
     visible_set = set([str(alpha) for alpha in model.getActions()])
     visible_set.discard("tau")
@@ -100,11 +183,14 @@ def convert_to_lsts(model, filelike_object):
     except AttributeError:
         stateprops = []
 
-    conversionmodel = ConversionModel(action_map, stateprops, model.getInitialState())
+    conversionmodel = ConversionModel(action_map, stateprops,
+                                      model.getInitialState(), model, progress)
 
     w=lsts.writer(filelike_object)
     w.set_actionnames(action_vec)
-    w.set_transitions(conversionmodel.getTransitions())
+    w.set_transitions(conversionmodel.getTransitions(),
+                      conversionmodel.getStateCount(),
+                      conversionmodel.getTransitionCount())
     w.set_stateprops(conversionmodel.getStateProps())
     w.write()
 
@@ -129,14 +215,19 @@ def convert(options, filename):
     finally:
         modelfile.close()
                        
+    if options.progress:
+        progress = sys.stderr
+    else:
+        progress = None
+
     if outputfilename != "-":
-        out = open(outputfilename, 'w')
+        out = lsts.open_lsts(outputfilename, 'w')
         try:
-            convert_to_lsts(model, out)
+            convert_to_lsts(model, out, progress)
         finally:
             out.close()
     else:
-        convert_to_lsts(model, sys.stdout)
+        convert_to_lsts(model, sys.stdout, progress)
 
 def readArgs():
 
@@ -152,6 +243,9 @@ def readArgs():
                       metavar="FILENAME", default="-",
                       help="Specifies the output file. If no file is specified or filename is '-', model will be printed into standard output.")
 
+    parser.add_option("-p", "--progress", action="store_true", default=False,
+                      help="Report the number of states found and the exploration speed to standard error.")
+
     options, args = parser.parse_args()
 
     if len(args) == 0:
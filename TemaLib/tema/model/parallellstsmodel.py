@@ -93,6 +93,7 @@ class ParallelLstsModel(ParallelModel):
                 pass
 
         self._last_result_action_index=self._lstslist.getActionCount()-1
+        self._allowedrulelist=None
 
         # LSTSs are handled through model interface, so store them to
         # modellist.
@@ -111,4 +112,15 @@ class ParallelLstsModel(ParallelModel):
         """Every LSTS mentioned in the rules file will be prefixed with dirname/"""
         self._dirprefix=dirname
 
+    def getLstsList(self):
+        """Returns the LstsList of the component LSTSs. The actions in
+        their transitions are global action numbers, the LstsList
+        converts them to names with int2act."""
+        return self._lstslist
+
+    def getRuleList(self):
+        """Returns the RuleList. The actions in the rules are global
+        action numbers."""
+        return self._rulelist
+
 Model=ParallelLstsModel
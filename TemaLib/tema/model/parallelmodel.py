@@ -20,6 +20,7 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import tema.model.model as model
+import tema.rules.rules as rules
 
 Action=model.Action
 
@@ -42,6 +43,14 @@ class State(model.State):
     def __str__(self):
         return self._str_representation
 
+    def fingerprint(self):
+        try:
+            return self._fingerprint
+        except AttributeError:
+            self._fingerprint=model.fingerprintOfInts(
+                [s.fingerprint() for s in self._id])
+            return self._fingerprint
+
     def getOutTransitions(self):
         """Returns list of transitions that leaves the state."""
         if self._outTransitions==None:
@@ -53,6 +62,10 @@ class State(model.State):
     def getStateProps(self):
         return self._model._getStateProps(self._id)
 
+    def getComponentStates(self):
+        """Returns the states of the component models in this state."""
+        return self._id
+
     def clearCache(self):
         self._outTransitions=None
 
@@ -76,10 +89,15 @@ class ParallelModel(model.Model):
     self._modellist     - a list of Model objects
     self._rulelist      - should be a RuleList object
     self._actionmapper  - for int2act and act2int conversions
+
+    If the rulelist is changed after transitions have been computed,
+    self._allowedrulelist should be set to None.
     """
     def __init__(self):
         self._modellist=None
         self._rulelist=None
+        self._forbidden=None
+        self._allowedrulelist=None
         self._stateCache={}
         self._actionCache={}
         self._statepropCache={}
@@ -88,6 +106,31 @@ class ParallelModel(model.Model):
     def getInitialState(self):
         return State([m.getInitialState() for m in self._modellist],None,self)
 
+    def setForbiddenActions(self,forbiddenActions):
+        """Transitions whose action name is in forbiddenActions are
+        left out of the model. The rules resulting in forbidden
+        actions are not tried at all."""
+        self._forbidden=frozenset(forbiddenActions)
+        self._allowedrulelist=None
+        self.clearCache()
+
+    def getForbiddenActions(self):
+        return self._forbidden
+
+    def _getAllowedRules(self):
+        if self._allowedrulelist is None:
+            if not self._forbidden:
+                self._allowedrulelist=self._rulelist
+            else:
+                forbidden_ids=set()
+                for name in self._forbidden:
+                    try: forbidden_ids.add(self._actionmapper.act2int(name))
+                    except KeyError: pass # not an action of this model
+                self._allowedrulelist=rules.RuleList(
+                    [ rule for rule in self._rulelist
+                      if rule.getResult() not in forbidden_ids ])
+        return self._allowedrulelist
+
     def clearCache(self):
         for s in self._stateCache.itervalues():
             s.clearCache()
@@ -157,7 +200,7 @@ class ParallelModel(model.Model):
         # be executed
         #enabled_rules=self._rulelist.enabled(
         #    [ t.getAction()._id for t in avail_transitions ])
-        enabled_rules=self._rulelist.enabled(
+        enabled_rules=self._getAllowedRules().enabled(
             set([ t.getAction()._id for t in avail_transitions ]))
         
         # 3. Find transitions corresponding to the enabled rules
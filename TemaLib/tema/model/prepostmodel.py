@@ -46,6 +46,16 @@ Action can be given some parameters by yielding a string after
 BODY. The string is concatenated with the action name to form the
 action with parameters.
 
+States are stored as snapshots of the attributes of the process
+object. Lists, tuples, dicts and sets in the attributes are stored as
+tuples, other mutable values are pickled. Guards and bodies of all
+states are evaluated in a single process object whose attributes are
+set from the snapshots, so attributes should not share mutable values
+with each other. If only some attributes define the state, the class
+can list them:
+
+    _state_attributes = ('state',)
+
 
 # This is something which might need rethinking:
 
@@ -69,17 +79,154 @@ class PROCESSNAME(mopel.StateMachine):
 """
 
 import types
-import copy
 import cPickle
-from tema.model.model import Action, Transition
+from tema.model.model import Action, Transition, fingerprintOfString
 
 class PrePost(object): pass
 
 class StateMachine(object): pass
 
+
+# Values of state attributes are frozen to hashable values in
+# snapshots. Containers become (tag, content) pairs, other mutable
+# values are pickled. Strings, integers and None are stored as they
+# are. Booleans and floats are tagged so that True, 1 and 1.0 are
+# different states.
+
+_PLAIN_TYPES = set([int, long, str, unicode, types.NoneType])
+
+def _freeze(value):
+    t = type(value)
+    if t in _PLAIN_TYPES:
+        return value
+    elif t is list:
+        return ('l', tuple([_freeze(v) for v in value]))
+    elif t is tuple:
+        return ('t', tuple([_freeze(v) for v in value]))
+    elif t is dict:
+        return ('d', tuple(sorted([(_freeze(k), _freeze(v))
+                                   for k, v in value.iteritems()])))
+    elif t is set:
+        return ('s', tuple(sorted([_freeze(v) for v in value])))
+    elif t is frozenset:
+        return ('f', tuple(sorted([_freeze(v) for v in value])))
+    elif t in (bool, float, complex):
+        return (t.__name__, value)
+    else:
+        return ('p', cPickle.dumps(value, 2))
+
+def _thaw(value):
+    if type(value) is not tuple:
+        return value
+    tag, content = value
+    if tag == 'l':
+        return [_thaw(v) for v in content]
+    elif tag == 't':
+        return tuple([_thaw(v) for v in content])
+    elif tag == 'd':
+        return dict([(_thaw(k), _thaw(v)) for k, v in content])
+    elif tag == 's':
+        return set([_thaw(v) for v in content])
+    elif tag == 'f':
+        return frozenset([_thaw(v) for v in content])
+    elif tag == 'p':
+        return cPickle.loads(content)
+    else: # bool, float, complex
+        return content
+
+# the value of an attribute that the object does not have
+_MISSING = ('m', None)
+
+# class -> names of its state attributes
+_state_attribute_cache = {}
+
+def stateAttributes(obj):
+    """Returns the names of the state attributes of obj. They are
+    listed in the _state_attributes attribute of the class of obj, or
+    if there is no such attribute, they are the attributes of obj.
+    The names are cached by the class."""
+    cls = obj.__class__
+    try:
+        return _state_attribute_cache[cls]
+    except KeyError:
+        names = getattr(cls, '_state_attributes', None)
+        if names is None:
+            names = sorted(obj.__dict__.keys())
+        names = tuple(names)
+        _state_attribute_cache[cls] = names
+        return names
+
+class StateStorage(object):
+    """
+    Stores the state of a process object as snapshots. A snapshot is
+    a tuple of the frozen values of the state attributes of the
+    object. Snapshots are hashable and compared by structure: equal
+    snapshots are equal states.
+
+    Only one object is needed for any number of states: restore sets
+    the attributes of the object to the values in a snapshot. Only the
+    attributes that differ from the latest snapshot or restored state
+    are set, so the object may be changed only between restore and
+    snapshot. Sharing of mutable values between attributes is not
+    preserved.
+    """
+
+    def __init__(self, obj):
+        self._obj = obj
+        self._names = stateAttributes(obj)
+        self._declared = hasattr(obj.__class__, '_state_attributes')
+        self._initial_count = len(self._names)
+        self._current = ()
+
+    def snapshot(self):
+        d = self._obj.__dict__
+        if not self._declared and len(d) != len(self._names):
+            self._addNewAttributes()
+        snapshot = []
+        for name in self._names:
+            if name in d:
+                snapshot.append(_freeze(d[name]))
+            else:
+                snapshot.append(_MISSING)
+        # attributes created later are left out while they are missing,
+        # so that the state has the same snapshot as before they existed
+        while len(snapshot) > self._initial_count and \
+                snapshot[-1] == _MISSING:
+            snapshot.pop()
+        self._current = tuple(snapshot)
+        return self._current
+
+    def _addNewAttributes(self):
+        # an action created attributes that __init__ did not
+        new = [n for n in sorted(self._obj.__dict__.keys())
+               if n not in self._names]
+        self._names = self._names + tuple(new)
+        _state_attribute_cache[self._obj.__class__] = self._names
+
+    def restore(self, snapshot):
+        """Sets the state attributes of the object to the values in the
+        snapshot."""
+        d = self._obj.__dict__
+        current = self._current
+        for i, name in enumerate(self._names):
+            if i < len(snapshot):
+                value = snapshot[i]
+            else:
+                # snapshot taken before the attribute was created
+                value = _MISSING
+            if i < len(current) and current[i] == value:
+                continue
+            if value == _MISSING:
+                d.pop(name, None)
+            else:
+                d[name] = _thaw(value)
+        self._current = snapshot
+
+
 class PrePostModel(object):
     def __init__(self,PrePostClass):
         self._m=PrePostClass()
+        self._storage=StateStorage(self._m)
         self._actions=[]
         self._actioncache={}
         for attr in dir(self._m):
@@ -87,33 +234,46 @@ class PrePostModel(object):
                 action=Action(len(self._actions),attr)
                 self._actions.append(action)
                 self._actioncache[attr]=action
-        self._statecache={} # pickled prepostobjs mapped to prepoststates
+        self._statecache={} # snapshots mapped to prepoststates
+        # the process object is left in the states that are explored,
+        # so the initial snapshot is taken only once
+        self._initialstate=self._newState(self._storage.snapshot())
 
     def getInitialState(self):
-        return PrePostState(self._m,self)
+        return self._initialstate
         
     def getActions(self):
         return self._actions
 
+    def _newState(self,snapshot):
+        try: return self._statecache[snapshot]
+        except KeyError:
+            state=PrePostState(snapshot,self)
+            self._statecache[snapshot]=state
+            return state
+
 class PrePostState(object):
     next_id=0
     
-    def __init__(self,prepostobj,prepostmodel):
+    def __init__(self,snapshot,prepostmodel):
         self._id=PrePostState.next_id
         PrePostState.next_id+=1
-        self._state=prepostobj
+        self._snapshot=snapshot
         self._model=prepostmodel
-        self._model._statecache[cPickle.dumps(self._state,2)]=self
-        self._enabled_transitions=[]
+        self._enabled_transitions=None
         
     def getOutTransitions(self):
-        if self._enabled_transitions: return self._enabled_transitions
+        if self._enabled_transitions is not None:
+            return self._enabled_transitions
+        enabled_transitions=[]
+        prepostobj=self._model._m
+        storage=self._model._storage
+        storage.restore(self._snapshot)
         for action in self._model._actions:
-            enabled=getattr(self._state,str(action))()
+            enabled=getattr(prepostobj,str(action))()
             try: enabled.next()# execute the guard
             except StopIteration: continue # it was false, take the next one
             
-            orig=copy.deepcopy(self._state)
             try: action_args=enabled.next() # execute the body
             except StopIteration: pass
             else:
@@ -123,18 +283,22 @@ class PrePostState(object):
                     action_id=len(self._model._actioncache)
                     action=Action(action_id,new_action)
                     self._model._actioncache[new_action]=action
-            try: dest_state=self._model._statecache[cPickle.dumps(self._state,2)]
-            except KeyError: dest_state=PrePostState(self._state,self._model)
-            self._state=orig
-            self._enabled_transitions.append(Transition(self,action,dest_state))
+            dest_snapshot=storage.snapshot()
+            dest_state=self._model._newState(dest_snapshot)
+            storage.restore(self._snapshot)
+            enabled_transitions.append(Transition(self,action,dest_state))
+        self._enabled_transitions=enabled_transitions
         return self._enabled_transitions
 
     def __str__(self):
         try: return self._str_repr
-        except:
-            self._str_repr=cPickle.dumps(self._state,2)
+        except AttributeError:
+            self._str_repr=repr(self._snapshot)
             return self._str_repr
 
+    def fingerprint(self):
+        return fingerprintOfString(str(self))
+
 
 class StateMachineModel(object):
     def __init__(self,StateMachineClass):
@@ -160,10 +324,46 @@ class Model(object):
             self.getActions=self._smm.getActions
             
     def loadFromFile(self,fileobj):
-        mod=__import__(fileobj.name[:-3],globals(),locals())
+        self.loadFromModule(__import__(fileobj.name[:-3],globals(),locals()))
+
+    def loadFromModule(self,mod):
+        """Loads the first PrePost or StateMachine class in the module"""
         for n in dir(mod):
             o=getattr(mod,n)
             if type(o) in [types.ClassType, types.TypeType] and \
                (PrePost in o.__bases__ or StateMachine in o.__bases__):
                 self.loadFromObject(o)
                 return
+
+
+if __name__ == "__main__":
+    # Benchmark: explores the state space of a pre/post model breadth
+    # first and reports the speed.
+    # Usage: prepostmodel.py [MODULE [MAXSTATES]]
+    import sys, time, random
+    from collections import deque
+    modulename = "tema.model.prepostmodel_example"
+    maxstates = 20000
+    if len(sys.argv) > 1: modulename = sys.argv[1]
+    if len(sys.argv) > 2: maxstates = int(sys.argv[2])
+    random.seed(1)
+    import tema.model.prepostmodel as prepostmodel
+    m = prepostmodel.Model()
+    m.loadFromModule(__import__(modulename, globals(), locals(), [""]))
+    start = time.time()
+    initial = m.getInitialState()
+    found = set([initial])
+    queue = deque([initial])
+    expanded = transitions = 0
+    while queue and expanded < maxstates:
+        state = queue.popleft()
+        expanded += 1
+        for t in state.getOutTransitions():
+            transitions += 1
+            if t.getDestState() not in found:
+                found.add(t.getDestState())
+                queue.append(t.getDestState())
+    elapsed = time.time() - start
+    print "%s: %s states expanded, %s transitions in %.3f s (%.0f states/s)" \
+        % (modulename, expanded, transitions, elapsed,
+           expanded / max(elapsed, 1e-9))
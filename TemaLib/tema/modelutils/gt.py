@@ -37,6 +37,9 @@ Options are:
 
     --keep-labels  do not throw away unreachable actions or state propositions
 
+If output_lsts ends with .gz, the output is compressed with gzip.
+Compressed input is detected automatically.
+
 Rule syntax in BNF, (x* is zero or more x, x+ is one or more x,
 [x] is optional x, x|y is either x or y)
 
@@ -1176,13 +1179,13 @@ if __name__=='__main__':
             elif input_filename == None:
                 infile = None
             else:
-                infile = open(input_filename,'r')
+                infile = lsts.open_lsts(input_filename,'r')
             if output_filename == "-":
                 outfile = sys.stdout
             elif output_filename == None:
                 outfile = None
             else:
-                outfile = open(output_filename,'w')
+                outfile = lsts.open_lsts(output_filename,'w')
 
             gt(infile,outfile,keep_labels,rules)
         except GTError, e:
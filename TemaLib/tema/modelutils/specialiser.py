@@ -125,7 +125,7 @@ if __name__ == "__main__":
             if output_filename == "-":
                 outfile = sys.stdout
             else:
-                outfile = open(output_filename,'w')
+                outfile = lsts.open_lsts(output_filename,'w')
 
             specialiser(os.getcwd(),infile,outfile)
         except SpecialiserError,e:
@@ -21,11 +21,20 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import sys
+import os
+import shlex
+import cPickle
+from StringIO import StringIO
+try:
+	from hashlib import md5
+except ImportError:
+	from md5 import md5
 from tema.eini.mddparser import Parser as mddParser
 import tema.data.datareader as datareader
 
 usage = """
 Usage: packagereader <mddFilePath> <id> <params>
+       packagereader <mddFilePath> --batch
 
   <mddFilePath>		path to the mdd file of the package
   <id>			identifier of the information being sought
@@ -47,6 +56,16 @@ Recognized ids:
   interestingactions	Lists the interesting action words and state verifications belonging to the given product, concurrent unit and component.
   comment		Prints the comment attached to the given product, concurrent unit, component and action.
 
+With --batch, queries are read from the standard input, one per line:
+<id> and <params> separated by whitespace, parameters that contain
+whitespace in quotes. The answer to each query is a line 'OK <n>'
+followed by the n lines of the answer, or a line 'ERROR <message>'.
+The mdd file is parsed only once.
+
+The parsed mdd file is stored in the directory given in the environment
+variable TEMA_PACKAGEREADER_CACHE (default: ~/.tema/packagereader) and
+used until the mdd file changes.
+
 Examples:
 
   packagereader domain.mdd name
@@ -62,38 +81,155 @@ Examples:
   packagereader domain.mdd actions product1 concurrentunit1 component1
   packagereader domain.mdd interestingactions product1 concurrentunit1 component1
   packagereader domain.mdd comment product1 concurrentunit1 component1 action1
+  echo 'actions product1 "concurrent unit 1" component1' | packagereader domain.mdd --batch
 """
 
+# Increase when the format of the cached index changes
+INDEX_VERSION = 1
+
+def cacheDirectory():
+	return os.environ.get("TEMA_PACKAGEREADER_CACHE",
+			      os.path.join(os.path.expanduser("~"), ".tema", "packagereader"))
+
+_readers = {}
+
+def getReader(mddFilePath):
+	"""Returns a Reader of the mdd file. The same reader is returned
+	for the same file during the process."""
+	path = os.path.abspath(mddFilePath)
+	if path not in _readers:
+		_readers[path] = Reader(mddFilePath)
+	return _readers[path]
+
 class Reader:
 	class Error(Exception):
 		pass
 
 	__suffixes = {"Model Designer Model":"mdm", "Model Designer Data Table":"td", "Model Designer Localization Table":"csv", "Basic Data Table":"td", "Basic Localization Table":"csv"}
 
-	def __init__(self, mddFilePath):
+	def __init__(self, mddFilePath, useCache = True):
+		"""If useCache is True, the parsed mdd file is stored in
+		cacheDirectory() and read from there when the file has not
+		changed."""
+		self.__path = mddFilePath
+		self.__useCache = useCache
+		self.__stamp = None
+		self.__models = {} # path -> (mtime, model)
+		self.__load()
+
+		i = mddFilePath.rfind('/')
+		if i != -1:
+			self.__directory = mddFilePath[:i+1]
+		else:
+			self.__directory = ""
+
+	def __load(self):
+		try:
+			st = os.stat(self.__path)
+		except OSError:
+			raise Reader.Error("Cannot open file '%s'." % self.__path)
+		stamp = (st.st_mtime, st.st_size)
+		if stamp == self.__stamp:
+			return
+
+		index = None
+		if self.__useCache:
+			index = self.__readIndex()
+			if index != None and index["stamp"] == stamp:
+				self.__mdd = index["mdd"]
+				self.__stamp = stamp
+				return
+
 		try:
-			f = file(mddFilePath)
+			f = file(self.__path)
 		except IOError:
-			raise Reader.Error("Cannot open file '%s'." % mddFilePath)
+			raise Reader.Error("Cannot open file '%s'." % self.__path)
 		try:
-			self.__mdd = mddParser().parse(f)
+			contents = f.read()
 		finally:
 			f.close()
+		digest = md5(contents).hexdigest()
 
-		i = mddFilePath.rfind('/')
-		if i != -1:
-			self.__directory = mddFilePath[:i+1]
+		if index != None and index["md5"] == digest:
+			# touched but not changed
+			self.__mdd = index["mdd"]
 		else:
-			self.__directory = ""
+			self.__mdd = mddParser().parse(StringIO(contents))
+		self.__stamp = stamp
+		if self.__useCache:
+			self.__writeIndex({"version": INDEX_VERSION, "stamp": stamp,
+					   "md5": digest, "mdd": self.__mdd})
+
+	def __indexPath(self):
+		name = md5(os.path.abspath(self.__path)).hexdigest() + ".index"
+		return os.path.join(cacheDirectory(), name)
+
+	def __readIndex(self):
+		# The cache is only an optimization, a missing or broken
+		# index is just parsed again.
+		try:
+			f = file(self.__indexPath(), "rb")
+			try:
+				index = cPickle.load(f)
+			finally:
+				f.close()
+		except Exception:
+			return None
+		if type(index) != dict or index.get("version") != INDEX_VERSION:
+			return None
+		return index
+
+	def __writeIndex(self, index):
+		path = self.__indexPath()
+		tmppath = "%s.%d.tmp" % (path, os.getpid())
+		try:
+			if not os.path.isdir(os.path.dirname(path)):
+				os.makedirs(os.path.dirname(path))
+			f = file(tmppath, "wb")
+			try:
+				cPickle.dump(index, f, 2)
+			finally:
+				f.close()
+			os.rename(tmppath, path)
+		except (IOError, OSError):
+			try:
+				os.remove(tmppath)
+			except OSError:
+				pass
 
 	def getValue(self, id, params = []):
 		try:
 			function = eval('self._Reader__get_' + id)
 		except Exception, e:
 			raise Reader.Error("Unknown id '%s'." % id)
-	
+
+		# a long-lived reader notices changes in the mdd file
+		self.__load()
 		return function(params)
 
+	def __loadModel(self, suffix, path):
+		"""Loads the model in the file. Models are read again only if
+		their files have changed."""
+		try:
+			mtime = os.stat(path).st_mtime
+		except OSError:
+			raise Reader.Error("Cannot open file '%s'." % path)
+		if path in self.__models and self.__models[path][0] == mtime:
+			return self.__models[path][1]
+
+		exec("from tema.model." + suffix + "model import Model")
+		try:
+			f = file(path)
+		except IOError:
+			raise Reader.Error("Cannot open file '%s'." % path)
+		try:
+			model = Model()
+			model.loadFromFile(f)
+		finally:
+			f.close()
+		self.__models[path] = (mtime, model)
+		return model
+
 	def __get_name(self, params):
 		if len(params) > 0:
 			raise Reader.Error("Name query does not accept additional parameters.")
@@ -337,17 +473,8 @@ class Reader:
 			raise Reader.Error("Unknown component '%s'." % params[2])
 
 		suffix = Reader.__suffixes[actionmachine[mddParser.E_F_MODEL]]
-		exec("from tema.model." + suffix + "model import Model")
 		path = self.__directory + self.__id2filename(params[1] + ' - ' + params[2]) + '.' + suffix
-		try:
-			f = file(path)
-		except IOError:
-			raise Reader.Error("Cannot open file '%s'." % path)
-		try:
-			actionModel = Model()
-			actionModel.loadFromFile(f)
-		finally:
-			f.close()
+		actionModel = self.__loadModel(suffix, path)
 
 		for rm in self.__mdd[mddParser.REFINEMENTMACHINES].itervalues():
 			if rm[mddParser.KM_F_ACTIONMACHINE] == actionmachineId and rm[mddParser.KM_F_PRODUCT] == productId:
@@ -357,17 +484,8 @@ class Reader:
 			return self.__list2str([])
 
 		suffix = Reader.__suffixes[refinementmachine[mddParser.E_F_MODEL]]
-		exec("from tema.model." + suffix + "model import Model")
 		path = self.__directory + self.__id2filename(params[0]) + '/' + self.__id2filename(params[1] + ' - ' + params[2]) + '-rm.' + suffix
-		try:
-			f = file(path)
-		except IOError:
-			raise Reader.Error("Cannot open file '%s'." % path)
-		try:
-			refinementModel = Model()
-			refinementModel.loadFromFile(f)
-		finally:
-			f.close()
+		refinementModel = self.__loadModel(suffix, path)
 
 		try:
 			actions = [a for a in actionModel.getActions() if not interestingonly or a.isInteresting()]
@@ -422,17 +540,8 @@ class Reader:
 			raise Reader.Error("Unknown component '%s'." % params[2])
 
 		suffix = Reader.__suffixes[actionmachine[mddParser.E_F_MODEL]]
-		exec("from tema.model." + suffix + "model import Model")
 		path = self.__directory + self.__id2filename(params[1] + ' - ' + params[2]) + '.' + suffix
-		try:
-			f = file(path)
-		except IOError:
-			raise Reader.Error("Cannot open file '%s'." % path)
-		try:
-			model = Model()
-			model.loadFromFile(f)
-		finally:
-			f.close()
+		model = self.__loadModel(suffix, path)
 
 		for a in model.getActions():
 			if str(a) == params[3]:
@@ -515,8 +624,41 @@ class Reader:
 		else:
 			return ""
 
+def runBatch(reader, input = sys.stdin, output = sys.stdout):
+	"""Answers the queries in input, see usage."""
+	while True:
+		line = input.readline()
+		if not line:
+			break
+		try:
+			query = shlex.split(line)
+		except ValueError, e:
+			output.write("ERROR %s\n" % e)
+			output.flush()
+			continue
+		if not query:
+			continue
+		try:
+			answer = reader.getValue(query[0], query[1:])
+		except Exception, e:
+			output.write("ERROR %s\n" % str(e).replace("\n", " "))
+		else:
+			if answer:
+				lines = answer.split("\n")
+			else:
+				lines = []
+			output.write("OK %d\n" % len(lines))
+			for l in lines:
+				output.write(l + "\n")
+		output.flush()
+
 if __name__ == '__main__':
-	if len(sys.argv) >= 3:
+	if len(sys.argv) == 3 and sys.argv[2] == "--batch":
+		try:
+			runBatch(Reader(sys.argv[1]))
+		except Exception, e:
+			print "\nError: " + str(e) + "\n\n\n" + usage
+	elif len(sys.argv) >= 3:
 		mddFilePath = sys.argv[1]
 		id = sys.argv[2]
 		params = sys.argv[3:]
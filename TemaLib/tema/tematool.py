@@ -69,7 +69,7 @@ exec_commands = set([ "xsimulate", "simulate", "validate","analysator","runmodel
 exec_commands.update(logtools)
 
 modelutils_commands = set(["generatetaskswitcher","gt","rextendedrules","renamerules","composemodel","specialiser","generatetestconf"])
-other_commands = set(["modelutils","engine_home","packagereader","ats4appmodel2lsts","variablemodelcreator","filterexpand","model2lsts","do_python","do_make"])
+other_commands = set(["modelutils","engine_home","packagereader","ats4appmodel2lsts","variablemodelcreator","filterexpand","model2lsts","bench","enginedaemon","testfarm","do_python","do_make"])
 other_commands.update(modelutils_commands)
 
 help_commands_exceptions = dict()
@@ -182,6 +182,27 @@ except KeyError:
             args = sys.argv
             args[0] = path
             os.execve( path, args, environment )
+        elif sys.argv[0] == "bench" :
+            environment = os.environ
+            environment['PYTHONPATH'] = ":".join(sys.path)
+            path = tema_path + "/tema/testengine/bench.py"
+            args = sys.argv
+            args[0] = path
+            os.execve( path, args, environment )
+        elif sys.argv[0] == "enginedaemon" :
+            environment = os.environ
+            environment['PYTHONPATH'] = ":".join(sys.path)
+            path = tema_path + "/tema/testengine/enginedaemon.py"
+            args = sys.argv
+            args[0] = path
+            os.execve( path, args, environment )
+        elif sys.argv[0] == "testfarm" :
+            environment = os.environ
+            environment['PYTHONPATH'] = ":".join(sys.path)
+            path = tema_path + "/tema/testengine/testfarm.py"
+            args = sys.argv
+            args[0] = path
+            os.execve( path, args, environment )
         elif sys.argv[0] in ["do_python"]:
             environment = os.environ
             environment['PYTHONPATH'] = ":".join(sys.path)
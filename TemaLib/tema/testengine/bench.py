@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+# Copyright (c) 2006-2010 Tampere University of Technology
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Measures the throughput of the test engine without a SUT.
+
+testengine is run with testadapter simulating the SUT from the test
+model, with zero delay and a fixed random seed. There is one run for
+every combination of a model, a guidance and a coverage module. Each
+run is a separate process, so the runs do not affect each other.
+
+By default the models are the validator test models of TemaLib and
+two generated synthetic compositions.
+
+The results are written as JSON. For each run:
+
+steps             number of executed test steps
+steps_per_sec     steps per second from the first to the last step
+planning_time     average time (s) spent in guidance.suggestAction
+startup_time      time (s) from the start of the engine process to the
+                  first step
+peak_rss_kb       peak resident set size of the engine process (kB)
+state_cache_size  largest number of states in the state cache of the
+                  test model
+exit_status       exit status of the engine
+
+Examples:
+
+tema bench -o bench.json
+tema bench -g gameguidance:lookahead:5 -c findnewcoverage -d 30 -m model.ext
+tema bench --synthetic 10x100 -g tabuguidance
+"""
+
+import sys
+import os
+import time
+import random
+import optparse
+import tempfile
+import shutil
+import subprocess
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+import tema.lsts.lsts as lsts
+
+DEFAULT_GUIDANCES = ["randomguidance", "tabuguidance", "gameguidance",
+                     "weightguidance"]
+
+# coverage module -> default coverage requirement
+COVERAGE_REQS = { "dummycoverage": "",
+                  "clparser": "actions .*",
+                  "findnewcoverage": "findnew state or transition" }
+
+DEFAULT_COVERAGES = ["dummycoverage", "clparser", "findnewcoverage"]
+
+# guidances that take their random seed as a parameter. Others use
+# the random module, which is seeded in the engine process.
+SEEDED_GUIDANCES = ["randomguidance", "wrandomguidance", "gameguidance"]
+
+# components x states of the default synthetic compositions
+DEFAULT_SYNTHETIC = ["3x10", "6x50"]
+
+DEFAULT_DURATION = 10
+
+
+def validator_models():
+    """Returns the validator test models that are shipped with
+    TemaLib, or an empty list if they are not installed."""
+    import tema.validator
+    modeldir = os.path.join(os.path.dirname(tema.validator.__file__),
+                            "tests", "Models")
+    return [os.path.join(modeldir, m) for m in ("composed.ext", "refined.ext")
+            if os.path.isfile(os.path.join(modeldir, m))]
+
+
+def write_synthetic_model(directory, components, states, seed):
+    """Writes a parallel composition of the given number of
+    components with the given number of states each. Every component
+    has a cycle of local keywords through all of its states, so the
+    composition never deadlocks, and some random keyword transitions
+    and transitions synchronizing with the next component. The
+    components are deterministic. Returns the name of the rules file."""
+    rnd = random.Random(seed)
+    basename = "synthetic-%sx%s" % (components, states)
+    rules = []
+    for c in xrange(components):
+        lstsname = "%s-%s.lsts" % (basename, c)
+        keywords = ["kw_C%sAction%s" % (c, i) for i in xrange(states)]
+        syncs = ["sync_%s_%s" % (c, (c+1) % components),
+                 "sync_%s_%s" % ((c-1) % components, c)]
+        actionnames = ["tau"] + keywords + syncs
+        transitions = [[((s+1) % states, 1+s)] for s in xrange(states)]
+        for s in xrange(states):
+            # an action not yet leaving the state keeps the component
+            # deterministic
+            used = set([a for d, a in transitions[s]])
+            unused = [a for a in xrange(1, len(actionnames)) if a not in used]
+            transitions[s].append((rnd.randrange(states), rnd.choice(unused)))
+        w = lsts.writer(lsts.open_lsts(os.path.join(directory, lstsname), "w"))
+        w.set_actionnames(actionnames)
+        w.set_transitions(transitions)
+        w.write()
+        rules.append('%s="%s"' % (c+1, lstsname))
+        for kw in keywords:
+            rules.append('(%s,"%s") -> "%s"' % (c+1, kw, kw))
+    if components > 1:
+        for c in xrange(components):
+            sync = "sync_%s_%s" % (c, (c+1) % components)
+            rules.append('(%s,"%s") (%s,"%s") -> "%s"'
+                         % (c+1, sync, (c+1) % components + 1, sync, sync))
+    rulesfile = os.path.join(directory, basename + ".ext")
+    f = open(rulesfile, "w")
+    try:
+        f.write("\n".join(rules) + "\n")
+    finally:
+        f.close()
+    return rulesfile
+
+
+def engine_arguments(model, guidance, coverage, duration, seed):
+    from tema.model import getModelType
+    modeltype = getModelType(model) or "parallellstsmodel"
+    if ":" in coverage:
+        coverage, coveragereq = coverage.split(":", 1)
+    else:
+        coveragereq = COVERAGE_REQS.get(coverage, "")
+    if coverage == "dummycoverage":
+        coverage = ""
+    if ":" in guidance:
+        guidance, guidanceargs = guidance.split(":", 1)
+    else:
+        guidanceargs = ""
+    if guidance in SEEDED_GUIDANCES and not "randomseed:" in guidanceargs:
+        guidanceargs = ",".join([a for a in (guidanceargs,
+                                             "randomseed:%s" % seed) if a])
+    return ["--model=%s:%s" % (modeltype, model),
+            "--coverage=%s" % coverage,
+            "--coveragereq=%s" % coveragereq,
+            "--testdata=nodata",
+            "--guidance=%s" % guidance,
+            "--guidance-args=%s" % guidanceargs,
+            "--adapter=testadapter",
+            "--adapter-args=delay:0,model:%s" % model,
+            "--logger=fdlogger",
+            "--logger-args=targetfd:stdout",
+            "--stop-after=%ss" % duration]
+
+
+def run_benchmark(workdir, model, guidance, coverage, duration, seed):
+    """Runs the engine in a new process in workdir, returns the
+    results of the run as a dictionary."""
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    resultfile = os.path.join(workdir, "result.json")
+    engineargs = engine_arguments(model, guidance, coverage, duration, seed)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(sys.path)
+    log = open(os.path.join(workdir, "engine.log"), "w")
+    try:
+        # the startup time includes starting the interpreter and the
+        # imports, so it is measured from here
+        cmd = [sys.executable, os.path.abspath(__file__),
+               "--run-engine", resultfile, "--seed", str(seed),
+               "--start-time", repr(time.time()), "--"] + engineargs
+        status = subprocess.call(cmd, cwd=workdir, env=env,
+                                 stdout=log, stderr=subprocess.STDOUT)
+    finally:
+        log.close()
+    results = { "model": model, "guidance": guidance, "coverage": coverage,
+                "exit_status": status }
+    if os.path.isfile(resultfile):
+        f = open(resultfile)
+        try:
+            results.update(json.load(f))
+        finally:
+            f.close()
+    return results
+
+
+class _Measurements:
+    """Collects the measurements in the engine process. The methods of
+    the guidance and model classes are wrapped to update them."""
+
+    def __init__(self, start=None):
+        if start is None:
+            start = time.time()
+        self.start = start
+        self.first_step = None
+        self.last_step = None
+        self.steps = 0
+        self.planning_time = 0.0
+        self.models = []
+        self.state_cache_size = None
+
+    def instrument(self, guidancecls, modelcls):
+        m = self
+        suggestAction = guidancecls.suggestAction
+        markExecuted = guidancecls.markExecuted
+        loadFromFile = modelcls.loadFromFile
+
+        def timedSuggestAction(self, from_state):
+            t = time.time()
+            if m.first_step is None:
+                m.first_step = t
+            try:
+                return suggestAction(self, from_state)
+            finally:
+                m.planning_time += time.time() - t
+
+        def countedMarkExecuted(self, transition):
+            m.steps += 1
+            m.last_step = time.time()
+            if m.models and hasattr(m.models[0], "_stateCache"):
+                m.state_cache_size = max(m.state_cache_size,
+                                         len(m.models[0]._stateCache))
+            return markExecuted(self, transition)
+
+        def recordedLoadFromFile(self, file_like_object):
+            # The first model loaded is the test model, testadapter
+            # loads its own copy later.
+            m.models.append(self)
+            return loadFromFile(self, file_like_object)
+
+        guidancecls.suggestAction = timedSuggestAction
+        guidancecls.markExecuted = countedMarkExecuted
+        modelcls.loadFromFile = recordedLoadFromFile
+
+    def results(self):
+        rv = { "steps": self.steps,
+               "steps_per_sec": None,
+               "planning_time": None,
+               "startup_time": None,
+               "peak_rss_kb": None,
+               "state_cache_size": self.state_cache_size }
+        if self.first_step is not None:
+            rv["startup_time"] = self.first_step - self.start
+        if self.steps:
+            rv["planning_time"] = self.planning_time / self.steps
+            if self.last_step > self.first_step:
+                rv["steps_per_sec"] = \
+                    self.steps / (self.last_step - self.first_step)
+        if resource:
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if sys.platform == "darwin":
+                rss /= 1024 # bytes on Mac OS X
+            rv["peak_rss_kb"] = rss
+        return rv
+
+
+def _option_value(args, name):
+    for a in args:
+        if a.startswith("--%s=" % name):
+            return a.split("=", 1)[1]
+    return ""
+
+
+def run_engine(resultfile, seed, engineargs, start=None):
+    """Runs testengine in this process with the given arguments and
+    writes the measurements to resultfile. start is the time when the
+    process was started (default: now)."""
+    m = _Measurements(start)
+    random.seed(seed)
+    guidancemodule = __import__("tema.guidance." +
+                                _option_value(engineargs, "guidance"),
+                                globals(), locals(), [''])
+    modelmodule = __import__("tema.model." +
+                             _option_value(engineargs, "model").split(":")[0],
+                             globals(), locals(), [''])
+    m.instrument(guidancemodule.Guidance, modelmodule.Model)
+
+    import tema.testengine
+    enginefile = os.path.join(os.path.dirname(tema.testengine.__file__),
+                              "testengine.py")
+    sys.argv = [enginefile] + engineargs
+    status = 0
+    try:
+        execfile(enginefile, {"__name__": "__main__"})
+    except SystemExit, e:
+        status = e.code
+    sys.stdout.flush()
+
+    f = open(resultfile, "w")
+    try:
+        json.dump(m.results(), f)
+    finally:
+        f.close()
+    return status
+
+
+def readArgs():
+    usagemessage = "usage: %prog [options]"
+    description = "Runs testengine with testadapter for every combination of the given models, guidances and coverage modules and reports the throughput as JSON."
+
+    parser = optparse.OptionParser(usage=usagemessage,
+                                   description=description)
+    parser.add_option("-m", "--model", action="append", default=[],
+                      help="Test model. Can be given many times. Default: the validator test models and the synthetic models")
+    parser.add_option("-s", "--synthetic", action="append", default=[],
+                      metavar="COMPONENTSxSTATES",
+                      help="Generate a synthetic composition, e.g. 4x20. Can be given many times.")
+    parser.add_option("-g", "--guidance", action="append", default=[],
+                      metavar="MODULE[:ARGS]",
+                      help="Guidance module and optionally its arguments. Can be given many times. Default: %s" % ", ".join(DEFAULT_GUIDANCES))
+    parser.add_option("-c", "--coverage", action="append", default=[],
+                      metavar="MODULE[:REQUIREMENT]",
+                      help="Coverage module and optionally the coverage requirement. Can be given many times. Default: %s" % ", ".join(DEFAULT_COVERAGES))
+    parser.add_option("-d", "--duration", action="store", type="int",
+                      default=DEFAULT_DURATION,
+                      help="Length of a run in seconds (default: %default)")
+    parser.add_option("--seed", action="store", type="int", default=1,
+                      help="Random seed (default: %default)")
+    parser.add_option("-o", "--output", action="store", type="str",
+                      default="-",
+                      help="Output file for the results. Default: standard output")
+    parser.add_option("-k", "--keep", action="store_true", default=False,
+                      help="Keep the work directory with the engine logs and print its name")
+    parser.add_option("--run-engine", action="store", type="str",
+                      help=optparse.SUPPRESS_HELP)
+    parser.add_option("--start-time", action="store", type="float",
+                      help=optparse.SUPPRESS_HELP)
+
+    return parser.parse_args()
+
+
+def main():
+    options, args = readArgs()
+
+    if options.run_engine:
+        sys.exit(run_engine(options.run_engine, options.seed, args,
+                            options.start_time))
+
+    if args:
+        print >> sys.stderr, "Unexpected argument: %s" % args[0]
+        sys.exit(1)
+
+    workdir = tempfile.mkdtemp(prefix="temabench")
+    try:
+        models = [os.path.abspath(m) for m in options.model]
+        synthetic = options.synthetic
+        if not models and not synthetic:
+            models = validator_models()
+            synthetic = DEFAULT_SYNTHETIC
+        for size in synthetic:
+            try:
+                components, states = [int(x) for x in size.split("x")]
+            except ValueError:
+                print >> sys.stderr, "Invalid synthetic model size: %s" % size
+                sys.exit(1)
+            models.append(write_synthetic_model(workdir, components, states,
+                                                options.seed))
+
+        guidances = options.guidance or DEFAULT_GUIDANCES
+        coverages = options.coverage or DEFAULT_COVERAGES
+
+        runs = []
+        for model in models:
+            for guidance in guidances:
+                for coverage in coverages:
+                    rundir = os.path.join(workdir, "run%s" % len(runs))
+                    print >> sys.stderr, "%s %s %s" % (
+                        os.path.basename(model), guidance, coverage)
+                    runs.append(run_benchmark(rundir, model, guidance,
+                                              coverage, options.duration,
+                                              options.seed))
+
+        report = { "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                   "python": sys.version.split()[0],
+                   "platform": sys.platform,
+                   "seed": options.seed,
+                   "duration": options.duration,
+                   "runs": runs }
+        if options.output == "-":
+            out = sys.stdout
+        else:
+            out = open(options.output, "w")
+        try:
+            json.dump(report, out, indent=1, sort_keys=True)
+            out.write("\n")
+        finally:
+            if out != sys.stdout:
+                out.close()
+    finally:
+        if options.keep:
+            print >> sys.stderr, "Work directory: %s" % workdir
+        else:
+            shutil.rmtree(workdir, True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+# Copyright (c) 2006-2010 Tampere University of Technology
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Checkpoints of a test run. They are used by testengine when it is
+given the --checkpoint argument, and a run is continued from the
+latest checkpoint with --resume.
+
+A checkpoint is the executed trace: for every test step, the number
+of the executed transition in a table of the distinct transitions of
+the trace. A transition is identified in the table by its action name
+and the name of its destination state, not by its position among the
+out transitions of the state, because guidances may reorder those
+(tabuguidance shuffles them). In addition, the checkpoint contains the
+state of the random module, the state of the own random generator of
+the guidance (see Guidance.getRandomState) and the number of steps. On
+resume, the trace is executed again in the test model from the initial
+state without the SUT. The guidance, the coverage requirement, the
+state verifier and the test data are told about every transition as in
+the original run, so their coverage storages, tabulists etc. are
+rebuilt whatever modules are used, and the run continues from the
+state where the checkpoint was taken with the random generators
+restored. A guidance that plans routes ahead (gameguidance) plans a new
+route after resuming, so its choices may still differ from those of
+the original run. Initialisation models are not executed again.
+
+Checkpoints are written in a background thread every interval steps
+(--checkpoint-interval, default: 100) and when the test run ends. The
+checkpoint file is an append-only log: a checkpoint appends the steps
+and the transitions of the table that are new since the previous
+checkpoint, so taking a checkpoint does not get slower as the trace
+grows. When the log has grown to twice the size it had after the
+latest compaction, it is compacted: the whole checkpoint is written as
+a single record to a temporary file that is then renamed over the log.
+The first checkpoint of a run is always a compaction. A record that
+was left incomplete by a crash is ignored when the file is read.
+
+File format: the magic string and a sequence of records. A record is
+the length of its header and the number of its steps (4 bytes each,
+little endian), the header (a pickled dictionary) and the transition
+numbers of the steps as 4-byte unsigned integers. The "transitions"
+of a header are appended to the table of transitions, the other
+values replace those of the previous headers.
+"""
+
+import os
+import sys
+import random
+import struct
+import threading
+import cPickle
+from array import array
+
+MAGIC = "TEMACKP3"
+
+# the log is never compacted when it is smaller than this (bytes)
+COMPACTION_MIN_SIZE = 1 << 20
+
+# executing the trace, the model cache is cleared this often
+CACHE_CLEARANCE_INTERVAL = 10000
+
+
+def _newTrace():
+    trace = array('I')
+    if trace.itemsize != 4:
+        trace = array('L')
+    return trace
+
+
+def _writeRecord(f, header, numbers):
+    """Writes a record to f and returns its size in bytes."""
+    data = cPickle.dumps(header, 2)
+    f.write(struct.pack("<II", len(data), len(numbers)))
+    f.write(data)
+    if sys.byteorder != "little":
+        numbers = array(numbers.typecode, numbers)
+        numbers.byteswap()
+    numbers.tofile(f)
+    return 8 + len(data) + 4 * len(numbers)
+
+
+def writeCheckpoint(filename, header, trace):
+    """Writes the checkpoint atomically as a single record. Returns
+    the size of the file."""
+    tmpname = filename + ".tmp"
+    f = open(tmpname, "wb")
+    try:
+        f.write(MAGIC)
+        size = len(MAGIC) + _writeRecord(f, header, trace)
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
+    if os.name == "nt" and os.path.exists(filename):
+        os.remove(filename)
+    os.rename(tmpname, filename)
+    return size
+
+
+def readCheckpoint(filename):
+    """Returns the pair (header, trace) read from the checkpoint
+    file."""
+    header = {}
+    transitions = []
+    trace = _newTrace()
+    f = open(filename, "rb")
+    try:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("'%s' is not a checkpoint file" % filename)
+        while True:
+            lengths = f.read(8)
+            if len(lengths) < 8: break
+            length, count = struct.unpack("<II", lengths)
+            data = f.read(length)
+            numbers = f.read(4 * count)
+            if len(data) < length or len(numbers) < 4 * count:
+                break # the last record was not written completely
+            record = cPickle.loads(data)
+            transitions.extend(record.pop("transitions", []))
+            header.update(record)
+            trace.fromstring(numbers)
+    finally:
+        f.close()
+    if "steps" not in header:
+        raise ValueError("checkpoint file '%s' is empty" % filename)
+    if sys.byteorder != "little":
+        trace.byteswap()
+    if len(trace) != header["steps"]:
+        raise ValueError("checkpoint file '%s' is corrupted" % filename)
+    header["transitions"] = transitions
+    return header, trace
+
+
+class Checkpointer:
+    """Records the executed trace and writes checkpoints of it."""
+
+    def __init__(self, filename, interval, header=None, trace=None,
+                 guidance=None):
+        self._filename = filename
+        self._guidance = guidance
+        self._interval = interval
+        if header is None: header = {}
+        self._header = header
+        if trace is None: trace = _newTrace()
+        self._trace = trace
+        # (action name, destination state name) pairs and their numbers
+        self._transitions = list(header.get("transitions", []))
+        self._numbers = dict([ (key, n) for n, key in
+                               enumerate(self._transitions) ])
+        # the steps and transitions in the previous checkpoint
+        self._savedsteps = len(self._trace)
+        self._savedtransitions = len(self._transitions)
+        self._pending = []
+        self._closed = False
+        self._lock = threading.Condition()
+        # used only by the writer thread
+        self._file = None
+        self._size = 0
+        self._compactedsize = 0
+        self._latest = {}
+        self._thread = threading.Thread(target=self._writer)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def log(self, msg): pass
+
+    def getSteps(self):
+        return len(self._trace)
+
+    def markExecuted(self, state, transition):
+        """Called after transition has been executed in state."""
+        key = (transition.getAction().toString(),
+               str(transition.getDestState()))
+        try:
+            number = self._numbers[key]
+        except KeyError:
+            number = self._numbers[key] = len(self._transitions)
+            self._transitions.append(key)
+        self._trace.append(number)
+        if self._interval and len(self._trace) % self._interval == 0:
+            self.save()
+
+    def save(self):
+        """Takes a checkpoint. It is written in the background."""
+        steps = len(self._trace)
+        ntransitions = len(self._transitions)
+        record = { "steps": steps,
+                   "random": random.getstate(),
+                   "transitions":
+                       self._transitions[self._savedtransitions:] }
+        if self._guidance is not None:
+            record["guidancerandom"] = self._guidance.getRandomState()
+        numbers = self._trace[self._savedsteps:]
+        self._savedsteps = steps
+        self._savedtransitions = ntransitions
+        self._lock.acquire()
+        try:
+            self._pending.append((record, numbers, ntransitions))
+            self._lock.notify()
+        finally:
+            self._lock.release()
+
+    def _writer(self):
+        while True:
+            self._lock.acquire()
+            try:
+                while not self._pending and not self._closed:
+                    self._lock.wait()
+                records, self._pending = self._pending, []
+            finally:
+                self._lock.release()
+            if not records:
+                break
+            try:
+                self._write(records)
+            except Exception, e:
+                self.log("Writing checkpoint to '%s' failed: %s" %
+                         (self._filename, e))
+                # the log may be incomplete, start it again
+                self._closeFile()
+        self._closeFile()
+
+    def _write(self, records):
+        for record, numbers, ntransitions in records:
+            self._latest.update([ (k, v) for k, v in record.iteritems()
+                                  if k != "transitions" ])
+        if self._file is not None and \
+                self._size < max(2 * self._compactedsize,
+                                 COMPACTION_MIN_SIZE):
+            for record, numbers, ntransitions in records:
+                self._size += _writeRecord(self._file, record, numbers)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        else:
+            self._compact(records[-1][0]["steps"], records[-1][2])
+
+    def _compact(self, steps, ntransitions):
+        self._closeFile()
+        header = dict(self._header)
+        header.update(self._latest)
+        header["transitions"] = self._transitions[:ntransitions]
+        self._size = self._compactedsize = writeCheckpoint(
+            self._filename, header, self._trace[:steps])
+        self._file = open(self._filename, "ab")
+
+    def _closeFile(self):
+        if self._file is not None:
+            try: self._file.close()
+            except Exception: pass
+            self._file = None
+
+    def close(self):
+        """Writes the last checkpoint and stops the writer thread."""
+        self.save()
+        self._lock.acquire()
+        try:
+            self._closed = True
+            self._lock.notify()
+        finally:
+            self._lock.release()
+        self._thread.join()
+        self.log("Checkpoint of %s steps written to '%s'" %
+                 (len(self._trace), self._filename))
+
+
+def _findTransition(state, key):
+    actionname, destname = key
+    for t in state.getOutTransitions():
+        if t.getAction().toString() == actionname and \
+                str(t.getDestState()) == destname:
+            return t
+    raise ValueError("no transition '%s' to state %s from state %s" %
+                     (actionname, destname, state))
+
+
+def executeTrace(trace, transitions, model, state, guidance, testdata,
+                 verifier=None):
+    """Executes the transitions of the trace from state without the
+    SUT. transitions is the table of transitions of the checkpoint.
+    Returns the state in the end of the trace."""
+    since_clearance = 0
+    for number in trace:
+        transition = _findTransition(state, transitions[number])
+        action = transition.getAction()
+        if action.isKeyword() and action.isNegative():
+            testdata.processAction(action.negate())
+        else:
+            testdata.processAction(action.toString())
+        guidance.markExecuted(transition)
+        if verifier: verifier.markExecuted(transition)
+        state = transition.getDestState()
+        since_clearance += 1
+        if since_clearance >= CACHE_CLEARANCE_INTERVAL:
+            model.clearCache()
+            since_clearance = 0
+    return state
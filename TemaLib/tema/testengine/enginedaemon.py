@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+# Copyright (c) 2006-2010 Tampere University of Technology
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+A long-lived test engine daemon that keeps test models loaded.
+
+Starting testengine imports the TEMA modules and loads and composes
+the test model before the first test step. The daemon does that once:
+it listens to a local UNIX socket and runs testengine in a forked
+worker process for every request. The workers share the modules and
+the models loaded by the daemon copy-on-write. A run in a worker does
+not change the models of the daemon.
+
+Models are identified by the model type, the file name and a hash of
+the contents of the model file and, for parallel lsts models, of the
+lsts files that it refers to. The files are hashed again only when
+their modification times or sizes change. A model whose files have
+changed is loaded again. The models used most recently are kept
+(--max-models). The socket file is removed when the daemon is
+interrupted or terminated.
+
+The request is a line of JSON: the working directory, the testengine
+arguments and optionally the seed of the random module. Without a
+seed, every worker seeds the random module randomly, as a new engine
+process would. The output of the engine is streamed back to the client,
+and the run ends with a line containing the exit status. If no daemon
+listens to the socket, --run runs testengine locally.
+
+Examples:
+
+tema enginedaemon --socket=/tmp/tema.sock &
+tema enginedaemon --socket=/tmp/tema.sock --run -- --model=parallellstsmodel:rules.ext ...
+
+The socket can also be given in the environment variable
+TEMA_ENGINE_SOCKET. tema.runmodelpackage uses the daemon if it is set.
+"""
+
+import sys
+import os
+import errno
+import random
+import socket
+import signal
+import hashlib
+import optparse
+import traceback
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import tema.model
+
+# the model types that are loaded in the daemon
+PRELOADED_MODEL_TYPES = ["parallellstsmodel", "lstsmodel"]
+
+# modules that the daemon imports for the workers
+PRELOADED_MODULES = ["tema.initengine.initengine",
+                     "tema.coverage.clparser",
+                     "tema.coverage.findnewcoverage",
+                     "tema.coverage.dummycoverage",
+                     "tema.data.testdata",
+                     "tema.data.nodata",
+                     "tema.guidance.gameguidance",
+                     "tema.guidance.randomguidance",
+                     "tema.guidance.tabuguidance",
+                     "tema.guidance.weightguidance",
+                     "tema.guidance.greedyguidance",
+                     "tema.adapter.socketserveradapter",
+                     "tema.adapter.testadapter",
+                     "tema.logger.fdlogger",
+                     "tema.actionpp.actionpp",
+                     "tema.model.parallellstsmodel",
+                     "tema.model.lstsmodel"]
+
+DEFAULT_MAX_MODELS = 8
+
+# the last line of the output of a run: "\0TEMA-EXIT status\n"
+EXIT_MARKER = "\0TEMA-EXIT "
+
+
+def default_socket():
+    return os.environ.get("TEMA_ENGINE_SOCKET",
+                          os.path.expanduser("~/.tema-engine.sock"))
+
+
+def _option_value(args, name):
+    for a in args:
+        if a.startswith("--%s=" % name):
+            return a.split("=", 1)[1]
+    return ""
+
+
+def model_files(modeltype, filename):
+    """Returns the files from which the model is loaded."""
+    files = [filename]
+    if modeltype == "parallellstsmodel":
+        import tema.rules.rules_parser as rules_parser
+        f = open(filename)
+        try:
+            contents = f.read()
+        finally:
+            f.close()
+        directory = os.path.dirname(filename)
+        for lstsnum, lstsfile in \
+                rules_parser.ExtRulesParser().parseLstsFiles(contents):
+            files.append(os.path.join(directory, lstsfile))
+    return files
+
+
+def model_hash(modeltype, filename, files=None):
+    """Returns a hash of the files of the model."""
+    if files is None:
+        files = model_files(modeltype, filename)
+    h = hashlib.sha1(modeltype)
+    for name in files:
+        h.update(name)
+        f = open(name, "rb")
+        try:
+            h.update(f.read())
+        finally:
+            f.close()
+    return h.hexdigest()
+
+
+def _file_stamps(files):
+    stamps = []
+    for name in files:
+        st = os.stat(name)
+        stamps.append((st.st_mtime, st.st_size))
+    return stamps
+
+
+def _terminate(signum, frame):
+    raise SystemExit(0)
+
+
+class EngineDaemon:
+
+    def __init__(self, socketpath, maxmodels=DEFAULT_MAX_MODELS):
+        self._socketpath = socketpath
+        self._maxmodels = maxmodels
+        self._models = {} # (type, file name, hash) -> model
+        self._lru = [] # keys of _models, the most recently used last
+        self._keys = {} # (type, file name) -> (files, stamps, key)
+        self._workers = set()
+        self._enginefile = engine_file()
+        f = open(self._enginefile)
+        try:
+            self._enginecode = compile(f.read(), self._enginefile, "exec")
+        finally:
+            f.close()
+
+    def log(self, msg):
+        print >> sys.stderr, "enginedaemon: %s" % msg
+
+    def preloadModules(self):
+        for name in PRELOADED_MODULES:
+            try:
+                __import__(name, globals(), locals(), [''])
+            except Exception, e:
+                self.log("Could not import %s: %s" % (name, e))
+
+    def _modelKey(self, modeltype, filename):
+        """Returns the key of the model in _models. The files of the
+        model are hashed again only if their modification times or
+        sizes have changed, so that requests are not held up by
+        reading them."""
+        cached = self._keys.get((modeltype, filename))
+        if cached is not None:
+            files, stamps, key = cached
+            if _file_stamps(files) == stamps:
+                return key
+        files = model_files(modeltype, filename)
+        stamps = _file_stamps(files)
+        key = (modeltype, filename, model_hash(modeltype, filename, files))
+        self._keys[(modeltype, filename)] = (files, stamps, key)
+        return key
+
+    def getModel(self, modeltype, filename):
+        """Returns the model loaded from the file, or None if it cannot
+        be loaded in the daemon."""
+        if modeltype not in PRELOADED_MODEL_TYPES:
+            return None
+        try:
+            key = self._modelKey(modeltype, filename)
+        except (IOError, OSError), e:
+            return None
+        if key in self._models:
+            self._lru.remove(key)
+            self._lru.append(key)
+            return self._models[key]
+        try:
+            f = open(filename)
+            try:
+                model = tema.model.loadModel(modeltype, f)
+            finally:
+                f.close()
+            # the initial state and its transitions are computed
+            # once for all the runs
+            model.getInitialState().getOutTransitions()
+        except Exception, e:
+            self.log("Could not load %s: %s" % (filename, e))
+            return None
+        self.log("Loaded %s %s" % (modeltype, filename))
+        self._models[key] = model
+        self._lru.append(key)
+        while len(self._lru) > self._maxmodels:
+            del self._models[self._lru.pop(0)]
+        return model
+
+    def serve_forever(self):
+        if os.path.exists(self._socketpath):
+            os.remove(self._socketpath)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self._socketpath)
+        os.chmod(self._socketpath, 0600)
+        server.listen(16)
+        server.settimeout(1.0)
+        self.log("Listening to %s" % self._socketpath)
+        # the socket file is removed also when the daemon is killed
+        daemonpid = os.getpid()
+        signal.signal(signal.SIGTERM, _terminate)
+        try:
+            while True:
+                self._reapWorkers()
+                try:
+                    conn, address = server.accept()
+                except socket.timeout:
+                    continue
+                except socket.error, e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    raise
+                try:
+                    self._handle(server, conn)
+                finally:
+                    conn.close()
+        finally:
+            server.close()
+            if os.getpid() == daemonpid and \
+                    os.path.exists(self._socketpath):
+                os.remove(self._socketpath)
+
+    def _reapWorkers(self):
+        for pid in list(self._workers):
+            try:
+                done, status = os.waitpid(pid, os.WNOHANG)
+            except OSError:
+                done = pid
+            if done:
+                self._workers.discard(pid)
+
+    def _handle(self, server, conn):
+        conn.settimeout(None)
+        try:
+            request = json.loads(conn.makefile("r").readline())
+            cwd = str(request["cwd"])
+            args = [str(a) for a in request["args"]]
+            seed = request.get("seed")
+        except Exception, e:
+            conn.sendall("Invalid request: %s\n%s1\n" % (e, EXIT_MARKER))
+            return
+        modeltype, filename = None, None
+        if ":" in _option_value(args, "model"):
+            modeltype, filename = _option_value(args, "model").split(":", 1)
+            filename = os.path.abspath(os.path.join(cwd, filename))
+            model = self.getModel(modeltype, filename)
+        else:
+            model = None
+        pid = os.fork()
+        if pid == 0:
+            server.close()
+            status = 1
+            try:
+                # the workers would repeat the random choices of the
+                # daemon, unless the client gives the seed
+                random.seed(seed)
+                if model is not None:
+                    tema.model.setPreloadedModel(modeltype, filename, model)
+                status = self._runEngine(conn, cwd, args)
+            finally:
+                os._exit(status)
+        self._workers.add(pid)
+        self.log("Worker %s: %s" % (pid, " ".join(args)))
+
+    def _runEngine(self, conn, cwd, args):
+        """Runs testengine in the worker process with stdout and stderr
+        connected to the client. Returns the exit status."""
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(conn.fileno(), 1)
+        os.dup2(conn.fileno(), 2)
+        status = 0
+        try:
+            os.chdir(cwd)
+            sys.argv = [self._enginefile] + args
+            exec self._enginecode in {"__name__": "__main__"}
+        except SystemExit, e:
+            status = e.code
+        except:
+            traceback.print_exc()
+            status = 1
+        if status is None:
+            status = 0
+        elif not isinstance(status, int):
+            print >> sys.stderr, status
+            status = 1
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            conn.sendall("%s%s\n" % (EXIT_MARKER, status))
+        except Exception:
+            pass
+        return status
+
+
+def runEngine(socketpath, args, cwd=None, output=None, seed=None):
+    """Runs testengine in the daemon listening to socketpath with the
+    given arguments. The output of the engine is written to output
+    (default: stdout). The random module of the engine is seeded with
+    seed, or randomly if it is None. Returns the exit status of the
+    engine."""
+    if cwd is None: cwd = os.getcwd()
+    if output is None: output = sys.stdout
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socketpath)
+    try:
+        request = {"cwd": cwd, "args": list(args)}
+        if seed is not None:
+            request["seed"] = seed
+        client.sendall(json.dumps(request) + "\n")
+        # the exit status is in the end of the output, so the data
+        # that could be a part of it is held back
+        pending = ""
+        while True:
+            data = client.recv(65536)
+            if not data:
+                break
+            pending += data
+            i = pending.find(EXIT_MARKER)
+            if i == -1:
+                i = max(0, len(pending) - len(EXIT_MARKER))
+            output.write(pending[:i])
+            output.flush()
+            pending = pending[i:]
+    finally:
+        client.close()
+    if pending.startswith(EXIT_MARKER):
+        try:
+            return int(pending[len(EXIT_MARKER):])
+        except ValueError:
+            pass
+    output.write(pending)
+    print >> sys.stderr, "The engine daemon worker ended unexpectedly"
+    return 1
+
+
+def daemon_unavailable(error):
+    """Returns whether the socket error from runEngine means that no
+    daemon listens to the socket (it does not exist, or it was left
+    behind by a daemon that is not running), so that nothing has been
+    run and testengine can be run locally instead."""
+    return error.args[0] in (errno.ENOENT, errno.ECONNREFUSED)
+
+
+def engine_file():
+    import tema.testengine
+    return os.path.join(os.path.dirname(tema.testengine.__file__),
+                        "testengine.py")
+
+
+def readArgs():
+    usagemessage = "usage: %prog [options] [--run -- testengine arguments]"
+    description = "Keeps test models loaded and runs testengine for the requests to a local socket. With --run, sends a request to the daemon and prints the output of the engine."
+
+    parser = optparse.OptionParser(usage=usagemessage,
+                                   description=description)
+    parser.add_option("-s", "--socket", action="store", type="str",
+                      default=default_socket(),
+                      help="UNIX socket of the daemon. Default: $TEMA_ENGINE_SOCKET or %s" % os.path.expanduser("~/.tema-engine.sock"))
+    parser.add_option("--max-models", action="store", type="int",
+                      default=DEFAULT_MAX_MODELS,
+                      help="The number of models kept loaded (default: %default)")
+    parser.add_option("--run", action="store_true", default=False,
+                      help="Run testengine in the daemon with the arguments after --")
+    parser.add_option("--seed", action="store", type="int",
+                      help="With --run, the seed of the random module of the engine. Default: a random seed")
+    parser.disable_interspersed_args()
+
+    return parser.parse_args()
+
+
+def main():
+    options, args = readArgs()
+
+    if options.run:
+        try:
+            sys.exit(runEngine(options.socket, args, seed=options.seed))
+        except socket.error, e:
+            if not daemon_unavailable(e):
+                print >> sys.stderr, "Cannot connect to the engine daemon at %s: %s" % (options.socket, e)
+                sys.exit(1)
+        # there is no daemon, run testengine in this process
+        print >> sys.stderr, "No engine daemon at %s, running testengine locally" % options.socket
+        sys.stderr.flush()
+        os.execv(sys.executable, [sys.executable, engine_file()] + args)
+
+    if args:
+        print >> sys.stderr, "Unexpected argument: %s" % args[0]
+        sys.exit(1)
+
+    daemon = EngineDaemon(options.socket, options.max_models)
+    daemon.preloadModules()
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# Copyright (c) 2006-2010 Tampere University of Technology
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Profiler measures where the time of a test run goes. It is used by
+testengine when it is given the --profile argument.
+
+The test engine tells the profiler which phase of a test step
+(planning, testdata, actionpp, adapter, model, markExecuted, cache)
+it is in. The time between two phase calls is added to the earlier
+phase. In addition, methods of the test model, coverage requirement
+etc. can be wrapped with countCalls to count and time their calls.
+
+Summaries are written to the log.
+
+Profiler understands the following parameters (--profile-args):
+
+- interval (natural number, default: 1000)
+
+  A summary is logged after every interval test steps. If 0, the
+  summary is logged only at the end of the test run.
+
+- cprofile (string, default: '')
+
+  The name of the file to which the statistics of cProfile are
+  dumped at the end of the test run. The statistics can be read with
+  the pstats module. cProfile slows down the test run considerably.
+"""
+
+import timeit
+
+# time.clock on Windows, time.time elsewhere
+timer = timeit.default_timer
+
+
+class Profiler:
+
+    def __init__(self):
+        self._params = {}
+        self.setParameter("interval", 1000)
+        self.setParameter("cprofile", "")
+        self._phasenames = []
+        self._phasetimes = {}
+        self._callnames = []
+        self._calls = {} # name -> [number of calls, time]
+        self._phase = None
+        self._phasestart = None
+        self._steps = 0
+
+    def setParameter(self, name, value):
+        if not name in ["interval", "cprofile"]:
+            print __doc__
+            raise Exception("Invalid parameter '%s' for profiler." % name)
+        self._params[name] = value
+
+    def getParameter(self, name, default=None):
+        return self._params.get(name, default)
+
+    def phase(self, name):
+        """Ends the current phase and starts the given one. None ends
+        the current phase without starting a new one."""
+        now = timer()
+        if self._phase is not None:
+            self._phasetimes[self._phase] += now - self._phasestart
+        if name is not None and not name in self._phasetimes:
+            self._phasenames.append(name)
+            self._phasetimes[name] = 0.0
+        self._phase = name
+        self._phasestart = now
+
+    def step(self):
+        """Called after every test step."""
+        self._steps += 1
+        interval = self._params["interval"]
+        if interval and self._steps % interval == 0:
+            self.logSummary()
+
+    def countCalls(self, obj, methodname, name):
+        """Replaces obj.methodname with a wrapper that counts and times
+        its calls under the given name."""
+        method = getattr(obj, methodname)
+        if not name in self._calls:
+            self._callnames.append(name)
+            self._calls[name] = [0, 0.0]
+        calls = self._calls[name]
+        def counted(*args, **kwargs):
+            calls[0] += 1
+            start = timer()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                calls[1] += timer() - start
+        setattr(obj, methodname, counted)
+
+    def logSummary(self):
+        total = sum(self._phasetimes.values())
+        if not self._steps or total <= 0.0:
+            return
+        self.log("%s steps in %.3f s, %.6f s/step" %
+                 (self._steps, total, total / self._steps))
+        self.log("Phases: %s" % ", ".join(
+            ["%s %.1f%% %.6f s/step" % (p, 100.0 * self._phasetimes[p] / total,
+                                        self._phasetimes[p] / self._steps)
+             for p in self._phasenames]))
+        if self._callnames:
+            self.log("Calls: %s" % ", ".join(
+                ["%s %s (%.3f s)" % (c, self._calls[c][0], self._calls[c][1])
+                 for c in self._callnames]))
+
+    def runcall(self, function, *args, **kwargs):
+        """Calls the function, with cProfile if it is enabled."""
+        filename = self._params["cprofile"]
+        if not filename:
+            return function(*args, **kwargs)
+        import cProfile
+        prof = cProfile.Profile()
+        try:
+            return prof.runcall(function, *args, **kwargs)
+        finally:
+            prof.dump_stats(filename)
+            self.log("cProfile statistics written to '%s'" % filename)
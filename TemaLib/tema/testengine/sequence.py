@@ -0,0 +1,139 @@
+# Copyright (c) 2006-2010 Tampere University of Technology
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Test sequences generated offline and replayed against the SUT. They
+are used by testengine when it is given the --generate or --replay
+argument.
+
+With --generate=FILE, the guidance and the coverage requirement are
+run against the test model only. Nothing is sent to the SUT: every
+keyword is assumed to have the result the guidance suggested. The
+executed transitions are written to FILE, one line per transition:
+
+ACTION<tab>DESTINATION STATE
+
+Lines beginning with # are comments. If the name of the file ends with
+.gz, the file is compressed with gzip.
+
+With --replay=FILE, the transitions in FILE are executed without
+calling the guidance. The keywords are sent to the SUT as in any test
+run, and the executed action and the destination state are checked
+against the file. If they differ, for example because a keyword
+failed when it was expected to succeed, the replay ends and the
+guidance plans the rest of the test run as usual.
+"""
+
+import gzip
+import random
+
+def openSequenceFile(filename,mode="r"):
+    """Opens a test sequence file. Files whose names end with .gz are
+    compressed with gzip."""
+    if filename.endswith(".gz"):
+        return gzip.open(filename,mode+"b",6)
+    return open(filename,mode)
+
+class SequenceWriter:
+    """Writes the executed transitions to a test sequence file."""
+
+    def __init__(self,fileobj,comments=()):
+        self._file=fileobj
+        self._steps=0
+        for c in comments:
+            self._file.write("# %s\n" % c)
+
+    def markExecuted(self,transition):
+        self._file.write("%s\t%s\n" % (transition.getAction(),
+                                       transition.getDestState()))
+        self._steps+=1
+
+    def getSteps(self):
+        return self._steps
+
+    def close(self):
+        self._file.close()
+
+class SequenceReplay:
+    """Suggests the actions in a test sequence file and checks that
+    they are executed as expected. The file is read one step at a
+    time."""
+
+    def __init__(self,fileobj):
+        self._file=fileobj
+        self._lines=iter(fileobj)
+        self._step=0
+        self._expected=None
+        self._active=True
+        self._next()
+
+    def log(self,msg): pass
+
+    def _next(self):
+        for line in self._lines:
+            line=line.rstrip("\r\n")
+            if not line or line.startswith("#"):
+                continue
+            action,state=line.rsplit("\t",1)
+            self._expected=(action,state)
+            return
+        self._stop("Replay finished after %s steps." % self._step)
+
+    def _stop(self,message):
+        self.log(message)
+        self._active=False
+        self._expected=None
+        self._file.close()
+
+    def isActive(self):
+        return self._active
+
+    def suggestAction(self,state):
+        """Returns the next action in the sequence, or None if the
+        sequence has ended or the action cannot be executed in the
+        state."""
+        if not self._active:
+            return None
+        for t in state.getOutTransitions():
+            if str(t.getAction())==self._expected[0]:
+                return t.getAction()
+        self._stop("Diverged at step %s: '%s' cannot be executed in state %s. Replanning." % (self._step+1,self._expected[0],state))
+        return None
+
+    def chooseTransition(self,transitions):
+        """Returns the transition that leads to the expected state, or a
+        random one if there is no such transition."""
+        if self._active:
+            for t in transitions:
+                if str(t.getDestState())==self._expected[1]:
+                    return t
+        return random.choice(transitions)
+
+    def markExecuted(self,transition):
+        if not self._active:
+            return
+        action,state=str(transition.getAction()),str(transition.getDestState())
+        if (action,state)!=self._expected:
+            self._stop("Diverged at step %s: expected '%s' to state %s, executed '%s' to state %s. Replanning." % ((self._step+1,)+self._expected+(action,state)))
+            return
+        self._step+=1
+        self._next()
@@ -40,6 +40,9 @@ coveragereq-args:
 initmodels:
     models for initialising a test run. These models are executed
     before the execution of the main test model is started.
+    'lstsmodel:close-apps.lsts@Phone1' tells that the model initialises
+    target Phone1. Models of different targets are executed concurrently
+    if the adapter supports it.
 
 testdata:
     datafiles that should be used in testing. $(expression)$ in the
@@ -64,6 +67,41 @@ verify-states:
     1: always executes all the encountered state verifications
     0 (default): no special treatment to state verifications
 
+profile:
+    a flag without a value. Logs the time spent in each phase of the
+    test steps (planning, testdata, actionpp, adapter, model,
+    markExecuted, cache) and the number of states expanded in the
+    test model every 1000 steps and at the end of the test run.
+
+profile-args:
+    arguments for the profiler, for example
+    'interval:100,cprofile:engine.prof' logs a summary every 100
+    steps and dumps cProfile statistics to engine.prof.
+
+generate:
+    generates a test sequence offline to the given file. The SUT is
+    not used: adapter and initmodels are ignored, and every keyword
+    is assumed to have the result that the guidance suggested.
+
+replay:
+    executes the test sequence in the given file (see generate)
+    against the SUT. The guidance is used only if the SUT or the test
+    model diverges from the sequence.
+
+checkpoint:
+    the file to which checkpoints of the test run are written. A
+    checkpoint is written every checkpoint-interval steps in the
+    background and when the test run ends.
+
+checkpoint-interval:
+    the number of test steps between checkpoints (default: 100)
+
+resume:
+    a flag without a value. Continues the test run from the
+    checkpoint in the checkpoint file. The trace in the checkpoint is
+    executed in the test model, the coverage requirement and the
+    guidance without the SUT, and initmodels are not executed.
+
 testengine --model=parallellstsmodel:gallerycalendar.pcrules \\
            --coverage='clparser' \\
            --coveragereq='actions .*fullscreen.*' \\
@@ -118,6 +156,13 @@ ARG_ACTIONPP="actionpp" # Actionname post-processor
 ARG_ACTIONPP_ARGS="actionpp-args"
 ARG_STOP_AFTER="stop-after"
 ARG_VERIFY_STATES="verify-states"
+ARG_PROFILE="profile"
+ARG_PROFILE_ARGS="profile-args"
+ARG_GENERATE="generate"
+ARG_REPLAY="replay"
+ARG_CHECKPOINT="checkpoint"
+ARG_CHECKPOINT_INTERVAL="checkpoint-interval"
+ARG_RESUME="resume"
 
 CMDLINE_ARGUMENTS=[ "%s" % a
                     for a in (ARG_MODEL,
@@ -136,7 +181,15 @@ CMDLINE_ARGUMENTS=[ "%s" % a
                               ARG_ACTIONPP,
                               ARG_ACTIONPP_ARGS,
                               ARG_STOP_AFTER,
-                              ARG_VERIFY_STATES) ]
+                              ARG_VERIFY_STATES,
+                              ARG_PROFILE_ARGS,
+                              ARG_GENERATE,
+                              ARG_REPLAY,
+                              ARG_CHECKPOINT,
+                              ARG_CHECKPOINT_INTERVAL) ]
+
+# arguments that do not take a value
+CMDLINE_FLAGS=[ ARG_PROFILE, ARG_RESUME ]
 
 # arguments without default values are required in the command line
 
@@ -154,7 +207,14 @@ CMDLINE_DEFAULTS={ ARG_COVERAGE: "",
                    ARG_ACTIONPP: "",
                    ARG_ACTIONPP_ARGS: "",
                    ARG_STOP_AFTER: "",
-                   ARG_VERIFY_STATES: "0"
+                   ARG_VERIFY_STATES: "0",
+                   ARG_PROFILE: False,
+                   ARG_PROFILE_ARGS: "",
+                   ARG_GENERATE: "",
+                   ARG_REPLAY: "",
+                   ARG_CHECKPOINT: "",
+                   ARG_CHECKPOINT_INTERVAL: "100",
+                   ARG_RESUME: False
                    }
 
 
@@ -232,7 +292,13 @@ class TestEngine:
         else:
             self._stop_time = 0.0
 
-    def run_test(self,testmodel,current_state,covreq,testdata,guidance,adapter,appchain,verifier=None):
+    def run_test(self,testmodel,current_state,covreq,testdata,guidance,adapter,appchain,verifier=None,profiler=None,recorder=None,replay=None,checkpointer=None):
+        """Runs the test. If adapter is None, the test is run offline:
+        keywords are not sent anywhere, they are assumed to have the
+        results that were suggested. The executed transitions are
+        given to the recorder and the checkpointer, if any. The
+        actions suggested by the replay are executed while it is
+        active."""
 
         # FIXME: Should this be a class method?
         def handler(signum,frame):
@@ -240,7 +306,8 @@ class TestEngine:
         # Signals we are catching
         signal.signal(signal.SIGTERM,handler)
 
-        stepcounter=0
+        if checkpointer: stepcounter=checkpointer.getSteps()
+        else:            stepcounter=0
 
         # clean model cache after every 10000 executions.
         # some guidances may clean up the cache themselves
@@ -251,17 +318,25 @@ class TestEngine:
 
         self.log("Testing starts from state %s" % current_state)
 
+        if profiler: profiler.phase("model")
+
         while (self._stop_time == 0.0 or time.time() < self._stop_time) and covreq.getPercentage()<1.0 and len(current_state.getOutTransitions())>0:
 
             stepcounter+=1
 
             # 1. Choose action to be executed
 
-            # If verifier is set and it gives an action, we'll execute that.
+            # If a replay is active, we'll execute its action. Otherwise
+            # if verifier is set and it gives an action, we'll execute that.
             # Otherwise, guidance chooses the action to be executed.
 
-            if verifier: verifying_action = verifier.getAction(current_state)
-            else:        verifying_action = None
+            if profiler: profiler.phase("planning")
+
+            if replay: verifying_action = replay.suggestAction(current_state)
+            else:      verifying_action = None
+
+            if verifier and verifying_action is None:
+                verifying_action = verifier.getAction(current_state)
 
             if verifying_action is None:
                 if guidance.isThreadable():
@@ -284,7 +359,10 @@ class TestEngine:
 
                      
             # 2. Evaluate testdata, communicate with the SUT, if necessary
-            if suggested_action.isKeyword():
+            if suggested_action.isKeyword() and adapter is None:
+                # Offline: the keyword is assumed to succeed as suggested
+                executed_action_name=suggested_action.toString()
+            elif suggested_action.isKeyword():
                 # Keywords cause communication
                 try:
                     # force keyword to be positive (without '~')
@@ -294,9 +372,12 @@ class TestEngine:
                     else:
                         sent_action_name=suggested_action.toString()
                     #adapter._set_current_state_UGLY_HACK(current_state)
-                    result=adapter.sendInput(
-                        appchain.process(
-                        testdata.processAction(sent_action_name)))
+                    if profiler: profiler.phase("testdata")
+                    sent_action_name=testdata.processAction(sent_action_name)
+                    if profiler: profiler.phase("actionpp")
+                    sent_action_name=appchain.process(sent_action_name)
+                    if profiler: profiler.phase("adapter")
+                    result=adapter.sendInput(sent_action_name)
                 except AdapterError,e:
                     self.log("Adapter error, cannot continue: %s" % e)
                     return "Adapter error: %s" % e
@@ -314,11 +395,13 @@ class TestEngine:
             else:
                 # Action is not a keyword => no communication
                 executed_action_name=suggested_action.toString()
+                if profiler: profiler.phase("testdata")
                 testdata.processAction(executed_action_name)
 
 
             # 3. Check that we can execute executed_action_name also in
             #    the model
+            if profiler: profiler.phase("model")
 
             possible_transitions=[ t for t in current_state.getOutTransitions() \
                                    if t.getAction().toString()==executed_action_name ]
@@ -332,23 +415,28 @@ class TestEngine:
                 # Model can not execute the required action =>
                 # *** error found ***
                 self.log("Error found: cannot execute '%s' in the model" % executed_action_name)
-                try:
-                    if hasattr(adapter,"errorFound"): adapter.errorFound()
-                except AdapterError,e:
-                    self.log("Adapter error when it was being informed about an error: %s" % e)
+                if adapter is not None:
+                    try:
+                        if hasattr(adapter,"errorFound"): adapter.errorFound()
+                    except AdapterError,e:
+                        self.log("Adapter error when it was being informed about an error: %s" % e)
 
-                self.log("Shutting down the adapter")
-                try:
-                    adapter.stop()
-                except AdapterError,e:
-                    self.log("Adapter error when tried to quit the connection: %s" % e)
+                    self.log("Shutting down the adapter")
+                    try:
+                        adapter.stop()
+                    except AdapterError,e:
+                        self.log("Adapter error when tried to quit the connection: %s" % e)
                 self.log("Verdict: FAIL")
+                if profiler:
+                    profiler.phase(None)
+                    profiler.logSummary()
 
                 return "Error found: cannot execute '%s' in model state %s." % \
                       (executed_action_name,current_state)
 
             # 4. Execute the transition (if many, print warning on nondeterminism)
-            chosen_transition=random.choice(possible_transitions) 
+            if replay: chosen_transition=replay.chooseTransition(possible_transitions)
+            else:      chosen_transition=random.choice(possible_transitions) 
             if len(possible_transitions)>1:
                 print "Non determinism:",[str(t) for t in possible_transitions]
 
@@ -363,20 +451,37 @@ class TestEngine:
                         chosen_transition.getDestState().getStateProps()
                         if "SleepState" not in str(s)] ))
 
+            if profiler: profiler.phase("markExecuted")
+
             guidance.markExecuted(chosen_transition)
 
             if verifier: verifier.markExecuted(chosen_transition)
 
+            if replay: replay.markExecuted(chosen_transition)
+
+            if recorder: recorder.markExecuted(chosen_transition)
+
+            if checkpointer: checkpointer.markExecuted(current_state,chosen_transition)
+
             current_state=chosen_transition.getDestState()
 
             executionsSinceCacheClearange += 1
             if executionsSinceCacheClearange >= cacheClearanceInterval:
+                if profiler: profiler.phase("cache")
                 testmodel.clearCache()
                 executionsSinceCacheClearange = 0
 
+            if profiler:
+                # the loop condition expands the new state
+                profiler.phase("model")
+                profiler.step()
+
             # 5. Then loop.
 
         # Out of loop...
+        if profiler:
+            profiler.phase(None)
+            profiler.logSummary()
         result_comment="____ Undefined ____"
         if (self._stop_time > 0.0 and time.time() > self._stop_time):
             self.log("Time to stop")
@@ -390,11 +495,12 @@ class TestEngine:
             self.log("Required coverage acquired")
             self.log("Verdict: PASS")
             result_comment =  "Coverage requirement fulfilled."
-        self.log("Shutting down the adapter")
-        try:
-            adapter.stop()
-        except AdapterError,e:
-            self.log("Adapter error when tried to quit the connection: %s" % e)
+        if adapter is not None:
+            self.log("Shutting down the adapter")
+            try:
+                adapter.stop()
+            except AdapterError,e:
+                self.log("Adapter error when tried to quit the connection: %s" % e)
         return result_comment
 
 
@@ -405,11 +511,12 @@ def parse_arguments(arglist):
     try:
         optlist,rest=getopt.getopt(arglist,
                             [],
-                            [ "%s=" % a for a in CMDLINE_ARGUMENTS ])
+                            [ "%s=" % a for a in CMDLINE_ARGUMENTS ] + CMDLINE_FLAGS)
         if rest!=[]: raise ArgumentError("Unable to parse argument '%s'" % str(rest[0]))
         retval={}
         retval.update(CMDLINE_DEFAULTS)
         for k,v in optlist:
+            if k[2:] in CMDLINE_FLAGS: v=True
             retval[k[2:]]=v # remove '--' in front of the option name
 
         # require that every argument has a value (either default or explicit)
@@ -467,6 +574,7 @@ def import_tema_modules(options):
         modelmodule=__import__("tema.model."+nv.name,globals(),locals(),[''])
         Model=modelmodule.Model
         Model.ARG_source_file=nv.value # Model will be loaded from source_file
+        Model.ARG_model_type=nv.name
 
         # imported guidance depends on the parameters...
         guidancemodule=__import__("tema.guidance."+options[ARG_GUIDANCE],globals(),locals(),[''])
@@ -516,6 +624,11 @@ def main():
         print sys.argv
         error(e)
 
+    if options[ARG_GENERATE] and options[ARG_REPLAY]:
+        error("--%s and --%s cannot be used together" % (ARG_GENERATE,ARG_REPLAY))
+    if options[ARG_RESUME] and not options[ARG_CHECKPOINT]:
+        error("--%s requires --%s" % (ARG_RESUME,ARG_CHECKPOINT))
+
     import_tema_modules(options)
 
     # try to optimize
@@ -548,6 +661,35 @@ def main():
         
     except Exception,e: error("setting up logger failed: '%s'" % e)
 
+    # setup profiler
+    if options[ARG_PROFILE] or options[ARG_PROFILE_ARGS]:
+        from tema.testengine.profiler import Profiler
+        logger.listen(Profiler)
+        if not hasattr(Profiler,'log'): Profiler.log = lambda self,message: None
+        profiler=Profiler()
+        try:
+            set_parameters(profiler,options[ARG_PROFILE_ARGS])
+        except Exception, e: error("setting up profiler arguments failed: '%s'" % e)
+    else:
+        profiler=None
+
+    # setup test sequence generation or replay
+    recorder=None
+    replay=None
+    if options[ARG_GENERATE] or options[ARG_REPLAY]:
+        from tema.testengine.sequence import openSequenceFile, \
+            SequenceWriter, SequenceReplay
+        logger.listen(SequenceReplay)
+        try:
+            if options[ARG_GENERATE]:
+                recorder=SequenceWriter(
+                    openSequenceFile(options[ARG_GENERATE],"w"),
+                    ["--%s=%s" % (a,options[a]) for a in
+                     (ARG_MODEL,ARG_COVERAGE,ARG_COVERAGE_REQ,
+                      ARG_GUIDANCE,ARG_GUIDANCE_ARGS)])
+            else:
+                replay=SequenceReplay(openSequenceFile(options[ARG_REPLAY]))
+        except Exception, e: error("opening test sequence failed: '%s'" % e)
 
     # Initialize test run
     try:
@@ -557,8 +699,12 @@ def main():
 
     # setup test model
     try:
-        model=Model()
-        model.loadFromFile( file(Model.ARG_source_file) )
+        # the engine daemon may have loaded the model already
+        from tema.model import getPreloadedModel
+        model=getPreloadedModel(Model.ARG_model_type,Model.ARG_source_file)
+        if model is None:
+            model=Model()
+            model.loadFromFile( file(Model.ARG_source_file) )
         initial_state=model.getInitialState()
     except Exception, e: error("setting up test model failed: '%s'" % e)
 
@@ -607,6 +753,35 @@ def main():
     else:
         verifier = None
 
+    # resume from the checkpoint, start checkpointing
+    checkpointer=None
+    if options[ARG_CHECKPOINT]:
+        from tema.testengine.checkpoint import Checkpointer, \
+            readCheckpoint, executeTrace
+        logger.listen(Checkpointer)
+        header={ "model": options[ARG_MODEL] }
+        trace=None
+        if options[ARG_RESUME]:
+            try:
+                header,trace=readCheckpoint(options[ARG_CHECKPOINT])
+            except Exception, e: error("reading checkpoint failed: '%s'" % e)
+            if header.get("model")!=options[ARG_MODEL]:
+                error("the checkpoint is of model '%s'" % header.get("model"))
+            try:
+                initial_state=executeTrace(trace,header["transitions"],model,
+                                           initial_state,guidance,testdata,
+                                           verifier)
+            except Exception, e: error("executing the checkpoint failed: '%s'" % e)
+            random.setstate(header["random"])
+            guidance.setRandomState(header.get("guidancerandom"))
+            model.log("Resumed from checkpoint at step %s, state %s" %
+                      (len(trace),initial_state))
+        try:
+            checkpointer=Checkpointer(options[ARG_CHECKPOINT],
+                                      int(options[ARG_CHECKPOINT_INTERVAL]),
+                                      header,trace,guidance)
+        except Exception, e: error("setting up checkpoints failed: '%s'" % e)
+
     # import action postprocessors
     import tema.actionpp.actionpp
     appchain=tema.actionpp.actionpp.ActionPPChain()
@@ -617,33 +792,52 @@ def main():
         set_parameters(app,options[ARG_ACTIONPP_ARGS])
         appchain.append(app)
 
-    # setup adapter
-    try:
-        adapter=Adapter()
+    # setup adapter (none when generating offline)
+    adapter=None
+    if not recorder:
         try:
-            set_parameters(adapter,options[ARG_ADAPTER_ARGS])
-        except Exception, e: error("setting up adapter arguments failed: '%s'" % e)
-        adapter.prepareForRun()
-    except KeyboardInterrupt:
-        sys.exit(1)
-    except Exception, e:
-        if not isinstance(e,SystemExit):
-            error("setting up adapter failed: '%s'" % e)
-        else: raise e
-
-    try:
-        initengine.run_init(adapter, testdata, appchain)
-    except Exception, e: error("test run initialization failed: '%s'" % e)
+            adapter=Adapter()
+            try:
+                set_parameters(adapter,options[ARG_ADAPTER_ARGS])
+            except Exception, e: error("setting up adapter arguments failed: '%s'" % e)
+            adapter.prepareForRun()
+        except KeyboardInterrupt:
+            sys.exit(1)
+        except Exception, e:
+            if not isinstance(e,SystemExit):
+                error("setting up adapter failed: '%s'" % e)
+            else: raise e
+
+        if not options[ARG_RESUME]:
+            try:
+                initengine.run_init(adapter, testdata, appchain)
+            except Exception, e: error("test run initialization failed: '%s'" % e)
     
     # Run!
     te=TestEngine()
     te.set_stop_time(options[ARG_STOP_AFTER])
 
+    if profiler:
+        if hasattr(model,"_getOutTransitions"):
+            profiler.countCalls(model,"_getOutTransitions","states expanded")
+        profiler.countCalls(covreq,"markExecuted","coverage markExecuted")
+
     result = ""
     # Catch exceptions so that logger would close the filehandles and write
     # buffers to disk.
     try:
-        result=te.run_test(model,initial_state,covreq,testdata,guidance,adapter,appchain,verifier)
+        try:
+            if profiler:
+                result=profiler.runcall(te.run_test,model,initial_state,covreq,testdata,guidance,adapter,appchain,verifier,profiler,recorder,replay,checkpointer)
+            else:
+                result=te.run_test(model,initial_state,covreq,testdata,guidance,adapter,appchain,verifier,None,recorder,replay,checkpointer)
+        finally:
+            if checkpointer:
+                checkpointer.close()
+            if recorder:
+                recorder.close()
+                te.log("Test sequence of %s steps written to %s" %
+                       (recorder.getSteps(),options[ARG_GENERATE]))
     # We don't want stack trace for normal exit
     except SystemExit,e:
         raise
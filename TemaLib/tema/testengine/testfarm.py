@@ -0,0 +1,430 @@
+#!/usr/bin/env python
+# Copyright (c) 2006-2010 Tampere University of Technology
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Runs a test farm: several testengine workers that share one coverage
+requirement, each with its own adapter.
+
+The coverage requirement of the farm is given in the clparser or the
+findnew syntax. Because the farm requires every target action to be
+executed, a clparser requirement may only consist of "actions REGEXP"
+parts joined with "and", and a findnew requirement may only be a
+single kw, keyword, aw, start_aw, end_aw or edge requirement; "or" and
+"while" would mean something else. The target actions are the actions
+matched by the parts, or for findnew, the actions counted by the
+requirement. The farm divides the target actions between the
+workers. Each worker gets a contiguous range of the sorted
+action names, so the actions of the same application tend to go to
+the same worker.
+
+The workers run testengine with farmcoverage (tema.coverage.farmcoverage)
+and talk to the coordinator over a local UNIX socket. A worker reports
+the target actions it executes and gets its share of the unfinished
+actions in return. A worker that has finished its share takes over half
+of the largest share of another worker, or shares the last actions of
+another worker. The share of a worker that exits is divided among the
+others. The coverage of the farm is the percentage of the target
+actions executed by any worker. The workers stop when it is 100%.
+
+The arguments after -- are passed to every worker. The adapter
+arguments can be given for each worker with --adapter-args, in the
+order of the workers; "%(worker)s" in them is replaced by the number of
+the worker. The output of worker N is written to workerN.log in the
+log directory.
+
+Examples:
+
+tema testfarm -n 3 --coveragereq='actions .*' --adapter-args='port:909%(worker)s' -- --model=parallellstsmodel:rules.ext --adapter=socketserveradapter --guidance=gameguidance
+
+tema testfarm -n 2 --coveragereq='findnew kw' --adapter-args=delay:0,model:rules.ext -- --model=parallellstsmodel:rules.ext --adapter=testadapter --guidance=greedyguidance --testdata=nodata
+"""
+
+import sys
+import os
+import time
+import errno
+import select
+import signal
+import socket
+import shutil
+import optparse
+import tempfile
+import subprocess
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+import tema.model
+import tema.testengine
+
+# the findnew requirements whose items are actions
+FINDNEW_ACTION_REQUIREMENTS = ["kw", "keyword", "aw", "start_aw", "end_aw",
+                               "edge"]
+
+# the coverage arguments of the workers are set by the farm
+RESERVED_ENGINE_ARGUMENTS = ["coverage", "coveragereq", "coveragereq-args"]
+
+# seconds to wait for the workers to stop after the farm is finished
+STOP_TIMEOUT = 30
+
+
+def _option_value(args, name):
+    for a in args:
+        if a.startswith("--%s=" % name):
+            return a.split("=", 1)[1]
+    return ""
+
+
+def _clparser_action_requirements(req, reqstr):
+    # Only "actions REGEXP" requirements joined with "and" require every
+    # matched action to be executed. "action REGEXP", "or" and "then"
+    # would be changed by a farm that covers every matched action.
+    import tema.coverage.coverage as coverage
+    if isinstance(req, coverage.CombinedRequirement):
+        if req._operator != coverage.ecoAnd:
+            raise ValueError("The clparser requirement of a farm may only "
+                             "join its parts with 'and': '%s'" % reqstr)
+        for r in req._requirements:
+            for actionreq in _clparser_action_requirements(r, reqstr):
+                yield actionreq
+    elif req._quantifier == coverage.eqqAll and \
+            req._query._itemtype == coverage.eqiAction:
+        yield req
+    else:
+        raise ValueError("The clparser requirement of a farm may only "
+                         "consist of 'actions REGEXP' parts: '%s'" % reqstr)
+
+
+def target_actions(model, reqstr):
+    """Returns the names of the target actions of the coverage
+    requirement in the model."""
+    reqstr = reqstr.strip()
+    if reqstr.startswith("action"):
+        import tema.coverage.clparser as clparser
+        req = clparser.requirement(reqstr, model=model)
+        actions = set()
+        for r in _clparser_action_requirements(req, reqstr):
+            rex, unused = r.getExecutionHint()
+            actions.update(model.matchedActions(rex))
+        return actions
+    elif reqstr.startswith("findnew"):
+        import tema.coverage.findnewcoverage as findnewcoverage
+        from tema.model.model import Transition
+        req = findnewcoverage.requirement(reqstr, model=model)
+        # "or" and "while" ("and") would not require every action
+        if req._name not in FINDNEW_ACTION_REQUIREMENTS:
+            raise ValueError("The findnew requirement of a farm may only "
+                             "be one of %s: '%s'" %
+                             (", ".join(FINDNEW_ACTION_REQUIREMENTS), reqstr))
+        actions = set()
+        for action in model.getActions():
+            # the filter of the requirement only looks at the action
+            for item in req.filterRelevant(Transition(None, action, None)):
+                actions.add(action.toString())
+                break
+        return actions
+    raise ValueError("The coverage requirement of a farm must be in the "
+                     "clparser or the findnew syntax: '%s'" % reqstr)
+
+
+class TestFarm:
+    """Keeps the shares of the target actions of the workers."""
+
+    def __init__(self, targets, workers):
+        self._targets = sorted(targets)
+        self._targetset = frozenset(targets)
+        self._covered = set()
+        self._coveredby = [0] * workers
+        self._running = set(range(workers))
+        # worker -> the unfinished actions in its share
+        self._shares = {}
+        for w in range(workers):
+            begin = len(self._targets) * w // workers
+            end = len(self._targets) * (w + 1) // workers
+            self._shares[w] = set(self._targets[begin:end])
+
+    def log(self, msg):
+        print "%s testfarm: %s" % (time.strftime("%H:%M:%S"), msg)
+        sys.stdout.flush()
+
+    def getPercentage(self):
+        if not self._targets:
+            return 1.0
+        return len(self._covered) / float(len(self._targets))
+
+    def isFinished(self):
+        return len(self._covered) == len(self._targets)
+
+    def getCoveredBy(self, worker):
+        return self._coveredby[worker]
+
+    def handle(self, worker, message):
+        """Handles a message from a worker, returns the reply."""
+        if worker not in self._running:
+            raise ValueError("Message from an unknown worker %s: '%s'"
+                             % (worker, message))
+        reply = {}
+        if message.startswith("hello "):
+            reply["targets"] = self._targets
+        elif message.startswith("executed "):
+            self.markExecuted(worker, message[len("executed "):])
+        elif message != "poll":
+            raise ValueError("Invalid message from worker %s: '%s'"
+                             % (worker, message))
+        if not self._shares.get(worker) and not self.isFinished():
+            self.rebalance(worker)
+        reply["assigned"] = sorted(self._shares.get(worker, ()))
+        reply["covered"] = len(self._covered)
+        reply["total"] = len(self._targets)
+        reply["done"] = self.isFinished()
+        return reply
+
+    def markExecuted(self, worker, action):
+        if action not in self._targetset or action in self._covered:
+            return
+        self._covered.add(action)
+        self._coveredby[worker] += 1
+        for share in self._shares.itervalues():
+            share.discard(action)
+        self.log("Coverage: %.1f%% (%s/%s), worker %s executed %s" %
+                 (self.getPercentage() * 100.0, len(self._covered),
+                  len(self._targets), worker, action))
+
+    def rebalance(self, worker):
+        """Gives actions from the largest share of the other workers to
+        the worker."""
+        others = [ (len(self._shares[w]), w) for w in self._running
+                   if w != worker and self._shares.get(w) ]
+        if not others:
+            return
+        size, donor = max(others)
+        actions = sorted(self._shares[donor])
+        if size >= 2:
+            moved = actions[size // 2:]
+            self._shares[donor].difference_update(moved)
+            self.log("Moved %s actions from worker %s to worker %s"
+                     % (len(moved), donor, worker))
+        else:
+            moved = actions
+            self.log("Worker %s shares the last action of worker %s"
+                     % (worker, donor))
+        self._shares[worker] = set(moved)
+
+    def workerExited(self, worker):
+        """Divides the unfinished actions of the worker among the
+        running workers."""
+        self._running.discard(worker)
+        orphans = self._shares.pop(worker, set())
+        for w in self._running:
+            orphans.difference_update(self._shares[w])
+        running = sorted(self._running)
+        if not orphans or not running:
+            return
+        for i, action in enumerate(sorted(orphans)):
+            self._shares[running[i % len(running)]].add(action)
+        self.log("Divided %s actions of worker %s among workers %s"
+                 % (len(orphans), worker, running))
+
+
+class _Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = ""
+        self.worker = None
+
+
+def serve(farm, server, processes):
+    """Handles the messages of the workers until they have all exited.
+    processes is a list of the worker processes, the Nth is worker N."""
+    connections = {}
+    running = dict(enumerate(processes))
+    finished_at = None
+    while running:
+        readable = select.select([server] + connections.keys(), [], [],
+                                 0.5)[0]
+        for sock in readable:
+            if sock is server:
+                conn = server.accept()[0]
+                connections[conn] = _Connection(conn)
+                continue
+            c = connections[sock]
+            try:
+                data = sock.recv(65536)
+            except socket.error:
+                data = ""
+            if not data:
+                sock.close()
+                del connections[sock]
+                continue
+            c.buffer += data
+            while "\n" in c.buffer:
+                line, c.buffer = c.buffer.split("\n", 1)
+                try:
+                    if c.worker is None and line.startswith("hello "):
+                        c.worker = int(line.split()[1])
+                    reply = farm.handle(c.worker, line)
+                except ValueError, e:
+                    farm.log(e)
+                    continue
+                # action names are byte strings, latin-1 keeps them as is
+                sock.sendall(json.dumps(reply, encoding="latin-1") + "\n")
+        for w, p in running.items():
+            if p.poll() is not None:
+                farm.log("Worker %s exited with status %s" % (w, p.returncode))
+                del running[w]
+                farm.workerExited(w)
+        if farm.isFinished() and running:
+            if finished_at is None:
+                finished_at = time.time()
+            elif time.time() - finished_at > STOP_TIMEOUT:
+                for w, p in running.items():
+                    farm.log("Stopping worker %s" % w)
+                    p.terminate()
+                    p.wait()
+                    del running[w]
+    for sock in connections:
+        sock.close()
+
+
+def readArgs():
+    usagemessage = "usage: %prog [options] -- [testengine arguments]"
+    description = "Runs several testengine workers that share one coverage requirement. The target actions of the requirement are divided between the workers."
+
+    parser = optparse.OptionParser(usage=usagemessage,
+                                   description=description)
+    parser.add_option("-n", "--workers", action="store", type="int",
+                      default=2,
+                      help="Number of workers (default: %default)")
+    parser.add_option("-c", "--coveragereq", action="store", type="str",
+                      help="Coverage requirement of the farm, in the clparser or the findnew syntax")
+    parser.add_option("-a", "--adapter-args", action="append", default=[],
+                      help="Adapter arguments of a worker. Can be given for each worker. %(worker)s is replaced by the number of the worker")
+    parser.add_option("-l", "--logdir", action="store", type="str",
+                      default=".",
+                      help="Directory for the logs of the workers (default: %default)")
+    parser.add_option("-s", "--socket", action="store", type="str",
+                      help="The UNIX socket of the coordinator. Default: a socket in a temporary directory")
+
+    options, args = parser.parse_args()
+    if not options.coveragereq:
+        parser.error("--coveragereq is required")
+    if options.workers < 1:
+        parser.error("--workers must be at least 1")
+    if len(options.adapter_args) > 1 and \
+            len(options.adapter_args) != options.workers:
+        parser.error("--adapter-args must be given once or for every worker")
+    for name in RESERVED_ENGINE_ARGUMENTS:
+        if _option_value(args, name):
+            parser.error("--%s is set by the farm" % name)
+    if options.adapter_args and _option_value(args, "adapter-args"):
+        parser.error("--adapter-args is given both to the farm and to the workers")
+    if not _option_value(args, "model"):
+        parser.error("--model is required in the testengine arguments")
+    return options, args
+
+
+def main():
+    options, args = readArgs()
+
+    modeltype, modelfile = _option_value(args, "model").split(":", 1)
+    f = open(modelfile)
+    try:
+        model = tema.model.loadModel(modeltype, f)
+    finally:
+        f.close()
+    try:
+        targets = target_actions(model, options.coveragereq)
+    except ValueError, e:
+        print >> sys.stderr, e
+        sys.exit(1)
+    if not targets:
+        print >> sys.stderr, "No target actions in the coverage requirement"
+        sys.exit(1)
+
+    farm = TestFarm(targets, options.workers)
+    farm.log("%s target actions, %s workers"
+             % (len(targets), options.workers))
+
+    tmpdir = None
+    socketpath = options.socket
+    if not socketpath:
+        tmpdir = tempfile.mkdtemp(prefix="temafarm")
+        socketpath = os.path.join(tmpdir, "farm.sock")
+    if os.path.exists(socketpath):
+        os.remove(socketpath)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socketpath)
+    server.listen(options.workers)
+
+    enginefile = os.path.join(os.path.dirname(tema.testengine.__file__),
+                              "testengine.py")
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(sys.path)
+    if not os.path.isdir(options.logdir):
+        os.makedirs(options.logdir)
+
+    # the workers are stopped also when the farm is terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    processes = []
+    try:
+        for w in range(options.workers):
+            cmd = [sys.executable, enginefile] + args + [
+                "--coverage=farmcoverage",
+                "--coveragereq=%s %s" % (socketpath, w)]
+            if options.adapter_args:
+                adapterargs = options.adapter_args[
+                    w % len(options.adapter_args)]
+                cmd.append("--adapter-args=%s" %
+                           adapterargs.replace("%(worker)s", str(w)))
+            log = open(os.path.join(options.logdir, "worker%s.log" % w), "w")
+            try:
+                processes.append(subprocess.Popen(
+                    cmd, env=env, stdout=log, stderr=subprocess.STDOUT))
+            finally:
+                log.close()
+        serve(farm, server, processes)
+    finally:
+        for p in processes:
+            if p.poll() is None:
+                p.terminate()
+        server.close()
+        try:
+            os.remove(socketpath)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+        if tmpdir:
+            shutil.rmtree(tmpdir, True)
+
+    for w, p in enumerate(processes):
+        farm.log("Worker %s: executed %s target actions first, exit status %s"
+                 % (w, farm.getCoveredBy(w), p.returncode))
+    farm.log("Coverage: %.1f%%" % (farm.getPercentage() * 100.0))
+    if not farm.isFinished():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
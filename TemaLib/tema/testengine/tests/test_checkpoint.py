@@ -0,0 +1,246 @@
+# Copyright (c) 2006-2010 Tampere University of Technology
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Tests resuming a test run from a checkpoint with a guidance that
+reorders the out transitions of the states (tabuguidance shuffles
+them), and the append-only checkpoint log.
+
+Run with: python test_checkpoint.py (TemaLib in PYTHONPATH)
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import tema.model
+import tema.validator
+from tema.coverage.dummycoverage import CoverageRequirement
+from tema.data.nodata import TestData
+from tema.guidance.tabuguidance import Guidance as TabuGuidance
+from tema.guidance.randomguidance import Guidance as RandomGuidance
+import tema.testengine.checkpoint as checkpoint
+from tema.testengine.checkpoint import Checkpointer, readCheckpoint, \
+    executeTrace
+
+MODEL = os.path.join(os.path.dirname(tema.validator.__file__),
+                     "tests", "Models", "composed.ext")
+
+STEPS = 500
+
+
+def loadModel():
+    f = open(MODEL)
+    try:
+        return tema.model.loadModel("parallellstsmodel", f)
+    finally:
+        f.close()
+
+
+def newGuidance(model):
+    guidance = TabuGuidance()
+    guidance.setParameter("numtabustates", 100)
+    guidance.setTestModel(model)
+    guidance.addRequirement(CoverageRequirement(""))
+    guidance.prepareForRun()
+    return guidance
+
+
+class RecordingGuidance:
+    """Records the transitions marked executed in the guidance."""
+    def __init__(self, guidance):
+        self._guidance = guidance
+        self.executed = []
+
+    def markExecuted(self, transition):
+        self.executed.append((transition.getAction().toString(),
+                              str(transition.getDestState())))
+        self._guidance.markExecuted(transition)
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="temackp")
+        self.filename = os.path.join(self.tmpdir, "run.ckp")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, True)
+
+    def testResumeWithShufflingGuidance(self):
+        random.seed(1)
+        model = loadModel()
+        state = model.getInitialState()
+        guidance = newGuidance(model)
+        checkpointer = Checkpointer(self.filename, 100,
+                                    { "model": MODEL })
+        executed = []
+        for i in xrange(STEPS):
+            action = guidance.suggestAction(state)
+            transition = random.choice([ t for t in state.getOutTransitions()
+                                         if t.getAction() == action ])
+            guidance.markExecuted(transition)
+            checkpointer.markExecuted(state, transition)
+            executed.append((action.toString(),
+                             str(transition.getDestState())))
+            state = transition.getDestState()
+        checkpointer.close()
+
+        header, trace = readCheckpoint(self.filename)
+        self.assertEqual(header["steps"], STEPS)
+        self.assertEqual(len(trace), STEPS)
+
+        # the shuffling in the new run orders the transitions differently
+        random.seed(2)
+        model = loadModel()
+        recorder = RecordingGuidance(newGuidance(model))
+        initial = model.getInitialState()
+        for t in initial.getOutTransitions():
+            recorder._guidance.suggestAction(t.getDestState())
+        resumed = executeTrace(trace, header["transitions"], model,
+                               initial, recorder, TestData())
+        self.assertEqual(recorder.executed, executed)
+        self.assertEqual(str(resumed), str(state))
+
+
+
+class RandomResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="temackp")
+        self.filename = os.path.join(self.tmpdir, "run.ckp")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, True)
+
+    def newGuidance(self, model, seed):
+        guidance = RandomGuidance()
+        guidance.setParameter("randomseed", seed)
+        guidance.setTestModel(model)
+        guidance.addRequirement(CoverageRequirement(""))
+        return guidance
+
+    def runSteps(self, state, guidance, steps, checkpointer=None):
+        actions = []
+        for i in xrange(steps):
+            action = guidance.suggestAction(state)
+            transition = random.choice([ t for t in state.getOutTransitions()
+                                         if t.getAction() == action ])
+            guidance.markExecuted(transition)
+            if checkpointer: checkpointer.markExecuted(state, transition)
+            actions.append(action.toString())
+            state = transition.getDestState()
+        return state, actions
+
+    def testResumeRestoresGuidanceGenerator(self):
+        random.seed(1)
+        model = loadModel()
+        guidance = self.newGuidance(model, 7)
+        checkpointer = Checkpointer(self.filename, 100, {}, None, guidance)
+        state, actions = self.runSteps(model.getInitialState(), guidance,
+                                       300, checkpointer)
+        checkpointer.close()
+        state, continued = self.runSteps(state, guidance, 100)
+
+        random.seed(2)
+        model = loadModel()
+        guidance = self.newGuidance(model, 8)
+        header, trace = readCheckpoint(self.filename)
+        state = executeTrace(trace, header["transitions"], model,
+                             model.getInitialState(), guidance, TestData())
+        random.setstate(header["random"])
+        guidance.setRandomState(header["guidancerandom"])
+        state, resumed = self.runSteps(state, guidance, 100)
+        self.assertEqual(resumed, continued)
+
+
+class CompactionRecorder(Checkpointer):
+    """Records the sizes of the checkpoint file after compactions."""
+    def __init__(self, *args):
+        self.sizes = []
+        Checkpointer.__init__(self, *args)
+
+    def _compact(self, steps, ntransitions):
+        Checkpointer._compact(self, steps, ntransitions)
+        self.sizes.append(os.path.getsize(self._filename))
+
+
+class LogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="temackp")
+        self.filename = os.path.join(self.tmpdir, "run.ckp")
+        self.compaction_min_size = checkpoint.COMPACTION_MIN_SIZE
+        checkpoint.COMPACTION_MIN_SIZE = 0
+
+    def tearDown(self):
+        checkpoint.COMPACTION_MIN_SIZE = self.compaction_min_size
+        shutil.rmtree(self.tmpdir, True)
+
+    def runSteps(self, checkpointer, model, steps):
+        state = model.getInitialState()
+        for i in xrange(steps):
+            transition = random.choice(state.getOutTransitions())
+            checkpointer.markExecuted(state, transition)
+            state = transition.getDestState()
+
+    def testCompaction(self):
+        random.seed(3)
+        model = loadModel()
+        checkpointer = CompactionRecorder(self.filename, 10,
+                                          { "model": MODEL })
+        sizes = checkpointer.sizes
+        self.runSteps(checkpointer, model, 2000)
+        checkpointer.close()
+        # the log is compacted when its size has doubled
+        self.failUnless(1 < len(sizes) < 20, sizes)
+        header, trace = readCheckpoint(self.filename)
+        self.assertEqual(header["steps"], 2000)
+        self.assertEqual(list(trace), list(checkpointer._trace))
+        self.assertEqual(header["transitions"], checkpointer._transitions)
+        self.assertEqual(header["model"], MODEL)
+
+    def testIncompleteRecordIsIgnored(self):
+        random.seed(4)
+        model = loadModel()
+        checkpointer = Checkpointer(self.filename, 10, { "model": MODEL })
+        self.runSteps(checkpointer, model, 95)
+        checkpointer.close()
+        f = open(self.filename, "ab")
+        f.write("\x40\x00\x00\x00\x05\x00\x00\x00\x80\x02")
+        f.close()
+        header, trace = readCheckpoint(self.filename)
+        self.assertEqual(header["steps"], 95)
+        self.assertEqual(list(trace), list(checkpointer._trace))
+
+        # a resumed run compacts the log first
+        checkpointer = Checkpointer(self.filename, 10, header, trace)
+        self.runSteps(checkpointer, model, 10)
+        checkpointer.close()
+        header, trace = readCheckpoint(self.filename)
+        self.assertEqual(header["steps"], 105)
+
+
+if __name__ == "__main__":
+    unittest.main()
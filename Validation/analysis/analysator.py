@@ -22,6 +22,8 @@
 
 """
 Analyses test models, gives numerical information about their reachable portion and an estimate about the same information for their composition. All estimates are upper bounds.
+
+LSTSs and parallel compositions of LSTSs are explored on the integers of the LSTS files instead of through the model interface. With --exact, the composition of the given rules file is computed on the fly, which can be used to check the estimates. --max-states limits the memory used by the exploration.
 """
 
 import os
@@ -29,6 +31,7 @@ import sys
 import optparse
 
 import tema.model.model
+import tema.lsts.lsts as lsts
 from tema.model import getModelType,loadModel
 
 ACTIONS = 'actions'
@@ -114,6 +117,234 @@ def analyseModel(model):
 
     return result
 
+def _analyseStateSpace(initial, successors, statecomb, combprops,
+                       sleepcomb, isActionWord, maxstates=None):
+    """Explores a state space whose states, actions and state
+    proposition combinations are integers.
+
+    successors(state) returns (dest state, action) pairs,
+    statecomb(state) the state proposition combination of the state,
+    combprops(comb) the state propositions of the combination and
+    sleepcomb(comb) tells if the combination is sleeping. If maxstates
+    is given, at most that many states are explored.
+
+    Returns the result dictionary and a boolean that is False if the
+    exploration was stopped by maxstates. In that case the numbers
+    are lower bounds.
+    """
+    visited = set([initial])
+    stack = [initial]
+    complete = True
+
+    actions = set()
+    transitions = 0
+    sleepstates = 0
+    stateprop_combs = set()
+    sleep_stateprop_combs = set()
+    aw_stateprop_combs = set()
+
+    while stack:
+        state = stack.pop()
+        comb = statecomb(state)
+        stateprop_combs.add(comb)
+        if sleepcomb(comb):
+            sleepstates += 1
+            sleep_stateprop_combs.add(comb)
+
+        out = set(successors(state))
+        transitions += len(out)
+        for dest, action in out:
+            actions.add(action)
+            if isActionWord(action):
+                aw_stateprop_combs.add((action, comb))
+            if dest not in visited:
+                if maxstates and len(visited) >= maxstates:
+                    complete = False
+                    continue
+                visited.add(dest)
+                stack.append(dest)
+
+    stateprops = set()
+    for comb in stateprop_combs:
+        stateprops.update(combprops(comb))
+
+    result = {}
+    result[ACTIONS] = len(actions)
+    result[ACTIONWORDS] = len([a for a in actions if isActionWord(a)])
+    result[STATES] = len(visited)
+    result[SLEEPSTATES] = sleepstates
+    result[TRANSITIONS] = transitions
+    result[STATEPROPOSITIONS] = len(stateprops)
+    result[STATEPROPOSITION_COMBINATIONS] = len(stateprop_combs)
+    result[SLEEPING_STATEPROPOSITION_COMBINATIONS] = len(sleep_stateprop_combs)
+    result[ACTIONWORD_STATEPROPOSITION_COMBINATIONS] = len(aw_stateprop_combs)
+
+    return result, complete
+
+def _stateCombinations(lsts_object):
+    """Returns a list that gives the number of the state proposition
+    combination of every state, and a list of the combinations
+    (tuples of state proposition numbers)."""
+    combnumbers = {}
+    combs = []
+    statecombs = []
+    for props in lsts.props_by_states(lsts_object):
+        props = tuple(props)
+        if props not in combnumbers:
+            combnumbers[props] = len(combs)
+            combs.append(props)
+        statecombs.append(combnumbers[props])
+    return statecombs, combs
+
+def _sleepProp(statepropnames, props):
+    """Returns the first of the state propositions that ends with
+    SwitcherBase, or None."""
+    for prop in props:
+        if statepropnames[prop].endswith('SwitcherBase'):
+            return prop
+    return None
+
+def analyseLsts(lsts_object, maxstates = None):
+    """Like analyseModel, but works directly on the transitions of an
+    LSTS. Returns the results and a boolean telling if they are
+    complete (see maxstates of _analyseStateSpace)."""
+    transitions = lsts_object.get_transitions()
+    actionnames = lsts_object.get_actionnames()
+    statepropnames = sorted(lsts_object.get_stateprops().keys())
+    statecombs, combs = _stateCombinations(lsts_object)
+    initial = lsts_object.get_header().initial_states
+
+    base_prop = _sleepProp(statepropnames, combs[statecombs[initial]])
+    sleepcombs = [base_prop is not None and base_prop in c for c in combs]
+    actionwords = [a.find(':start_aw') != -1 for a in actionnames]
+
+    return _analyseStateSpace(initial,
+                              transitions.__getitem__,
+                              statecombs.__getitem__,
+                              combs.__getitem__,
+                              sleepcombs.__getitem__,
+                              actionwords.__getitem__,
+                              maxstates)
+
+def analyseParallelLstsModel(model, maxstates = None):
+    """Like analyseModel, but computes the parallel composition of the
+    component LSTSs of a ParallelLstsModel on the fly on integers,
+    without creating State and Transition objects. A composed state
+    is a mixed radix number whose digits are the states of the
+    components. Returns the results and a boolean telling if they are
+    complete (see maxstates of _analyseStateSpace)."""
+    lstslist = model.getLstsList()
+    components = [l for num, l in lstslist]
+
+    # out[c][s] = {action: [dest states]} of component c in state s
+    out = []
+    component_of = {}
+    radix = []
+    statecombs = []
+    combs = []
+    combradix = []
+    initial = 0
+    base = 1
+    combbase = 1
+    for c, l in enumerate(components):
+        cout = []
+        for tranlist in l.get_transitions():
+            d = {}
+            for dest, action in tranlist:
+                d.setdefault(action, []).append(dest)
+                component_of[action] = c
+            cout.append(d)
+        out.append(cout)
+        radix.append(base)
+        initial += l.get_header().initial_states * base
+        base *= max(1, l.get_header().state_cnt)
+        sc, cb = _stateCombinations(l)
+        statecombs.append(sc)
+        combs.append(cb)
+        combradix.append(combbase)
+        combbase *= max(1, len(cb))
+    radix.append(base)
+    combradix.append(combbase)
+
+    def decode(code, radix):
+        return [(code % radix[c+1]) // radix[c]
+                for c in xrange(len(components))]
+
+    # rules are tried when the first of their actions is enabled
+    rules_by_action = {}
+    always_enabled = []
+    for rule in model.getRuleList():
+        syncacts = rule.getSynchronousActions()
+        involved = {}
+        for action in syncacts:
+            involved.setdefault(component_of.get(action), []).append(action)
+        r = (rule.getResult(), syncacts, involved.items())
+        if not syncacts:
+            always_enabled.append(r)
+        elif None not in involved:
+            rules_by_action.setdefault(syncacts[0], []).append(r)
+
+    def successors(code):
+        states = decode(code, radix)
+        rv = [(code, result) for result, syncacts, involved in always_enabled]
+        for c, s in enumerate(states):
+            for first in out[c][s]:
+                for result, syncacts, involved in rules_by_action.get(first, ()):
+                    for action in syncacts:
+                        ac = component_of[action]
+                        if action not in out[ac][states[ac]]:
+                            break
+                    else:
+                        dests = [code]
+                        for ic, iacts in involved:
+                            s_ic = states[ic]
+                            ds = set()
+                            for action in iacts:
+                                ds.update(out[ic][s_ic][action])
+                            dests = [d + (ds_ - s_ic) * radix[ic]
+                                     for d in dests for ds_ in ds]
+                        rv.extend([(d, result) for d in dests])
+        return rv
+
+    def statecomb(code):
+        comb = 0
+        for c, s in enumerate(decode(code, radix)):
+            comb += statecombs[c][s] * combradix[c]
+        return comb
+
+    def combprops(comb):
+        return [(c, p) for c, cb in enumerate(decode(comb, combradix))
+                for p in combs[c][cb]]
+
+    # the sleep proposition is searched from the initial state like
+    # analyseModel does
+    base_prop = None
+    for c, s in enumerate(decode(initial, radix)):
+        names = sorted(components[c].get_stateprops().keys())
+        p = _sleepProp(names, combs[c][statecombs[c][s]])
+        if p is not None:
+            base_prop = (c, p)
+            break
+    if base_prop is None:
+        sleepcomb = lambda comb: False
+    else:
+        bc, bp = base_prop
+        sleeping = [bp in cb for cb in combs[bc]]
+        sleepcomb = lambda comb: \
+            sleeping[(comb % combradix[bc+1]) // combradix[bc]]
+
+    actionwords = {}
+    def isActionWord(action):
+        try:
+            return actionwords[action]
+        except KeyError:
+            actionwords[action] = \
+                lstslist.int2act(action).find(':start_aw') != -1
+            return actionwords[action]
+
+    return _analyseStateSpace(initial, successors, statecomb, combprops,
+                              sleepcomb, isActionWord, maxstates)
+
 def calculateTotalResults(modelresults, commons = COMMONS_MULTITARGET):
     totalresults = {SLEEPSTATES:1, SLEEPING_STATEPROPOSITION_COMBINATIONS:1}
     totalresults.update(commons)
@@ -144,6 +375,21 @@ def calculateTotalResults(modelresults, commons = COMMONS_MULTITARGET):
 
     return totalresults
 
+def analyseFile(modelType, file, filename, maxstates = None):
+    """Analyses the model in the file. LSTSs and parallel compositions
+    of LSTSs are analysed on integers, other model types with
+    analyseModel."""
+    if modelType == 'lstsmodel':
+        result, complete = analyseLsts(lsts.reader(file), maxstates)
+    elif modelType == 'parallellstsmodel':
+        model = loadModel(modelType, file)
+        result, complete = analyseParallelLstsModel(model, maxstates)
+    else:
+        return analyseModel(loadModel(modelType, file))
+    if not complete:
+        print >>sys.stderr, "%s: Warning. More than %s states in '%s', the numbers are lower bounds." % (os.path.basename(sys.argv[0]), maxstates, filename)
+    return result
+
 def analyseModels(models, commons = COMMONS_MULTITARGET):
     modelresults = []
     for model in models:
@@ -183,6 +429,14 @@ def readArgs():
     parser.add_option("-f", "--format", action="store", type="str",
                       help="Format of the model file")
 
+    parser.add_option("-e", "--exact", action="store", type="str",
+                      metavar="RULESFILE",
+                      help="Compute the exact numbers of the parallel composition defined in RULESFILE")
+
+    parser.add_option("-m", "--max-states", action="store", type="int",
+                      dest="maxstates", metavar="N",
+                      help="Explore at most N states of a model. The numbers of a model that has more states are lower bounds")
+
     options, args = parser.parse_args(sys.argv[1:])
 
     if len(args) > 0 and args[0] in ["multi","single"]:
@@ -227,16 +481,15 @@ def main():
             print >>sys.stderr, "%s: Error. Unknown model type. Specify model type using '-f'" % os.path.basename(sys.argv[0])
             sys.exit(1)
         else:
-            model = None
             if filename == "-":
                 file = sys.stdin
             else:
                 file = open(filename)
             try:
-                model = loadModel(modelType,file)
+                models.append(analyseFile(modelType, file, filename,
+                                          options.maxstates))
             finally:
                 file.close()
-            models.append(model)
 
     results = analyseModels(models, commons)
 
@@ -248,6 +501,16 @@ def main():
     printresult('Estimated total', results[1])
     print
 
+    if options.exact:
+        file = open(options.exact)
+        try:
+            exact = analyseFile('parallellstsmodel', file, options.exact,
+                                options.maxstates)
+        finally:
+            file.close()
+        printresult('Exact total', exact)
+        print
+
 if __name__ == '__main__':
     try:
         main()
@@ -21,14 +21,36 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import sys,optparse,os,re,copy
+from collections import deque
 from tema.model import loadModel,getModelType
-try:
-    from hashlib import md5
-except ImportError:
-    from md5 import md5
+from tema.model.model import fingerprintOfString
 
 DEFAULT_COLORS={'default':'black','aw':'red','kw':'blue','sv':'green','ts':'purple'}
 
+# Number of lines collected before they are written to the output
+WRITE_BUFFER_LINES = 10000
+
+# The model cache is cleared after expanding this many states. The
+# expanded states are never needed again, so clearing only frees memory.
+CACHE_CLEAR_INTERVAL = 20000
+
+class BufferedLayout:
+    """Collects written lines and writes them to the layout in large
+    chunks."""
+    def __init__(self, layout, lines = WRITE_BUFFER_LINES):
+        self._layout = layout
+        self._lines = lines
+        self._buffer = []
+
+    def write(self, line):
+        self._buffer.append(line)
+        if len(self._buffer) >= self._lines:
+            self.flush()
+
+    def flush(self):
+        self._layout.write("".join(self._buffer))
+        self._buffer = []
+
 def print_header(layout, name, compact ):
     layout.write('digraph "%s" {\n' % name)
     if compact:
@@ -51,9 +73,14 @@ def get_color(label,color_scheme):
     else:
         return color_scheme['default']
 
+def state_fingerprint(state):
+    try:
+        return state.fingerprint()
+    except AttributeError:
+        return fingerprintOfString(str(state))
+
 def print_transition(layout, source, dest, label, color):
-    s = int(md5(str(source)).hexdigest(),16)
-    d = int(md5(str(dest)).hexdigest(),16)
+    """source and dest are the numbers of the states."""
     params = []
     if color:
         params.append('color="%s"' % color)
@@ -64,72 +91,136 @@ def print_transition(layout, source, dest, label, color):
     else:
         param_str = ""
     layout.write('%d -> %d %s;\n' % 
-                 (s, d, param_str ) )
+                 (source, dest, param_str ) )
 
 def print_state(layout,state,state_labels,initial_state, colored):
+    """state is the number of the state."""
     if initial_state:
         shape = "oval"
     else:
         shape = "box"
-    s = int(md5(str(state)).hexdigest(),16)
     layout.write('%d [label="%s",shape=%s];\n' %
-                 ( s, "\\n".join(state_labels), shape ))
+                 ( state, "\\n".join(state_labels), shape ))
+
 def print_footer(layout):
     layout.write('}\n')
 
-def visualise( model, layout, stateprops = True, actions = True , name = "TEMA-Model", compact = False, colored = False, color_scheme = None):
+def visualise( model, layout, stateprops = True, actions = True , name = "TEMA-Model", compact = False, colored = False, color_scheme = None, max_states = None, max_depth = None, component = None):
     """
     Visualize model using graphviz dot-notation
+
+    The model is explored breadth first. States are numbered in the
+    order they are found and recognized by their fingerprints, and the
+    output is written while exploring.
+
+    If max_states is given, at most that many states are expanded. If
+    max_depth is given, only the states at most that many transitions
+    away from the initial state are expanded. The unexpanded states
+    where the exploration stopped are drawn without out transitions.
+
+    If component is given, model must be a parallel model. Then the
+    states of its component'th component (counted from 0) are drawn
+    instead of the states of the model, and the transitions of the
+    model that change the state of the component. Each such
+    transition is drawn once.
     """
+    layout = BufferedLayout(layout)
     print_header(layout,name, compact )
 
-    states = set()
-    initial_state =  model.getInitialState()
-    stack = [initial_state]
-    state_labels = {initial_state : set(['START']) }
-    counter = 0
-    cache_clear_interval = 20000
-    while len(stack) > 0:
-        counter += 1
-        if counter > cache_clear_interval:
+    initial_state = model.getInitialState()
+    if component is None:
+        project = None
+    else:
+        try:
+            component_count = len(initial_state.getComponentStates())
+        except AttributeError:
+            raise ValueError("Component view requires a parallel model")
+        if not 0 <= component < component_count:
+            raise ValueError("No component %s, the model has %s components"
+                             % (component, component_count))
+        project = lambda state: state.getComponentStates()[component]
+
+    # fingerprint -> number of the drawn state
+    state_numbers = {}
+
+    def state_number(state, fingerprint = None, labels = ()):
+        if fingerprint is None:
+            fingerprint = state_fingerprint(state)
+        try:
+            return state_numbers[fingerprint]
+        except KeyError:
+            number = len(state_numbers)
+            state_numbers[fingerprint] = number
+            labels = list(labels)
+            if stateprops:
+                try:
+                    labels.extend(sorted([str(p) for p in state.getStateProps()]))
+                except AttributeError, e:
+                    pass
+            if labels:
+                print_state(layout,number,labels,number == 0,colored)
+            return number
+
+    if project is None:
+        # every found state is drawn, so drawn states are the visited ones
+        visited = state_numbers
+        state_number(initial_state, labels = ['START'])
+    else:
+        visited = set([state_fingerprint(initial_state)])
+        state_number(project(initial_state), labels = ['START'])
+    drawn_transitions = set()
+
+    queue = deque([(initial_state, 0)])
+    expanded = 0
+    while queue:
+        if max_states and expanded >= max_states:
+            break
+        state, depth = queue.popleft()
+        expanded += 1
+        if expanded % CACHE_CLEAR_INTERVAL == 0:
             try:
                 model.clearCache()
             except AttributeError,e:
                 pass
-            counter = 0
-        state = stack.pop()
-        if stateprops:
-            try:
-                current_props = frozenset(state.getStateProps())
-                for stateprop in current_props:
-                    if state not in state_labels:
-                        state_labels[state] = set([str(stateprop)])
-                    else:
-                        state_labels[state].add(str(stateprop))
-            except AttributeError, e:
-                pass
-        states.add(str(state))
+
+        if project is None:
+            source = state_number(state)
+        else:
+            source = state_number(project(state))
+
         for transition in state.getOutTransitions():
+            dest_state = transition.getDestState()
+            fingerprint = state_fingerprint(dest_state)
+            is_new = fingerprint not in visited
+            if project is None:
+                dest = state_number(dest_state, fingerprint)
+            else:
+                if is_new:
+                    visited.add(fingerprint)
+                dest = state_number(project(dest_state))
+            if is_new and (max_depth is None or depth < max_depth):
+                queue.append((dest_state, depth + 1))
 
-            if colored or actions:
-                current_action = transition.getAction()
-                if colored:
-                    color = get_color(str(current_action),color_scheme)
-                else:
-                    color = None
+            if actions or colored:
+                current_action = str(transition.getAction())
+            else:
+                current_action = None
+            if project is not None:
+                if source == dest or \
+                        (source, current_action, dest) in drawn_transitions:
+                    continue
+                drawn_transitions.add((source, current_action, dest))
+            if colored:
+                color = get_color(current_action,color_scheme)
             else:
                 color = None
             if not actions:
                 current_action = None
-            dest_state = transition.getDestState()
-            
-            print_transition(layout,state,dest_state,current_action,color)
-            if str(dest_state) not in states:
-                stack.append(dest_state)
-    for state in state_labels:
-        print_state(layout,state,state_labels[state],state==initial_state,colored)
+
+            print_transition(layout,source,dest,current_action,color)
 
     print_footer(layout)
+    layout.flush()
 
 def parse_color_scheme(color_scheme_str):
     param_scheme = dict([ color.split(':') for color in color_scheme_str.split(',') ])
@@ -172,6 +263,18 @@ def parse_args():
     parser.add_option( "--color-scheme", action="store", type="str",
                       default=colors_str, help="Specifies the coloring to use. Default is '%s'" % colors_str)
 
+    parser.add_option("--max-states", action="store", type="int",
+                      metavar="N",
+                      help="Expand at most N states")
+
+    parser.add_option("--max-depth", action="store", type="int",
+                      metavar="N",
+                      help="Expand only states at most N transitions away from the initial state")
+
+    parser.add_option("--component", action="store", type="int",
+                      metavar="N",
+                      help="Draw the states of the Nth component (counted from 0) of a composed model and the transitions that change them")
+
     options, args = parser.parse_args(sys.argv[1:])
 
     if len(args) == 0:
@@ -214,7 +317,7 @@ def main():
                 dot_object=open(dot_file,'w')
 
             m=loadModel(model_type, file_object)
-            visualise(m,dot_object,not options.no_stateprops, not options.no_actions, "TEMA-Model %s" % model_file, options.compact, options.colored, color_scheme )
+            visualise(m,dot_object,not options.no_stateprops, not options.no_actions, "TEMA-Model %s" % model_file, options.compact, options.colored, color_scheme, options.max_states, options.max_depth, options.component )
         except Exception,  e:
             print >>sys.stderr,e
             sys.exit(1)
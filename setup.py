@@ -119,6 +119,9 @@ def get_scripts():
     scripts.append("TemaLib/tema/filter/filterexpand.py")
     scripts.append("TemaLib/tema/variablemodels/variablemodelcreator.py")
     scripts.append("TemaLib/tema/testengine/testengine.py")
+    scripts.append("TemaLib/tema/testengine/bench.py")
+    scripts.append("TemaLib/tema/testengine/enginedaemon.py")
+    scripts.append("TemaLib/tema/testengine/testfarm.py")
     
     return scripts
 